@@ -0,0 +1,88 @@
+"""Compare the cost of building cache keys
+
+Run with `python benchmarks/key_builder.py`.
+
+"""
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+
+from pydantic import BaseModel
+
+from fastapi_cache.key_builder import CanonicalKeyBuilder, default_key_builder
+
+
+class Session:
+    """Stand-in for a dependency, such as a database session"""
+
+
+class User(BaseModel):
+    id: int
+    name: str
+    email: str
+    roles: List[str]
+    settings: Dict[str, str]
+
+
+def endpoint(
+    sku: str,
+    page: int = 1,
+    ids: Any = None,
+    filters: Any = None,
+    db: Any = None,
+    user: Any = None,
+) -> None:
+    ...
+
+
+USER = User(
+    id=1,
+    name="user",
+    email="user@example.com",
+    roles=[f"role{i}" for i in range(20)],
+    settings={f"key{i}": f"value{i}" for i in range(20)},
+)
+# FastAPI calls endpoints with keyword arguments only
+CASES: Dict[str, Tuple[Tuple[Any, ...], Dict[str, Any]]] = {
+    "small": ((), {"sku": "a1", "page": 2}),
+    "dependencies": ((), {"sku": "a1", "page": 2, "db": Session(), "user": USER}),
+    "large list": ((), {"sku": "a1", "ids": list(range(1000))}),
+    "nested dict": (
+        (),
+        {
+            "sku": "a1",
+            "filters": {
+                f"field{i}": [f"value{j}" for j in range(5)] for i in range(50)
+            },
+        },
+    ),
+}
+
+BUILDERS: Dict[str, Callable[..., str]] = {
+    "default_key_builder": default_key_builder,
+    "CanonicalKeyBuilder": CanonicalKeyBuilder(),
+}
+
+
+def main() -> None:
+    header = f"{'case':<14}" + "".join(f"{name:>22}" for name in BUILDERS)
+    print(header)
+    print("-" * len(header))
+    for case, (args, kwargs) in CASES.items():
+        timings: List[str] = []
+        for builder in BUILDERS.values():
+
+            def build(
+                builder: Callable[..., str] = builder,
+                args: Tuple[Any, ...] = args,
+                kwargs: Dict[str, Any] = kwargs,
+            ) -> None:
+                builder(endpoint, "ns", args=args, kwargs=kwargs)
+
+            number, _ = timeit.Timer(build).autorange()
+            best = min(timeit.repeat(build, number=number, repeat=5)) / number
+            timings.append(f"{best * 1e6:>19.2f} µs")
+        print(f"{case:<14}" + "".join(timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""In-process stand-ins for Redis, memcached and DynamoDB servers
+
+Each server speaks (just enough of) the real wire protocol on a local port, so
+the backends are benchmarked with their actual client libraries, including
+connection handling and (de)serialization, without any external services.
+
+Usage:
+    >> async with FakeRedisServer() as server:
+    >>     redis = Redis(port=server.port)
+
+"""
+import asyncio
+import fnmatch
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple, TypeVar
+
+_S = TypeVar("_S", bound="_Server")
+
+
+class _Server:
+    """An asyncio TCP server on a free local port"""
+
+    def __init__(self) -> None:
+        self.port = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self: _S) -> _S:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            await self.handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        raise NotImplementedError
+
+
+class _Store:
+    """Values with expiry times, checked on access"""
+
+    def __init__(self) -> None:
+        self.values: Dict[bytes, Any] = {}
+        self.expiry: Dict[bytes, float] = {}
+
+    def get(self, key: bytes) -> Any:
+        deadline = self.expiry.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.delete(key)
+        return self.values.get(key)
+
+    def set(self, key: bytes, value: Any, expire: Optional[float] = None) -> None:
+        self.values[key] = value
+        if expire:
+            self.expiry[key] = time.time() + expire
+        else:
+            self.expiry.pop(key, None)
+
+    def delete(self, key: bytes) -> bool:
+        self.expiry.pop(key, None)
+        return self.values.pop(key, None) is not None
+
+    def ttl(self, key: bytes) -> int:
+        if self.get(key) is None:
+            return -2
+        deadline = self.expiry.get(key)
+        return -1 if deadline is None else int(deadline - time.time() + 0.5)
+
+
+class _RedisError(Exception):
+    pass
+
+
+class FakeRedisServer(_Server):
+    """Redis over RESP2: strings, sets, transactions, SCAN and pub/sub"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.store = _Store()
+        self.subscribers: Dict[bytes, List[asyncio.StreamWriter]] = {}
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, _RedisError):
+            return b"-ERR %s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, (list, tuple, set)):
+            return b"*%d\r\n" % len(value) + b"".join(
+                FakeRedisServer._encode(v) for v in value
+            )
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> List[bytes]:
+        line = await reader.readuntil(b"\r\n")
+        if not line.startswith(b"*"):
+            return line.split()
+        command = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readuntil(b"\r\n"))[1:])
+            command.append((await reader.readexactly(length + 2))[:-2])
+        return command
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        queued: Optional[List[List[bytes]]] = None
+        reply: Any
+        while True:
+            command = await self._read_command(reader)
+            name = command[0].upper()
+            if name == b"MULTI":
+                queued, reply = [], "OK"
+            elif name == b"EXEC":
+                reply = [self._run(c, writer) for c in queued or []]
+                queued = None
+            elif queued is not None:
+                queued.append(command)
+                reply = "QUEUED"
+            else:
+                reply = self._run(command, writer)
+            writer.write(self._encode(reply))
+            await writer.drain()
+
+    def _set(self, key: bytes) -> Set[bytes]:
+        members = self.store.get(key)
+        if members is None:
+            members = set()
+            self.store.set(key, members)
+        return members  # type: ignore[no-any-return]
+
+    def _run(self, command: List[bytes], writer: asyncio.StreamWriter) -> Any:
+        name, args = command[0].upper().decode(), command[1:]
+        store = self.store
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return store.get(args[0])
+        if name == "SET":
+            options = [a.upper() for a in args[2:]]
+            expire = int(args[3 + options.index(b"EX")]) if b"EX" in options else None
+            store.set(args[0], args[1], expire)
+            return "OK"
+        if name == "MGET":
+            return [store.get(key) for key in args]
+        if name == "GETRANGE":
+            end = int(args[2])
+            return (store.get(args[0]) or b"")[int(args[1]) : None if end == -1 else end + 1]
+        if name in ("DEL", "UNLINK"):
+            return sum(store.delete(key) for key in args)
+        if name == "TTL":
+            return store.ttl(args[0])
+        if name == "EXPIRE":
+            value = store.get(args[0])
+            if value is None:
+                return 0
+            store.set(args[0], value, int(args[1]))
+            return 1
+        if name == "INCRBY":
+            value = int(store.get(args[0]) or 0) + int(args[1])
+            deadline = store.expiry.get(args[0])
+            store.set(args[0], str(value).encode())
+            if deadline is not None:
+                store.expiry[args[0]] = deadline
+            return value
+        if name == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+            keys = [
+                key
+                for key in list(store.values)
+                if store.get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)
+            ]
+            return [b"0", keys]
+        if name == "SADD":
+            members = self._set(args[0])
+            before = len(members)
+            members.update(args[1:])
+            return len(members) - before
+        if name == "SMEMBERS":
+            return store.get(args[0]) or set()
+        if name == "SUBSCRIBE":
+            for channel in args:
+                self.subscribers.setdefault(channel, []).append(writer)
+            return [b"subscribe", args[-1], len(args)]
+        if name == "PUBLISH":
+            receivers = [w for w in self.subscribers.get(args[0], []) if not w.is_closing()]
+            for receiver in receivers:
+                receiver.write(self._encode([b"message", args[0], args[1]]))
+            return len(receivers)
+        if name in ("CLIENT", "SELECT"):
+            return "OK"
+        return _RedisError(f"unknown command '{name}'")
+
+
+class FakeMemcachedServer(_Server):
+    """memcached over the text protocol"""
+
+    # exptimes over 30 days are unix timestamps
+    _RELATIVE_LIMIT = 60 * 60 * 24 * 30
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.store = _Store()  # key -> (value, cas unique)
+        self._cas = 0
+
+    def _expire(self, exptime: int) -> Optional[float]:
+        if exptime > self._RELATIVE_LIMIT:
+            return exptime - time.time()
+        return exptime or None
+
+    def _store(self, key: bytes, value: bytes, exptime: int) -> None:
+        self._cas += 1
+        self.store.set(key, (value, self._cas), self._expire(exptime))
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            name, *args = line.split()
+            if name in (b"get", b"gets"):
+                for key in args:
+                    entry = self.store.get(key)
+                    if entry is None:
+                        continue
+                    value, cas = entry
+                    header = b"VALUE %s 0 %d" % (key, len(value))
+                    if name == b"gets":
+                        header += b" %d" % cas
+                    writer.write(header + b"\r\n" + value + b"\r\n")
+                writer.write(b"END\r\n")
+            elif name in (b"set", b"add", b"append", b"cas"):
+                key, exptime, length = args[0], int(args[2]), int(args[3])
+                value = (await reader.readexactly(length + 2))[:-2]
+                writer.write(self._storage(name, key, value, exptime, args[4:]) + b"\r\n")
+            elif name == b"delete":
+                writer.write(b"DELETED\r\n" if self.store.delete(args[0]) else b"NOT_FOUND\r\n")
+            elif name == b"incr":
+                entry = self.store.get(args[0])
+                if entry is None:
+                    writer.write(b"NOT_FOUND\r\n")
+                else:
+                    value = str(int(entry[0]) + int(args[1])).encode()
+                    deadline = self.store.expiry.get(args[0])
+                    self._store(args[0], value, 0)
+                    if deadline is not None:
+                        self.store.expiry[args[0]] = deadline
+                    writer.write(value + b"\r\n")
+            elif name == b"version":
+                writer.write(b"VERSION 1.6.0-fake\r\n")
+            else:
+                writer.write(b"ERROR\r\n")
+            await writer.drain()
+
+    def _storage(
+        self, name: bytes, key: bytes, value: bytes, exptime: int, extra: List[bytes]
+    ) -> bytes:
+        entry = self.store.get(key)
+        if name == b"add" and entry is not None:
+            return b"NOT_STORED"
+        if name == b"append":
+            if entry is None:
+                return b"NOT_STORED"
+            value = entry[0] + value
+            exptime = 0
+        if name == b"cas":
+            if entry is None:
+                return b"NOT_FOUND"
+            if entry[1] != int(extra[0]):
+                return b"EXISTS"
+        self._store(key, value, exptime)
+        return b"STORED"
+
+
+class FakeDynamoDBServer(_Server):
+    """DynamoDB's JSON over HTTP API, for a table with a string hash key `key`
+
+    Supports the operations used by DynamoBackend; expired items are left to
+    the backend to filter out, like DynamoDB does.
+
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.items: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            headers = dict(
+                line.split(b":", 1)
+                for line in request.split(b"\r\n")[1:]
+                if b":" in line
+            )
+            normalized = {k.strip().lower(): v.strip() for k, v in headers.items()}
+            length = int(normalized.get(b"content-length", b"0"))
+            body = json.loads(await reader.readexactly(length)) if length else {}
+            target = normalized.get(b"x-amz-target", b"").decode()
+            status, result = self._dispatch(target.rpartition(".")[2], body)
+            payload = json.dumps(result).encode()
+            writer.write(
+                b"HTTP/1.1 %d %s\r\n" % (status, b"OK" if status == 200 else b"Bad Request")
+                + b"Content-Type: application/x-amz-json-1.0\r\n"
+                + b"x-amzn-RequestId: %s\r\n" % uuid.uuid4().hex.encode()
+                + b"Content-Length: %d\r\n\r\n" % len(payload)
+                + payload
+            )
+            await writer.drain()
+
+    def _dispatch(self, operation: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        handler = getattr(self, f"_{operation}", None)
+        if handler is None:
+            return 400, {
+                "__type": "com.amazon.coral.service#UnknownOperationException",
+                "message": operation,
+            }
+        return 200, handler(body)
+
+    @staticmethod
+    def _key(key: Dict[str, Any]) -> str:
+        return key["key"]["S"]  # type: ignore[no-any-return]
+
+    def _GetItem(self, body: Dict[str, Any]) -> Any:
+        item = self.items.get(self._key(body["Key"]))
+        return {"Item": item} if item is not None else {}
+
+    def _PutItem(self, body: Dict[str, Any]) -> Any:
+        self.items[self._key(body["Item"])] = body["Item"]
+        return {}
+
+    def _DeleteItem(self, body: Dict[str, Any]) -> Any:
+        item = self.items.pop(self._key(body["Key"]), None)
+        if item is not None and body.get("ReturnValues") == "ALL_OLD":
+            return {"Attributes": item}
+        return {}
+
+    def _UpdateItem(self, body: Dict[str, Any]) -> Any:
+        # only "ADD #name :value", for numbers and string sets
+        _, name, value = body["UpdateExpression"].split()
+        name = body["ExpressionAttributeNames"][name]
+        value = body["ExpressionAttributeValues"][value]
+        key = self._key(body["Key"])
+        item = self.items.setdefault(key, {"key": {"S": key}})
+        if "N" in value:
+            current = int(item.get(name, {}).get("N", 0))
+            item[name] = {"N": str(current + int(value["N"]))}
+        else:
+            members = set(item.get(name, {}).get("SS", []))
+            item[name] = {"SS": sorted(members.union(value["SS"]))}
+        if body.get("ReturnValues") == "UPDATED_NEW":
+            return {"Attributes": {name: item[name]}}
+        return {}
+
+    def _BatchGetItem(self, body: Dict[str, Any]) -> Any:
+        responses = {
+            table: [
+                self.items[self._key(key)]
+                for key in request["Keys"]
+                if self._key(key) in self.items
+            ]
+            for table, request in body["RequestItems"].items()
+        }
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def _BatchWriteItem(self, body: Dict[str, Any]) -> Any:
+        for requests in body["RequestItems"].values():
+            for request in requests:
+                if "PutRequest" in request:
+                    self._PutItem(request["PutRequest"])
+                else:
+                    self.items.pop(self._key(request["DeleteRequest"]["Key"]), None)
+        return {"UnprocessedItems": {}}
+
@@ -0,0 +1,377 @@
+"""Latency and throughput of the examples app, per backend, coder and payload size
+
+Runs the in-memory example app in-process, with an extra endpoint that returns a
+payload of a given size, and measures cache misses, hits and 304 revalidations
+(requests with a matching If-None-Match header). Redis, memcached and DynamoDB
+are served by the in-process stand-ins from benchmarks.servers.
+
+Usage:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --backends inmemory redis --sizes 100 10000
+    python -m benchmarks.suite --output new.json --compare results.json
+
+The JSON output has one result per backend, coder, size and scenario, with the
+p50 and p99 latency in milliseconds and the requests per second, and can be
+compared across commits with --compare.
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.servers import (
+    FakeDynamoDBServer,
+    FakeMemcachedServer,
+    FakeRedisServer,
+)
+from examples.in_memory.main import app
+from fastapi_cache import Backend, FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.coder import Coder, JsonCoder, PickleCoder
+from fastapi_cache.decorator import cache
+
+SIZES = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+SCENARIOS = ["miss", "hit", "revalidate"]
+CODERS: Dict[str, Type[Coder]] = {"json": JsonCoder, "pickle": PickleCoder}
+# keep the number of payload bytes sent per scenario within bounds
+BYTES_PER_SCENARIO = 100_000_000
+
+
+@asynccontextmanager
+async def inmemory_backend() -> AsyncIterator[Backend]:
+    yield InMemoryBackend()
+
+
+@asynccontextmanager
+async def redis_backend() -> AsyncIterator[Backend]:
+    from redis.asyncio.client import Redis
+
+    from fastapi_cache.backends.redis import RedisBackend
+
+    async with FakeRedisServer() as server:
+        redis: "Redis[bytes]" = Redis(port=server.port)
+        yield RedisBackend(redis)
+        await redis.close()
+
+
+@asynccontextmanager
+async def tiered_backend() -> AsyncIterator[Backend]:
+    from redis.asyncio.client import Redis
+
+    from fastapi_cache.backends.redis import RedisBackend
+    from fastapi_cache.backends.tiered import TieredBackend
+
+    async with FakeRedisServer() as server:
+        redis: "Redis[bytes]" = Redis(port=server.port)
+        backend = TieredBackend(RedisBackend(redis), redis=redis)
+        await backend.init()
+        yield backend
+        await backend.close()
+        await redis.close()
+
+
+@asynccontextmanager
+async def write_behind_backend() -> AsyncIterator[Backend]:
+    from redis.asyncio.client import Redis
+
+    from fastapi_cache.backends.redis import RedisBackend
+    from fastapi_cache.backends.write_behind import WriteBehindBackend
+
+    async with FakeRedisServer() as server:
+        redis: "Redis[bytes]" = Redis(port=server.port)
+        backend = WriteBehindBackend(RedisBackend(redis))
+        yield backend
+        await backend.close()
+        await redis.close()
+
+
+@asynccontextmanager
+async def sharded_backend() -> AsyncIterator[Backend]:
+    from redis.asyncio.client import Redis
+
+    from fastapi_cache.backends.redis import RedisBackend
+    from fastapi_cache.backends.sharded import ShardedBackend
+
+    async with FakeRedisServer() as first, FakeRedisServer() as second:
+        clients: "List[Redis[bytes]]" = [Redis(port=first.port), Redis(port=second.port)]
+        yield ShardedBackend(
+            {f"redis-{i}": RedisBackend(redis) for i, redis in enumerate(clients)}
+        )
+        for redis in clients:
+            await redis.close()
+
+
+@asynccontextmanager
+async def sqlite_backend() -> AsyncIterator[Backend]:
+    import tempfile
+
+    from fastapi_cache.backends.sqlite import SQLiteBackend
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteBackend(os.path.join(directory, "cache.db"))
+        yield backend
+        await backend.close()
+
+
+@asynccontextmanager
+async def shared_memory_backend() -> AsyncIterator[Backend]:
+    import tempfile
+
+    from fastapi_cache.backends.shared_memory import SharedMemoryBackend
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SharedMemoryBackend(os.path.join(directory, "cache"))
+        yield backend
+        backend.close()
+
+
+@asynccontextmanager
+async def memcached_backend() -> AsyncIterator[Backend]:
+    from aiomcache import Client
+
+    from fastapi_cache.backends.memcached import MemcachedBackend
+
+    async with FakeMemcachedServer() as server:
+        client = Client("127.0.0.1", server.port)
+        yield MemcachedBackend(client)
+        await client.close()
+
+
+@asynccontextmanager
+async def dynamodb_backend() -> AsyncIterator[Backend]:
+    from fastapi_cache.backends.dynamodb import DynamoBackend
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    async with FakeDynamoDBServer() as server:
+        backend = DynamoBackend(
+            table_name="cache", region="us-east-1", endpoint_url=server.endpoint_url
+        )
+        await backend.init()
+        yield backend
+        await backend.client.__aexit__(None, None, None)
+
+
+BACKENDS: Dict[str, Callable[[], Any]] = {
+    "inmemory": inmemory_backend,
+    "redis": redis_backend,
+    "tiered": tiered_backend,
+    "write-behind": write_behind_backend,
+    "sharded": sharded_backend,
+    "sqlite": sqlite_backend,
+    "shared-memory": shared_memory_backend,
+    "memcached": memcached_backend,
+    "dynamodb": dynamodb_backend,
+}
+# largest values the real services accept
+MAX_SIZES: Dict[str, int] = {"memcached": 1_000_000, "dynamodb": 400_000}
+
+_payloads: Dict[int, Dict[str, Any]] = {}
+
+
+def payload(size: int) -> Dict[str, Any]:
+    """A JSON document of about size bytes, made of ~100 byte items"""
+    if size not in _payloads:
+        _payloads[size] = {
+            "items": [
+                {"id": i, "name": f"item {i:08d}", "description": "x" * 60}
+                for i in range(max(1, size // 100))
+            ]
+        }
+    return _payloads[size]
+
+
+def add_benchmark_route(app: FastAPI) -> None:
+    if any(getattr(route, "path", None) == "/benchmark/{size}" for route in app.routes):
+        return
+
+    @app.get("/benchmark/{size}")
+    @cache(namespace="benchmark", expire=3600)
+    async def benchmark(size: int, n: int = 0) -> Dict[str, Any]:
+        return payload(size)
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1e3, 4),
+        "p99_ms": round(p99 * 1e3, 4),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    requests: List[Tuple[str, Dict[str, str]]],
+    status: str,
+    concurrency: int,
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    pending = iter(requests)
+
+    async def worker() -> None:
+        for url, headers in pending:
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            actual = (
+                "304"
+                if response.status_code == 304
+                else response.headers.get("X-FastAPI-Cache", "")
+            )
+            if actual != status:
+                raise RuntimeError(f"{url}: expected {status}, got {actual}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def run(
+    backends: Sequence[str] = tuple(BACKENDS),
+    coders: Sequence[str] = tuple(CODERS),
+    sizes: Sequence[int] = tuple(SIZES),
+    requests: int = 200,
+    concurrency: int = 1,
+    log: Callable[[str], None] = lambda line: None,
+) -> List[Dict[str, Any]]:
+    add_benchmark_route(app)
+    results: List[Dict[str, Any]] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for backend_name in backends:
+            async with BACKENDS[backend_name]() as backend:
+                for coder_name in coders:
+                    FastAPICache.reset()
+                    FastAPICache.init(backend, prefix=coder_name, coder=CODERS[coder_name])
+                    for size in sizes:
+                        if size > MAX_SIZES.get(backend_name, size):
+                            log(f"{backend_name:<14} {coder_name:<7} {size:>9} B  skipped")
+                            continue
+                        count = max(5, min(requests, BYTES_PER_SCENARIO // size))
+                        url = f"/benchmark/{size}"
+                        misses: List[Tuple[str, Dict[str, str]]] = [
+                            (f"{url}?n={i}", {}) for i in range(1, count + 1)
+                        ]
+                        miss = await measure(client, misses, "MISS", concurrency)
+                        etag = (await client.get(url)).headers["ETag"]
+                        hit = await measure(client, [(url, {})] * count, "HIT", concurrency)
+                        revalidate = await measure(
+                            client, [(url, {"If-None-Match": etag})] * count, "304", concurrency
+                        )
+                        for scenario, summary in zip(SCENARIOS, (miss, hit, revalidate)):
+                            result = {
+                                "backend": backend_name,
+                                "coder": coder_name,
+                                "size": size,
+                                "scenario": scenario,
+                                "requests": count,
+                                **summary,
+                            }
+                            results.append(result)
+                            log(format_result(result))
+    FastAPICache.reset()
+    return results
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['backend']:<14} {result['coder']:<7} {result['size']:>9} B  "
+        f"{result['scenario']:<10} p50 {result['p50_ms']:>9.3f} ms  "
+        f"p99 {result['p99_ms']:>9.3f} ms  {result['rps']:>9.1f} req/s"
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> List[str]:
+    """Lines comparing results to a baseline, for the results in both"""
+
+    def key(result: Dict[str, Any]) -> Tuple[Any, ...]:
+        return result["backend"], result["coder"], result["size"], result["scenario"]
+
+    previous = {key(result): result for result in baseline}
+    lines = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        changes = "  ".join(
+            f"{metric} {(result[metric] / before[metric] - 1) * 100:>+7.1f}%"
+            for metric in ("p50_ms", "p99_ms", "rps")
+            if before[metric]
+        )
+        backend, coder, size, scenario = key(result)
+        lines.append(f"{backend:<14} {coder:<7} {size:>9} B  {scenario:<10} {changes}")
+    return lines
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S603,S607
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--coders", nargs="+", choices=list(CODERS), default=list(CODERS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results in this JSON file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(
+        run(args.backends, args.coders, args.sizes, args.requests, args.concurrency, print)
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "concurrency": args.concurrency,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {baseline.get('commit') or args.compare}:")
+        for line in compare(results, baseline["results"]):
+            print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
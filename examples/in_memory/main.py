@@ -1,15 +1,17 @@
 # pyright: reportGeneralTypeIssues=false
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import pendulum
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.inmemory import InMemoryBackend
-from fastapi_cache.decorator import cache
+from fastapi_cache.coder import JsonCoder, compressed
+from fastapi_cache.decorator import cache, cache_many
 from pydantic import BaseModel
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
+from typing_extensions import Annotated
 
 app = FastAPI()
 
@@ -97,6 +99,26 @@ async def pydantic_instance() -> Item:
     return Item(name="Something", description="An instance of a Pydantic model", price=10.5)
 
 
+# cache the rendered response, hits are served without decoding or validation
+@app.get("/raw_response")
+@cache(namespace="test", expire=5, raw_response=True)
+async def raw_response() -> Item:
+    return Item(name="Something", description="Served from raw bytes", price=10.5)
+
+
+# store the rendered response gzip compressed, and serve it as-is to clients
+# that accept gzip
+@app.get("/compressed_response")
+@cache(
+    namespace="test",
+    expire=5,
+    raw_response=True,
+    coder=compressed(JsonCoder, "gzip", threshold=100),
+)
+async def compressed_response() -> List[Item]:
+    return [Item(name=f"Item {i}", price=i) for i in range(100)]
+
+
 put_ret = 0
 
 
@@ -119,6 +141,32 @@ def namespaced_injection(
     }
 
 
+fetched_items: List[int] = []
+
+
+# cache each item separately; only ids that are not cached yet are fetched
+@app.get("/items")
+@cache_many("ids", namespace="items", expire=5)
+async def get_items(ids: Annotated[List[int], Query()]) -> Dict[int, str]:
+    fetched_items.extend(ids)
+    return {item_id: f"item {item_id}" for item_id in ids}
+
+
+products = {"a1": "Apple", "b2": "Banana"}
+
+
+@app.get("/products/{sku}")
+@cache(namespace="products", expire=60, tags=["product:{sku}"])
+async def get_product(sku: str):
+    return {"sku": sku, "name": products[sku]}
+
+
+@app.put("/products/{sku}")
+async def update_product(sku: str, name: str):
+    products[sku] = name
+    return await FastAPICache.invalidate_tags(f"product:{sku}")
+
+
 @app.on_event("startup")
 async def startup():
     FastAPICache.init(InMemoryBackend())
@@ -1,4 +1,5 @@
-from typing import ClassVar, Optional, Type
+import time
+from typing import ClassVar, Dict, List, Optional, Sequence, Tuple, Type
 
 # Because this project supports python 3.7 and up, Pyright treats importlib as
 # an external library and so needs to be told to ignore the type issues it sees.
@@ -9,21 +10,36 @@ except ImportError:
     # Python 3.7
     from importlib_metadata import version  # type: ignore
 
+from fastapi_cache import chunks
+from fastapi_cache.circuit_breaker import CircuitBreaker
 from fastapi_cache.coder import Coder, JsonCoder
-from fastapi_cache.key_builder import default_key_builder
+from fastapi_cache.key_builder import CanonicalKeyBuilder, default_key_builder
+from fastapi_cache.metrics import MetricsSink, PrometheusMetrics
+from fastapi_cache.profiling import ProfilingHook
 from fastapi_cache.types import Backend, KeyBuilder
 
 __version__ = version("fastapi-cache2")  # pyright: ignore[reportUnknownVariableType]
 __all__ = [
     "Backend",
+    "CanonicalKeyBuilder",
+    "CircuitBreaker",
     "Coder",
     "FastAPICache",
     "JsonCoder",
     "KeyBuilder",
+    "MetricsSink",
+    "PrometheusMetrics",
     "default_key_builder",
 ]
 
 
+# Namespace generations are stored outside of the prefix, so clearing keys by
+# prefix doesn't reset them.
+GENERATION_PREFIX = "__fastapi_cache_generation__"
+# Tag indexes are stored within the prefix, next to the namespaces.
+TAG_NAMESPACE = "__tags__"
+
+
 class FastAPICache:
     _backend: ClassVar[Optional[Backend]] = None
     _prefix: ClassVar[Optional[str]] = None
@@ -33,6 +49,15 @@ class FastAPICache:
     _key_builder: ClassVar[Optional[KeyBuilder]] = None
     _cache_status_header: ClassVar[Optional[str]] = None
     _enable: ClassVar[bool] = True
+    _versioned_namespaces: ClassVar[bool] = False
+    _generation_cache_ttl: ClassVar[float] = 0
+    _metrics: ClassVar[Optional[MetricsSink]] = None
+    _profiling_hooks: ClassVar[Tuple[ProfilingHook, ...]] = ()
+    _circuit_breaker: ClassVar[Optional[CircuitBreaker]] = None
+    # namespace -> (generation, monotonic time it was fetched)
+    _generations: ClassVar[Dict[str, Tuple[int, float]]] = {}
+    # incremented by init and reset, to invalidate settings resolved before
+    _config_version: ClassVar[int] = 0
 
     @classmethod
     def init(
@@ -44,6 +69,11 @@ class FastAPICache:
         key_builder: KeyBuilder = default_key_builder,
         cache_status_header: str = "X-FastAPI-Cache",
         enable: bool = True,
+        versioned_namespaces: bool = False,
+        generation_cache_ttl: float = 0,
+        metrics: Optional[MetricsSink] = None,
+        profiling_hooks: Sequence[ProfilingHook] = (),
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ) -> None:
         if cls._init:
             return
@@ -55,6 +85,13 @@ class FastAPICache:
         cls._key_builder = key_builder
         cls._cache_status_header = cache_status_header
         cls._enable = enable
+        cls._versioned_namespaces = versioned_namespaces
+        cls._generation_cache_ttl = generation_cache_ttl
+        cls._metrics = metrics
+        cls._profiling_hooks = tuple(profiling_hooks)
+        cls._circuit_breaker = circuit_breaker
+        cls._generations = {}
+        cls._config_version += 1
 
     @classmethod
     def reset(cls) -> None:
@@ -66,6 +103,13 @@ class FastAPICache:
         cls._key_builder = None
         cls._cache_status_header = None
         cls._enable = True
+        cls._versioned_namespaces = False
+        cls._generation_cache_ttl = 0
+        cls._metrics = None
+        cls._profiling_hooks = ()
+        cls._circuit_breaker = None
+        cls._generations = {}
+        cls._config_version += 1
 
     @classmethod
     def get_backend(cls) -> Backend:
@@ -100,12 +144,119 @@ class FastAPICache:
     def get_enable(cls) -> bool:
         return cls._enable
 
+    @classmethod
+    def get_versioned_namespaces(cls) -> bool:
+        return cls._versioned_namespaces
+
+    @classmethod
+    def get_metrics(cls) -> Optional[MetricsSink]:
+        return cls._metrics
+
+    @classmethod
+    def get_profiling_hooks(cls) -> Tuple[ProfilingHook, ...]:
+        return cls._profiling_hooks
+
+    @classmethod
+    def get_circuit_breaker(cls) -> Optional[CircuitBreaker]:
+        return cls._circuit_breaker
+
+    @classmethod
+    def get_config_version(cls) -> int:
+        """A number that changes whenever the configuration changes"""
+        return cls._config_version
+
+    @classmethod
+    async def _get_generations(cls, names: List[str]) -> List[int]:
+        backend = cls.get_backend()
+        now = time.monotonic()
+        generations: Dict[str, int] = {}
+        for name in names:
+            cached = cls._generations.get(name)
+            if cached is not None and now - cached[1] < cls._generation_cache_ttl:
+                generations[name] = cached[0]
+        missing = [name for name in names if name not in generations]
+        if missing:
+            values = await backend.get_many(
+                [f"{GENERATION_PREFIX}:{name}" for name in missing]
+            )
+            for name, value in zip(missing, values):
+                if value is None:
+                    generation = await cls._seed_generation(name)
+                else:
+                    generation = int(value)
+                generations[name] = generation
+                cls._generations[name] = (generation, now)
+        return [generations[name] for name in names]
+
+    @classmethod
+    async def _seed_generation(cls, name: str) -> int:
+        """Start a missing (new, or evicted) generation counter
+
+        The counter starts at the current time in microseconds, rather than at
+        0, so that a counter that was evicted doesn't return to a generation
+        that was cleared before. If another worker seeds it at the same time,
+        both seeds are added up, which is an unused generation as well.
+
+        """
+        seed = int(time.time() * 1_000_000)
+        return await cls.get_backend().incr(f"{GENERATION_PREFIX}:{name}", seed)
+
+    @classmethod
+    async def get_namespace(cls, namespace: str = "") -> str:
+        """The namespace to build cache keys in
+
+        With versioned namespaces, this includes the current generations of the
+        prefix and the namespace, so that clearing them only has to increment
+        their generation.
+
+        """
+        prefix = cls.get_prefix()
+        full_namespace = f"{prefix}:{namespace}"
+        if not cls._versioned_namespaces:
+            return full_namespace
+        names = [prefix, full_namespace] if namespace else [prefix]
+        generations = await cls._get_generations(names)
+        return f"{full_namespace}:v{'.'.join(map(str, generations))}"
+
+    @classmethod
+    def get_tag_key(cls, tag: str) -> str:
+        """The backend key of the index of entries carrying a tag"""
+        return f"{cls.get_prefix()}:{TAG_NAMESPACE}:{tag}"
+
+    @classmethod
+    async def invalidate_tags(cls, *tags: str) -> int:
+        """Remove all entries carrying any of the given tags
+
+        Returns the number of removed entries.
+
+        """
+        return await cls.get_backend().invalidate_tags(
+            [cls.get_tag_key(tag) for tag in tags]
+        )
+
     @classmethod
     async def clear(
         cls, namespace: Optional[str] = None, key: Optional[str] = None
     ) -> int:
+        """Clear a namespace (or the whole prefix), or a single key
+
+        Returns the number of removed keys. With versioned namespaces, clearing a
+        namespace increments its generation instead, and the existing entries
+        are left to expire; 0 is returned in that case.
+
+        """
         assert (  # noqa: S101
             cls._backend and cls._prefix is not None
         ), "You must call init first!"
         namespace = cls._prefix + (":" + namespace if namespace else "")
+        if cls._versioned_namespaces and not key:
+            generation = await cls._backend.incr(f"{GENERATION_PREFIX}:{namespace}")
+            if generation == 1:
+                # the counter was missing, seeded counters are much larger
+                generation = await cls._seed_generation(namespace)
+            cls._generations[namespace] = (generation, time.monotonic())
+            return 0
+        if key:
+            # with the chunks of a large value
+            return await chunks.delete(cls._backend, key)
         return await cls._backend.clear(namespace, key)
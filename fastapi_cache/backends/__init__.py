@@ -1,7 +1,7 @@
-from fastapi_cache.backends import inmemory
+from fastapi_cache.backends import inmemory, sharded, sqlite, tiered
 from fastapi_cache.types import Backend
 
-__all__ = ["Backend", "inmemory"]
+__all__ = ["Backend", "inmemory", "sharded", "sqlite", "tiered"]
 
 # import each backend in turn and add to __all__. This syntax
 # is explicitly supported by type checkers, while more dynamic
@@ -26,3 +26,10 @@ except ImportError:
     pass
 else:
     __all__ += ["redis"]
+
+try:
+    from fastapi_cache.backends import shared_memory
+except ImportError:
+    pass
+else:
+    __all__ += ["shared_memory"]
@@ -1,5 +1,16 @@
+import asyncio
 import datetime
-from typing import TYPE_CHECKING, Optional, Tuple
+import random
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from aiobotocore.client import AioBaseClient
 from aiobotocore.session import AioSession, get_session
@@ -11,6 +22,22 @@ if TYPE_CHECKING:
 else:
     DynamoDBClient = AioBaseClient
 
+# seconds to wait before resubmitting unprocessed items, doubled on every
+# attempt up to the maximum
+_BACKOFF_BASE = 0.05
+_BACKOFF_MAX = 5.0
+
+
+async def _backoff(attempt: int) -> None:
+    """Wait before a retry, with capped exponential backoff and full jitter
+
+    DynamoDB returns unprocessed items when it throttles a batch; retrying
+    them right away only adds to the load.
+
+    """
+    delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2**attempt)
+    await asyncio.sleep(random.uniform(0, delay))  # noqa: S311
+
 
 class DynamoBackend(Backend):
     """
@@ -22,7 +49,7 @@ class DynamoBackend(Backend):
     instant so don't be alarmed when they linger around for a bit.
 
     As with all AWS clients, credentials will be taken from the environment. Check the AWS SDK
-    for more information.
+    for more information. Pass `endpoint_url` to use e.g. DynamoDB Local instead of AWS.
 
     Usage:
         >> dynamodb = DynamoBackend(table_name="your-cache", region="eu-west-1")
@@ -34,25 +61,41 @@ class DynamoBackend(Backend):
     session: AioSession
     table_name: str
     region: Optional[str]
-
-    def __init__(self, table_name: str, region: Optional[str] = None) -> None:
+    endpoint_url: Optional[str]
+
+    def __init__(
+        self,
+        table_name: str,
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+    ) -> None:
         self.session: AioSession = get_session()
         self.table_name = table_name
         self.region = region
+        self.endpoint_url = endpoint_url
 
     async def init(self) -> None:
         self.client = await self.session.create_client(  # pyright: ignore[reportUnknownMemberType]
-            "dynamodb", region_name=self.region
+            "dynamodb", region_name=self.region, endpoint_url=self.endpoint_url
         ).__aenter__()
 
     async def close(self) -> None:
         self.client = await self.client.__aexit__(None, None, None)
 
+    @staticmethod
+    def _value(item: Mapping[str, Any]) -> Optional[bytes]:
+        value = item.get("value", {})
+        if "N" in value:
+            # counters (see incr) are stored as numbers
+            return str(value["N"]).encode()
+        data: Optional[bytes] = value.get("B")
+        return data
+
     async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
         response = await self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}})
 
         if "Item" in response:
-            value = response["Item"].get("value", {}).get("B")
+            value = self._value(response["Item"])
             ttl = response["Item"].get("ttl", {}).get("N")
 
             if not ttl:
@@ -68,10 +111,10 @@ class DynamoBackend(Backend):
     async def get(self, key: str) -> Optional[bytes]:
         response = await self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}})
         if "Item" in response:
-            return response["Item"].get("value", {}).get("B")
+            return self._value(response["Item"])
         return None
 
-    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+    def _item(self, key: str, value: bytes, expire: Optional[int]) -> Dict[str, Any]:
         ttl = (
             {
                 "ttl": {
@@ -87,17 +130,114 @@ class DynamoBackend(Backend):
             if expire
             else {}
         )
+        return {
+            **{
+                "key": {"S": key},
+                "value": {"B": value},
+            },
+            **ttl,
+        }
 
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
         await self.client.put_item(
+            TableName=self.table_name, Item=self._item(key, value, expire)
+        )
+
+    async def _batch_get(self, keys: Sequence[str]) -> Dict[str, Any]:
+        items: Dict[str, Any] = {}
+        now = int(datetime.datetime.now().timestamp())
+        # BatchGetItem accepts up to 100 keys per request
+        for start in range(0, len(keys), 100):
+            request: Any = {
+                self.table_name: {"Keys": [{"key": {"S": key}} for key in keys[start : start + 100]]}
+            }
+            attempt = 0
+            while request:
+                if attempt:
+                    await _backoff(attempt)
+                attempt += 1
+                response = await self.client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    ttl = item.get("ttl", {}).get("N")
+                    # It's only eventually consistent so we need to check ourselves
+                    if ttl and int(ttl) <= now:
+                        continue
+                    items[item["key"]["S"]] = item
+                request = response.get("UnprocessedKeys")
+        return items
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        items = await self._batch_get(keys)
+        return [self._value(items[key]) if key in items else None for key in keys]
+
+    async def _batch_write(self, requests: List[Any]) -> None:
+        # BatchWriteItem accepts up to 25 requests per call
+        for start in range(0, len(requests), 25):
+            request: Any = {self.table_name: requests[start : start + 25]}
+            attempt = 0
+            while request:
+                if attempt:
+                    await _backoff(attempt)
+                attempt += 1
+                response = await self.client.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems")
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        await self._batch_write(
+            [
+                {"PutRequest": {"Item": self._item(key, value, expire)}}
+                for key, value in items.items()
+            ]
+        )
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        # BatchWriteItem doesn't report if items existed, this counts all keys
+        await self._batch_write(
+            [{"DeleteRequest": {"Key": {"key": {"S": key}}}} for key in keys]
+        )
+        return len(keys)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        response = await self.client.update_item(
             TableName=self.table_name,
-            Item={
-                **{
-                    "key": {"S": key},
-                    "value": {"B": value},
-                },
-                **ttl,
-            },
+            Key={"key": {"S": key}},
+            UpdateExpression="ADD #value :amount",
+            ExpressionAttributeNames={"#value": "value"},
+            ExpressionAttributeValues={":amount": {"N": str(amount)}},
+            ReturnValues="UPDATED_NEW",
+        )
+        return int(response["Attributes"]["value"]["N"])
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        # tag indexes are string sets, which ADD updates atomically
+        for tag in tags:
+            await self.client.update_item(
+                TableName=self.table_name,
+                Key={"key": {"S": tag}},
+                UpdateExpression="ADD #keys :keys",
+                ExpressionAttributeNames={"#keys": "keys"},
+                ExpressionAttributeValues={":keys": {"SS": [key]}},
+            )
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        items = await self._batch_get(tags)
+        keys = dict.fromkeys(
+            key for item in items.values() for key in item.get("keys", {}).get("SS", [])
         )
+        return list(keys)
 
     async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
-        raise NotImplementedError
+        if namespace:
+            # Items can only be found with a full table scan; use
+            # FastAPICache.init(versioned_namespaces=True) instead
+            raise NotImplementedError
+        elif key:
+            response = await self.client.delete_item(
+                TableName=self.table_name, Key={"key": {"S": key}}, ReturnValues="ALL_OLD"
+            )
+            return int("Attributes" in response)
+        return 0
@@ -1,61 +1,264 @@
+import heapq
+import math
 import time
-from asyncio import Lock
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from typing_extensions import Literal
 
 from fastapi_cache.types import Backend
 
+Eviction = Literal["lru", "lfu"]
+
 
 @dataclass
 class Value:
     data: bytes
-    ttl_ts: int
+    ttl_ts: float  # math.inf if the value doesn't expire
+
+
+class _FrequencySketch:
+    """Approximate key access frequencies, for TinyLFU admission
+
+    A count-min sketch with 4-bit counters. All counters are halved once the
+    number of recorded accesses reaches the sample size, so that frequencies
+    reflect recent history.
+
+    """
+
+    _SEEDS = (
+        0x9E3779B97F4A7C15,
+        0xC2B2AE3D27D4EB4F,
+        0x165667B19E3779F9,
+        0x27D4EB2F165667C5,
+    )
+
+    def __init__(self, width: int) -> None:
+        # at least 1024 counters per row (4KiB in total), so that the sketch
+        # isn't too noisy for small caches
+        self._width = 1 << max(width - 1, 1023).bit_length()
+        self._mask = self._width - 1
+        self._rows = [bytearray(self._width) for _ in self._SEEDS]
+        self._additions = 0
+        self._sample_size = 10 * self._width
+
+    def _indexes(self, key: str) -> Iterator[int]:
+        h = hash(key)
+        for seed in self._SEEDS:
+            yield ((h * seed) >> 17) & self._mask
+
+    def increment(self, key: str) -> None:
+        for row, i in zip(self._rows, self._indexes(key)):
+            if row[i] < 15:
+                row[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._additions //= 2
+            for row in self._rows:
+                row[:] = bytes(c >> 1 for c in row)
+
+    def frequency(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
 
 
 class InMemoryBackend(Backend):
-    _store: Dict[str, Value] = {}
-    _lock = Lock()
+    """In-process memory backend
+
+    Each instance has its own store, optionally bounded by the number of entries
+    (`max_entries`) and/or the total size of keys and values (`max_bytes`).
+    When full, entries are evicted in least-recently-used order. With
+    `eviction="lfu"`, a new entry is only admitted if it has been accessed more
+    often than the entry it would evict (TinyLFU), which protects frequently
+    used entries from being flushed out by one-off keys.
+
+    Expired entries are reclaimed in expiry order as part of regular cache
+    operations, also when they are never read again.
+
+    Tags are kept in reverse indexes, from tag to keys and from key to tags, so
+    entries drop out of their tag indexes when they are deleted, evicted or
+    expire.
+
+    All operations complete without yielding to the event loop, so no locking
+    is needed; the backend must not be shared between threads.
+
+    """
+
+    # limit on the number of expired entries reclaimed per operation
+    _reclaim_batch = 100
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        eviction: Eviction = "lru",
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._store: "OrderedDict[str, Value]" = OrderedDict()
+        self._expiry: List[Tuple[float, str]] = []  # heap of (ttl_ts, key)
+        self._bytes = 0
+        self._tags: Dict[str, Set[str]] = {}  # tag -> keys
+        self._key_tags: Dict[str, Set[str]] = {}  # key -> tags
+        self._sketch: Optional[_FrequencySketch] = None
+        if eviction == "lfu":
+            self._sketch = _FrequencySketch(max_entries or 4096)
+
+    @property
+    def _now(self) -> float:
+        return time.time()
 
     @property
-    def _now(self) -> int:
-        return int(time.time())
+    def size(self) -> int:
+        """Total size of all keys and values in the store, in bytes"""
+        return self._bytes
+
+    def _untag(self, key: str) -> None:
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def _delete(self, key: str, untag: bool = True) -> bool:
+        if untag:
+            self._untag(key)
+        v = self._store.pop(key, None)
+        if v is None:
+            return False
+        self._bytes -= len(key) + len(v.data)
+        return True
+
+    def _reclaim(self) -> None:
+        """Remove expired entries, in expiry order"""
+        now, heap = self._now, self._expiry
+        for _ in range(self._reclaim_batch):
+            if not heap or heap[0][0] > now:
+                break
+            ttl_ts, key = heapq.heappop(heap)
+            v = self._store.get(key)
+            # the entry may have been replaced since
+            if v is not None and v.ttl_ts == ttl_ts:
+                self._delete(key)
+        if len(heap) > 2 * len(self._store) + self._reclaim_batch:
+            # drop heap entries for replaced and deleted values
+            self._expiry = [
+                (v.ttl_ts, k) for k, v in self._store.items() if v.ttl_ts != math.inf
+            ]
+            heapq.heapify(self._expiry)
 
     def _get(self, key: str) -> Optional[Value]:
+        self._reclaim()
+        if self._sketch is not None:
+            self._sketch.increment(key)
         v = self._store.get(key)
         if v:
-            if v.ttl_ts < self._now:
-                del self._store[key]
+            if v.ttl_ts <= self._now:
+                self._delete(key)
             else:
+                self._store.move_to_end(key)
                 return v
         return None
 
+    def _full(self, extra: int = 0, extra_bytes: int = 0) -> bool:
+        return (
+            self.max_entries is not None and len(self._store) + extra > self.max_entries
+        ) or (self.max_bytes is not None and self._bytes + extra_bytes > self.max_bytes)
+
+    def _admit(self, key: str, size: int, replace: bool) -> bool:
+        """Make room for an entry, return False if it should not be stored"""
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        while self._store and self._full(1, size):
+            victim = next(iter(self._store))
+            if (
+                self._sketch is not None
+                and not replace
+                and self._sketch.frequency(key) <= self._sketch.frequency(victim)
+            ):
+                return False
+            self._delete(victim)
+        return True
+
+    def _set(self, key: str, value: bytes, expire: Optional[int]) -> None:
+        self._reclaim()
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        # replacing a value keeps its tags
+        replace = self._delete(key, untag=False)
+        size = len(key) + len(value)
+        if not self._admit(key, size, replace):
+            self._untag(key)
+            return
+        ttl_ts = self._now + expire if expire else math.inf
+        self._store[key] = Value(value, ttl_ts)
+        self._bytes += size
+        if expire:
+            heapq.heappush(self._expiry, (ttl_ts, key))
+
     async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
-        async with self._lock:
-            v = self._get(key)
-            if v:
-                return v.ttl_ts - self._now, v.data
-            return 0, None
+        v = self._get(key)
+        if v:
+            if v.ttl_ts == math.inf:
+                return -1, v.data
+            return math.ceil(v.ttl_ts - self._now), v.data
+        return 0, None
 
     async def get(self, key: str) -> Optional[bytes]:
-        async with self._lock:
-            v = self._get(key)
-            if v:
-                return v.data
-            return None
+        v = self._get(key)
+        if v:
+            return v.data
+        return None
 
     async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
-        async with self._lock:
-            self._store[key] = Value(value, self._now + (expire or 0))
+        self._set(key, value, expire)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values: List[Optional[bytes]] = []
+        for key in keys:
+            v = self._get(key)
+            values.append(v.data if v else None)
+        return values
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        for key, value in items.items():
+            self._set(key, value, expire)
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        return sum(self._delete(key) for key in keys)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        v = self._get(key)
+        value = int(v.data if v else 0) + amount
+        self._set(key, str(value).encode(), None)
+        return value
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._key_tags.setdefault(key, set()).update(tags)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        keys: Dict[str, None] = {}
+        for tag in tags:
+            keys.update(dict.fromkeys(self._tags.get(tag, ())))
+        return list(keys)
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        keys = await self.get_tagged_keys(tags)
+        return sum(self._delete(key) for key in keys)
 
     async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
         count = 0
         if namespace:
-            keys = list(self._store.keys())
-            for key in keys:
-                if key.startswith(namespace):
-                    del self._store[key]
-                    count += 1
+            keys = [k for k in self._store if k.startswith(namespace)]
+            for k in keys:
+                self._delete(k)
+            count = len(keys)
         elif key:
-            del self._store[key]
-            count += 1
+            count = int(self._delete(key))
         return count
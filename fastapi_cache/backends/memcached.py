@@ -1,6 +1,8 @@
-from typing import Optional, Tuple
+import asyncio
+from typing import List, Mapping, Optional, Sequence, Tuple
 
 from aiomcache import Client
+from aiomcache.exceptions import ClientException
 
 from fastapi_cache.types import Backend
 
@@ -18,5 +20,66 @@ class MemcachedBackend(Backend):
     async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
         await self.mcache.set(key.encode(), value, exptime=expire or 0)
 
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return list(await self.mcache.multi_get(*(key.encode() for key in keys)))
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        # the memcached protocol has no multi-set command
+        await asyncio.gather(
+            *(self.set(key, value, expire) for key, value in items.items())
+        )
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        deleted = await asyncio.gather(
+            *(self.mcache.delete(key.encode()) for key in keys)
+        )
+        return sum(deleted)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        k = key.encode()
+        while True:
+            try:
+                value = await self.mcache.incr(k, amount)
+            except ClientException:
+                # aiomcache raises, rather than returning None, for missing keys,
+                # and keeps only a message; other errors, e.g. for a value that
+                # isn't a number, are final
+                if await self.mcache.get(k) is not None:
+                    raise
+                value = None
+            if value is not None:
+                return value
+            # incr fails for missing keys; add fails if another client won the race
+            if await self.mcache.add(k, str(amount).encode()):
+                return amount
+
+    async def _add_tag(self, key: bytes, tag: bytes) -> None:
+        while True:
+            index, cas_token = await self.mcache.gets(tag)
+            if index is None:
+                if await self.mcache.add(tag, key):
+                    return
+            elif key in index.split(b"\n"):
+                return
+            elif await self.mcache.cas(tag, index + b"\n" + key, cas_token):  # type: ignore[arg-type]
+                return
+            # another client changed the index in the meantime, retry
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        # check-and-set keeps concurrent updates of an index from being lost;
+        # indexes don't expire, memcached evicts them when unused
+        await asyncio.gather(*(self._add_tag(key.encode(), tag.encode()) for tag in tags))
+
     async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
-        raise NotImplementedError
+        if namespace:
+            # memcached can't list keys; use FastAPICache.init(versioned_namespaces=True)
+            raise NotImplementedError
+        elif key:
+            return int(await self.mcache.delete(key.encode()))
+        return 0
@@ -1,30 +1,125 @@
-from typing import Optional, Tuple, Union
+import asyncio
+from typing import List, Mapping, Optional, Sequence, Tuple, Union
 
 from redis.asyncio.client import Redis
 from redis.asyncio.cluster import RedisCluster
 
 from fastapi_cache.types import Backend
 
+# Add a key to a tag set. The set lives as long as the longest living key in it:
+# its expiry is only ever extended, and removed for keys that don't expire.
+# KEYS[1]: tag set, ARGV[1]: key, ARGV[2]: expiry of the key (0: never)
+_ADD_TAG = """
+local expire = tonumber(ARGV[2])
+local ttl = redis.call('TTL', KEYS[1])
+redis.call('SADD', KEYS[1], ARGV[1])
+if expire == 0 then
+    if ttl > 0 then
+        redis.call('PERSIST', KEYS[1])
+    end
+elseif ttl == -2 or (ttl > 0 and ttl < expire) then
+    redis.call('EXPIRE', KEYS[1], expire)
+end
+"""
+
+# Remove a tag set and return its keys, atomically so no key added concurrently
+# is lost. KEYS[1]: tag set
+_POP_TAG = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+return keys
+"""
+
 
 class RedisBackend(Backend):
     def __init__(self, redis: Union["Redis[bytes]", "RedisCluster[bytes]"]):
         self.redis = redis
         self.is_cluster: bool = isinstance(redis, RedisCluster)
+        # scripts only touch a single key, so they work with clusters too
+        self._add_tag = redis.register_script(_ADD_TAG)  # type: ignore[union-attr]
+        self._pop_tag = redis.register_script(_POP_TAG)  # type: ignore[union-attr]
 
     async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
         async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
             return await pipe.ttl(key).get(key).execute()  # type: ignore[union-attr,no-any-return]
 
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        async with self.redis.pipeline(transaction=not self.is_cluster) as pipe:
+            pipe.ttl(key).getrange(key, 0, size - 1)  # type: ignore[union-attr]
+            ttl, head = await pipe.execute()
+        # GETRANGE returns an empty string for missing keys
+        return ttl, head or None
+
     async def get(self, key: str) -> Optional[bytes]:
         return await self.redis.get(key)  # type: ignore[union-attr]
 
     async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
         await self.redis.set(key, value, ex=expire)  # type: ignore[union-attr]
 
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        if self.is_cluster:
+            # keys may be spread across slots
+            return await self.redis.mget_nonatomic(keys)  # type: ignore[union-attr,no-any-return]
+        return await self.redis.mget(keys)  # type: ignore[union-attr]
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=expire)  # type: ignore[union-attr]
+            await pipe.execute()
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        if not keys:
+            return 0
+        return await self.redis.delete(*keys)  # type: ignore[union-attr]
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self.redis.incrby(key, amount)  # type: ignore[union-attr]
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        await asyncio.gather(
+            *(self._add_tag(keys=[tag], args=[key, expire or 0]) for tag in tags)
+        )
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        if not tags:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.smembers(tag)  # type: ignore[union-attr]
+            members = await pipe.execute()
+        keys = dict.fromkeys(key.decode() for keys in members for key in keys)
+        return list(keys)
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        members = await asyncio.gather(*(self._pop_tag(keys=[tag]) for tag in tags))
+        keys = list(dict.fromkeys(key for keys in members for key in keys))
+        if not keys:
+            return 0
+        return await self.redis.unlink(*keys)  # type: ignore[union-attr]
+
     async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
         if namespace:
-            lua = f"for i, name in ipairs(redis.call('KEYS', '{namespace}:*')) do redis.call('DEL', name); end"
-            return await self.redis.eval(lua, numkeys=0)  # type: ignore[union-attr,no-any-return]
+            # SCAN doesn't block the server like KEYS does; the keys are removed
+            # in batches, and UNLINK reclaims their memory in the background.
+            count = 0
+            batch: List[bytes] = []
+            async for name in self.redis.scan_iter(match=f"{namespace}:*", count=1000):  # type: ignore[union-attr]
+                batch.append(name)
+                if len(batch) >= 1000:
+                    count += await self.redis.unlink(*batch)  # type: ignore[union-attr]
+                    batch = []
+            if batch:
+                count += await self.redis.unlink(*batch)  # type: ignore[union-attr]
+            return count
         elif key:
             return await self.redis.delete(key)  # type: ignore[union-attr]
         return 0
@@ -0,0 +1,164 @@
+import asyncio
+import bisect
+import hashlib
+from collections import defaultdict
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from fastapi_cache.types import Backend
+
+
+def _hash(value: str) -> int:
+    # hash() differs between processes, and all workers must agree on the ring
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class ShardedBackend(Backend):
+    """
+    Spread keys over multiple backends with a consistent-hash ring
+
+    Each shard is named, and is placed on the ring at `replicas` points (times
+    its weight) derived from its name. A key is stored on the shard owning the
+    first point after the hash of the key, so adding or removing a shard only
+    moves the keys between it and its neighbours on the ring: about 1/N of the
+    keys for N shards. Keep the names of shards stable when the set of shards
+    changes.
+
+    Batch operations are split per shard and run concurrently; clearing a
+    namespace clears it on all shards. Tag indexes are stored on the shard of
+    the tag, which may differ from the shards of the tagged keys.
+
+    Usage:
+        >> backend = ShardedBackend(
+        ..     {"redis-a": RedisBackend(redis_a), "redis-b": RedisBackend(redis_b)},
+        ..     weights={"redis-b": 2},
+        .. )
+        >> FastAPICache.init(backend)
+    """
+
+    def __init__(
+        self,
+        shards: Mapping[str, Backend],
+        weights: Optional[Mapping[str, float]] = None,
+        replicas: int = 160,
+    ) -> None:
+        if not shards:
+            raise ValueError("ShardedBackend needs at least one shard")
+        weights = weights or {}
+        unknown = set(weights) - set(shards)
+        if unknown:
+            raise ValueError(f"Weights for unknown shards: {', '.join(sorted(unknown))}")
+        self.shards = dict(shards)
+        points: List[Tuple[int, str]] = []
+        for name in self.shards:
+            count = max(1, round(replicas * weights.get(name, 1)))
+            points.extend((_hash(f"{name}#{i}"), name) for i in range(count))
+        points.sort()
+        self._points = [point for point, _ in points]
+        self._owners = [self.shards[name] for _, name in points]
+
+    def shard(self, key: str) -> Backend:
+        """The shard a key is stored on"""
+        index = bisect.bisect(self._points, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+    def _split(self, keys: Sequence[str]) -> Dict[Backend, List[str]]:
+        groups: Dict[Backend, List[str]] = defaultdict(list)
+        for key in keys:
+            groups[self.shard(key)].append(key)
+        return groups
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        return await self.shard(key).get_with_ttl(key)
+
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        return await self.shard(key).get_head_with_ttl(key, size)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.shard(key).get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.shard(key).set(key, value, expire)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        groups = self._split(keys)
+        results = await asyncio.gather(
+            *(shard.get_many(shard_keys) for shard, shard_keys in groups.items())
+        )
+        values: Dict[str, Optional[bytes]] = {}
+        for shard_keys, shard_values in zip(groups.values(), results):
+            values.update(zip(shard_keys, shard_values))
+        return [values[key] for key in keys]
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        groups = self._split(list(items))
+        await asyncio.gather(
+            *(
+                shard.set_many({key: items[key] for key in shard_keys}, expire)
+                for shard, shard_keys in groups.items()
+            )
+        )
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        counts = await asyncio.gather(
+            *(
+                shard.delete_many(shard_keys)
+                for shard, shard_keys in self._split(keys).items()
+            )
+        )
+        return sum(counts)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self.shard(key).incr(key, amount)
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        await asyncio.gather(
+            *(
+                shard.add_tags(key, shard_tags, expire)
+                for shard, shard_tags in self._split(tags).items()
+            )
+        )
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        results = await asyncio.gather(
+            *(
+                shard.get_tagged_keys(shard_tags)
+                for shard, shard_tags in self._split(tags).items()
+            )
+        )
+        return list(dict.fromkeys(key for keys in results for key in keys))
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        # the tagged keys can be on any shard; delete them first, then the
+        # indexes on the shards of the tags
+        keys = await self.get_tagged_keys(tags)
+        count = await self.delete_many(keys) if keys else 0
+        await asyncio.gather(
+            *(
+                shard.invalidate_tags(shard_tags)
+                for shard, shard_tags in self._split(tags).items()
+            )
+        )
+        return count
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            counts = await asyncio.gather(
+                *(shard.clear(namespace) for shard in self.shards.values())
+            )
+            return sum(counts)
+        elif key:
+            return await self.shard(key).clear(key=key)
+        return 0
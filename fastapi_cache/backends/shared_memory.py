@@ -0,0 +1,564 @@
+import asyncio
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi_cache.types import Backend
+
+_MAGIC = b"FCSHM\x00\x00\x01"
+# magic, number of buckets, slab size, logical end of the last write to the
+# slab, number of counters, number of tag slots
+_HEADER = struct.Struct("<8sQQQQQ")
+_WRITE_END = struct.Struct("<Q")
+_WRITE_END_OFFSET = 24
+# seqlock, slab position, key hash, key length, value length, expiry time (0 if
+# the entry doesn't expire), state
+_BUCKET = struct.Struct("<QQQIIdI4x")
+_SEQ = struct.Struct("<Q")
+# seqlock, key hash, value, state, key length, key
+_COUNTER = struct.Struct("<QQqII224s")
+_COUNTER_KEY = 224
+# tag hash, key hash, time it was added, state
+_TAG = struct.Struct("<QQdI4x")
+_TAG_HASH = struct.Struct("<Q")
+
+_EMPTY, _USED, _DELETED = 0, 1, 2
+# buckets probed for a key; a full window evicts the oldest entry in it
+_PROBES = 16
+# attempts to read a bucket that is being written
+_RETRIES = 100
+# the tags of keys that aren't in the cache are reclaimed after this many
+# seconds, so that the tags of a key written just after it is tagged are kept
+_TAG_GRACE = 60.0
+# buckets cleared per lock acquisition, so a clear doesn't hold off writers
+_CLEAR_BATCH = 4096
+
+T = TypeVar("T")
+
+
+def _hash(key: bytes) -> int:
+    # hash() differs between processes
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class SharedMemoryBackend(Backend):
+    """
+    Cache in memory shared by all processes on a host
+
+    Entries live in a memory-mapped file, e.g. in /dev/shm, that all worker
+    processes map: a fixed-size open-addressing hash table (`buckets` entries,
+    with linear probing), and a slab of `slab_size` bytes for the keys and
+    values. The slab is written as a ring; once it wraps around, new values
+    overwrite the oldest ones, so the slab size bounds the memory used and the
+    oldest entries are evicted first.
+
+    Reads don't take any locks: each bucket is guarded by a sequence lock, and
+    a value read from the slab is only returned if the slab wasn't overwritten
+    at that position while it was read. Writes are serialized with a lock on the
+    file, and run in a thread, so waiting for the lock doesn't block the event
+    loop. Values are copied out of the shared memory exactly once, as they have
+    to be checked after they have been read.
+
+    Counters are kept in a table of their own, next to the hash table, so that
+    they are never evicted: an evicted counter would start over, and hand out
+    numbers that were used before. The table holds `counters` counters, with
+    keys of up to 224 bytes; incrementing a new counter fails once it is full.
+
+    Tags are kept in a table of their own as well, of `tag_slots` (tag, key)
+    pairs, so that invalidating a tag never misses keys whose index was
+    evicted. The pairs of keys that are no longer in the cache are reclaimed
+    when their slots are needed; if there are none, tagging a key raises, so
+    that it isn't cached without its tags.
+
+    All processes must open the file with the same `buckets` and `slab_size`.
+    This relies on flock() and mmap, and so is not available on Windows.
+
+    Usage:
+        >> backend = SharedMemoryBackend("/dev/shm/fastapi-cache", slab_size=256 << 20)
+        >> FastAPICache.init(backend)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        buckets: int = 1 << 16,
+        slab_size: int = 64 << 20,
+        counters: int = 1024,
+        tag_slots: int = 1 << 16,
+    ) -> None:
+        self.path = path
+        self.buckets = buckets
+        self.slab_size = slab_size
+        self.counters = counters
+        self.tag_slots = tag_slots
+        self._counters_start = _HEADER.size + buckets * _BUCKET.size
+        self._tags_start = self._counters_start + counters * _COUNTER.size
+        self._slab_start = self._tags_start + tag_slots * _TAG.size
+        size = self._slab_start + slab_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # serializes writes between threads; flock() between processes
+        self._lock = threading.Lock()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            created = os.fstat(self._fd).st_size == 0
+            if created:
+                os.ftruncate(self._fd, size)
+            self._mmap = mmap.mmap(self._fd, size)
+            if created:
+                _HEADER.pack_into(
+                    self._mmap, 0, _MAGIC, buckets, slab_size, 0, counters, tag_slots
+                )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        magic, stored_buckets, stored_slab_size, _, *stored_tables = (
+            _HEADER.unpack_from(self._mmap, 0)
+        )
+        if (magic, stored_buckets, stored_slab_size, stored_tables) != (
+            _MAGIC,
+            buckets,
+            slab_size,
+            [counters, tag_slots],
+        ):
+            self.close()
+            raise ValueError(
+                f"{path} is not a cache file with {buckets} buckets, a slab of "
+                f"{slab_size} bytes, {counters} counters and {tag_slots} tag slots"
+            )
+        self._view = memoryview(self._mmap)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="fastapi-cache-shm")
+
+    def close(self) -> None:
+        """Unmap the file; the entries stay available to other processes"""
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        view = getattr(self, "_view", None)
+        if view is not None:
+            view.release()
+        self._mmap.close()
+        os.close(self._fd)
+
+    def _bucket(self, index: int) -> int:
+        return _HEADER.size + index * _BUCKET.size
+
+    def _probe(self, key_hash: int) -> Iterator[int]:
+        for probe in range(_PROBES):
+            yield self._bucket((key_hash + probe) % self.buckets)
+
+    def _probe_counters(self, key_hash: int) -> Iterator[int]:
+        for probe in range(_PROBES):
+            index = (key_hash + probe) % self.counters
+            yield self._counters_start + index * _COUNTER.size
+
+    def _find_counter(self, key: bytes, key_hash: int) -> Optional[int]:
+        """The value of a counter, without locking"""
+        view = self._view
+        for slot in self._probe_counters(key_hash):
+            for _ in range(_RETRIES):
+                seq, hash_, value, state, key_len, stored = _COUNTER.unpack_from(view, slot)
+                if not seq & 1 and _SEQ.unpack_from(view, slot)[0] == seq:
+                    break
+            else:
+                return None
+            if state == _EMPTY:
+                return None
+            if state == _USED and hash_ == key_hash and stored[:key_len] == key:
+                return int(value)
+        return None
+
+    def _counter_slot(self, key: bytes, key_hash: int) -> Tuple[Optional[int], Optional[int]]:
+        """The slot of a counter, and else a free slot; the caller holds the lock"""
+        free: Optional[int] = None
+        for slot in self._probe_counters(key_hash):
+            _, hash_, _, state, key_len, stored = _COUNTER.unpack_from(self._mmap, slot)
+            if state == _USED and hash_ == key_hash and stored[:key_len] == key:
+                return slot, None
+            if state != _USED and free is None:
+                free = slot
+            if state == _EMPTY:
+                break
+        return None, free
+
+    def _write_counter(
+        self, slot: int, key_hash: int, value: int, state: int, key: bytes
+    ) -> None:
+        seq = _SEQ.unpack_from(self._mmap, slot)[0]
+        _SEQ.pack_into(self._mmap, slot, seq + 1)
+        _COUNTER.pack_into(
+            self._mmap, slot, seq + 1, key_hash, value, state, len(key), key
+        )
+        _SEQ.pack_into(self._mmap, slot, seq + 2)
+
+    def _delete_counter(self, key: bytes, key_hash: int) -> bool:
+        """Delete a counter; the caller holds the lock"""
+        slot, _ = self._counter_slot(key, key_hash)
+        if slot is None:
+            return False
+        self._write_counter(slot, 0, 0, _DELETED, b"")
+        return True
+
+    def _write_end(self) -> int:
+        end: int = _WRITE_END.unpack_from(self._mmap, _WRITE_END_OFFSET)[0]
+        return end
+
+    def _overwritten(self, position: int) -> bool:
+        """Whether the slab has wrapped around past a position"""
+        return self._write_end() > position + self.slab_size
+
+    def _find(self, key: bytes) -> Optional[Tuple[float, bytes]]:
+        """The expiry time and value of a key, without locking"""
+        key_hash = _hash(key)
+        counter = self._find_counter(key, key_hash)
+        if counter is not None:
+            return 0.0, str(counter).encode()
+        return self._find_entry(key, key_hash)
+
+    def _find_entry(self, key: bytes, key_hash: int) -> Optional[Tuple[float, bytes]]:
+        """The expiry time and value of a key in the slab, without locking"""
+        view = self._view
+        for bucket in self._probe(key_hash):
+            for _ in range(_RETRIES):
+                seq, position, hash_, key_len, value_len, expires, state = (
+                    _BUCKET.unpack_from(view, bucket)
+                )
+                if seq & 1:
+                    # the bucket is being written
+                    continue
+                if state == _EMPTY:
+                    return None
+                if state != _USED or hash_ != key_hash or key_len != len(key):
+                    break
+                start = self._slab_start + position % self.slab_size
+                found = view[start : start + key_len] == key
+                value = bytes(view[start + key_len : start + key_len + value_len])
+                if _SEQ.unpack_from(view, bucket)[0] != seq:
+                    # changed while it was read
+                    continue
+                if not found or self._overwritten(position):
+                    break
+                if expires and expires <= time.time():
+                    return None
+                return expires, value
+        return None
+
+    def _locked(self) -> "_FileLock":
+        return _FileLock(self._lock, self._fd)
+
+    def _reusable(self, bucket: int, now: float) -> bool:
+        _, position, _, _, _, expires, state = _BUCKET.unpack_from(self._mmap, bucket)
+        return (
+            state != _USED
+            or bool(expires and expires <= now)
+            or self._overwritten(position)
+        )
+
+    def _live_bucket(self, key_hash: int, now: float) -> Optional[int]:
+        """The bucket of a key in the cache by its hash; the caller holds the lock"""
+        for bucket in self._probe(key_hash):
+            _, _, hash_, _, _, _, state = _BUCKET.unpack_from(self._mmap, bucket)
+            if state == _EMPTY:
+                break
+            if hash_ == key_hash and not self._reusable(bucket, now):
+                return bucket
+        return None
+
+    def _matches(self, bucket: int, key: bytes, key_hash: int) -> bool:
+        _, position, hash_, key_len, _, _, state = _BUCKET.unpack_from(self._mmap, bucket)
+        if state != _USED or hash_ != key_hash or key_len != len(key):
+            return False
+        if self._overwritten(position):
+            return False
+        start = self._slab_start + position % self.slab_size
+        return self._view[start : start + key_len] == key
+
+    def _publish(
+        self,
+        bucket: int,
+        position: int,
+        key_hash: int,
+        key_len: int,
+        value_len: int,
+        expires: float,
+        state: int,
+    ) -> None:
+        seq = _SEQ.unpack_from(self._mmap, bucket)[0]
+        # an odd sequence number tells readers that the bucket is being written
+        _SEQ.pack_into(self._mmap, bucket, seq + 1)
+        _BUCKET.pack_into(
+            self._mmap, bucket, seq + 1, position, key_hash, key_len, value_len, expires, state
+        )
+        _SEQ.pack_into(self._mmap, bucket, seq + 2)
+
+    def _store(self, key: bytes, value: bytes, expire: Optional[int]) -> None:
+        """Write a value; the caller holds the lock"""
+        size = len(key) + len(value)
+        if size > self.slab_size:
+            raise ValueError(f"Value of {size} bytes doesn't fit in the slab")
+        key_hash = _hash(key)
+        # a value replaces a counter
+        self._delete_counter(key, key_hash)
+        now = time.time()
+        target: Optional[int] = None
+        oldest: Optional[Tuple[int, int]] = None
+        for bucket in self._probe(key_hash):
+            if self._matches(bucket, key, key_hash):
+                target = bucket
+                break
+            state = _BUCKET.unpack_from(self._mmap, bucket)[6]
+            if target is None and self._reusable(bucket, now):
+                target = bucket
+            position = _BUCKET.unpack_from(self._mmap, bucket)[1]
+            if oldest is None or position < oldest[0]:
+                oldest = (position, bucket)
+            if state == _EMPTY:
+                break
+        if target is None:
+            assert oldest is not None  # noqa: S101
+            target = oldest[1]
+
+        # reserve the space before writing it, so readers of the values that
+        # were there see they have been overwritten
+        position = self._write_end()
+        if position % self.slab_size + size > self.slab_size:
+            position += self.slab_size - position % self.slab_size
+        _WRITE_END.pack_into(self._mmap, _WRITE_END_OFFSET, position + size)
+        start = self._slab_start + position % self.slab_size
+        self._mmap[start : start + size] = key + value
+        expires = now + expire if expire else 0.0
+        self._publish(target, position, key_hash, len(key), len(value), expires, _USED)
+
+    def _delete(self, key: bytes) -> bool:
+        """Delete a key; the caller holds the lock"""
+        key_hash = _hash(key)
+        if self._delete_counter(key, key_hash):
+            return True
+        for bucket in self._probe(key_hash):
+            if self._matches(bucket, key, key_hash):
+                live = not self._reusable(bucket, time.time())
+                self._publish(bucket, 0, 0, 0, 0, 0.0, _DELETED)
+                return live
+            if _BUCKET.unpack_from(self._mmap, bucket)[6] == _EMPTY:
+                break
+        return False
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        found = self._find(key.encode())
+        if found is None:
+            return 0, None
+        expires, value = found
+        return (math.ceil(expires - time.time()) if expires else -1), value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        found = self._find(key.encode())
+        return None if found is None else found[1]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [await self.get(key) for key in keys]
+
+    async def _run(self, operation: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, operation, *args
+        )
+
+    def _set_many(self, items: Mapping[str, bytes], expire: Optional[int]) -> None:
+        with self._locked():
+            for key, value in items.items():
+                self._store(key.encode(), value, expire)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self._run(self._set_many, {key: value}, expire)
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        if items:
+            await self._run(self._set_many, items, expire)
+
+    def _delete_many(self, keys: Sequence[bytes]) -> int:
+        with self._locked():
+            return sum(self._delete(key) for key in keys)
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        if not keys:
+            return 0
+        return await self._run(self._delete_many, [key.encode() for key in keys])
+
+    def _incr(self, key: bytes, amount: int) -> int:
+        if len(key) > _COUNTER_KEY:
+            raise ValueError(f"Counter key of {len(key)} bytes is too long")
+        key_hash = _hash(key)
+        with self._locked():
+            slot, free = self._counter_slot(key, key_hash)
+            if slot is not None:
+                value = int(_COUNTER.unpack_from(self._mmap, slot)[2]) + amount
+            else:
+                if free is None:
+                    raise ValueError("The counter table is full")
+                # a number that was set as a value moves to the counter table
+                found = self._find_entry(key, key_hash)
+                value = int(found[1] if found else 0) + amount
+                if found:
+                    self._delete(key)
+                slot = free
+            self._write_counter(slot, key_hash, value, _USED, key)
+        return value
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self._run(self._incr, key.encode(), amount)
+
+    def _probe_tags(self, tag_hash: int, key_hash: int) -> Iterator[int]:
+        start = _hash(_TAG_HASH.pack(tag_hash) + _TAG_HASH.pack(key_hash))
+        for probe in range(_PROBES):
+            yield self._tags_start + (start + probe) % self.tag_slots * _TAG.size
+
+    def _add_tags(self, key: bytes, tags: Sequence[str]) -> None:
+        key_hash = _hash(key)
+        with self._locked():
+            now = time.time()
+            for tag in tags:
+                tag_hash = _hash(tag.encode())
+                target: Optional[int] = None
+                reclaimable: Optional[int] = None
+                for slot in self._probe_tags(tag_hash, key_hash):
+                    stored_tag, stored_key, added, state = _TAG.unpack_from(self._mmap, slot)
+                    if state == _USED and (stored_tag, stored_key) == (tag_hash, key_hash):
+                        # keep the pair from being reclaimed before the key is written
+                        target = slot
+                        break
+                    if state != _USED:
+                        if target is None:
+                            target = slot
+                        if state == _EMPTY:
+                            break
+                    elif (
+                        reclaimable is None
+                        and added + _TAG_GRACE < now
+                        and self._live_bucket(stored_key, now) is None
+                    ):
+                        reclaimable = slot
+                if target is None:
+                    target = reclaimable
+                if target is None:
+                    raise ValueError("The tag table is full")
+                _TAG.pack_into(self._mmap, target, tag_hash, key_hash, now, _USED)
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        if tags:
+            await self._run(self._add_tags, key.encode(), tags)
+
+    def _tag_slots(self, tags: Sequence[str]) -> Iterator[Tuple[int, int]]:
+        """The slots and key hashes of the pairs of tags; the caller holds the lock"""
+        for tag in tags:
+            # search the table for the tag hash, which is faster than
+            # unpacking every slot
+            needle = _TAG_HASH.pack(_hash(tag.encode()))
+            position = self._mmap.find(needle, self._tags_start, self._slab_start)
+            while position != -1:
+                if (position - self._tags_start) % _TAG.size == 0:
+                    _, key_hash, _, state = _TAG.unpack_from(self._mmap, position)
+                    if state == _USED:
+                        yield position, key_hash
+                position = self._mmap.find(needle, position + 1, self._slab_start)
+
+    def _tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        keys: Dict[str, None] = {}
+        with self._locked():
+            now = time.time()
+            for _, key_hash in self._tag_slots(tags):
+                bucket = self._live_bucket(key_hash, now)
+                if bucket is not None:
+                    _, position, _, key_len, *_ = _BUCKET.unpack_from(self._mmap, bucket)
+                    start = self._slab_start + position % self.slab_size
+                    keys[self._view[start : start + key_len].tobytes().decode()] = None
+        return list(keys)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        if not tags:
+            return []
+        return await self._run(self._tagged_keys, tags)
+
+    def _invalidate_tags(self, tags: Sequence[str]) -> int:
+        count = 0
+        with self._locked():
+            now = time.time()
+            for slot, key_hash in list(self._tag_slots(tags)):
+                bucket = self._live_bucket(key_hash, now)
+                if bucket is not None:
+                    self._publish(bucket, 0, 0, 0, 0, 0.0, _DELETED)
+                    count += 1
+                _TAG.pack_into(self._mmap, slot, 0, 0, 0.0, _DELETED)
+        return count
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        if not tags:
+            return 0
+        return await self._run(self._invalidate_tags, tags)
+
+    def _clear(self, prefix: bytes) -> int:
+        count = 0
+        with self._locked():
+            for index in range(self.counters):
+                slot = self._counters_start + index * _COUNTER.size
+                _, _, _, state, key_len, key = _COUNTER.unpack_from(self._mmap, slot)
+                if state == _USED and key[:key_len].startswith(prefix):
+                    self._write_counter(slot, 0, 0, _DELETED, b"")
+                    count += 1
+        for batch in range(0, self.buckets, _CLEAR_BATCH):
+            with self._locked():
+                now = time.time()
+                for index in range(batch, min(batch + _CLEAR_BATCH, self.buckets)):
+                    bucket = self._bucket(index)
+                    if self._reusable(bucket, now):
+                        continue
+                    _, position, _, key_len, *_ = _BUCKET.unpack_from(self._mmap, bucket)
+                    start = self._slab_start + position % self.slab_size
+                    if self._view[start : start + key_len].tobytes().startswith(prefix):
+                        self._publish(bucket, 0, 0, 0, 0, 0.0, _DELETED)
+                        count += 1
+        return count
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            # a scan of all buckets
+            return await self._run(self._clear, namespace.encode())
+        elif key:
+            return await self.delete_many([key])
+        return 0
+
+
+class _FileLock:
+    """Hold a thread lock and an exclusive lock on a file"""
+
+    __slots__ = ("lock", "fd")
+
+    def __init__(self, lock: threading.Lock, fd: int) -> None:
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self) -> None:
+        self.lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *args: object) -> None:
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
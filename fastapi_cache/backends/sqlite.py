@@ -0,0 +1,353 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi_cache.types import Backend
+
+T = TypeVar("T")
+
+# SQLite limits the number of host parameters of a statement to 999 in older
+# versions
+_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires) WHERE expires IS NOT NULL;
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tag, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+"""
+
+
+def _batches(keys: Sequence[str]) -> Iterator[Sequence[str]]:
+    for start in range(0, len(keys), _BATCH):
+        yield keys[start : start + _BATCH]
+
+
+def _placeholders(keys: Sequence[str]) -> str:
+    return ",".join("?" * len(keys))
+
+
+def _prefix_end(prefix: str) -> str:
+    """The smallest string greater than all strings starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _Transaction:
+    """A write transaction, which may be nested in another one
+
+    BEGIN IMMEDIATE takes the write lock up front, so that the read-modify-write
+    operations in a transaction can't be interleaved with other writers.
+
+    """
+
+    __slots__ = ("connection", "outer")
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.connection = connection
+        self.outer = False
+
+    def __enter__(self) -> None:
+        if not self.connection.in_transaction:
+            self.outer = True
+            self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        if self.outer:
+            self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SQLiteBackend(Backend):
+    """
+    Host-local cache in an SQLite database file
+
+    All worker processes that open the same file share the cache, and it
+    survives restarts. The database is used in WAL mode, so readers don't wait
+    for writers. Queries run in a small thread pool (each thread with its own
+    connection), off the event loop.
+
+    Expired entries are no longer returned, and are purged in bulk at most
+    every `purge_interval` seconds, by a range delete on an index of their
+    expiry times; call `purge()` to purge them right away.
+
+    Usage:
+        >> FastAPICache.init(SQLiteBackend("/var/cache/app/cache.db"))
+        ...
+        >> await backend.close()
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threads: int = 4,
+        timeout: float = 5.0,
+        purge_interval: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="fastapi-cache-sqlite")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._purged = time.time()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode; transactions are started explicitly
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # in WAL mode, NORMAL doesn't risk corruption, only the most recent
+            # writes on power loss
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    async def _run(self, operation: Callable[..., T], *args: Any) -> T:
+        def call() -> T:
+            return operation(self._connection(), *args)
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, call)
+
+    async def close(self) -> None:
+        """Close the database connections"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def _get(
+        self, connection: sqlite3.Connection, key: str, size: Optional[int] = None
+    ) -> Tuple[int, Optional[bytes]]:
+        value = "value" if size is None else "substr(value, 1, ?)"
+        params: Tuple[Any, ...] = (key, time.time())
+        if size is not None:
+            params = (size, *params)
+        row = connection.execute(
+            f"SELECT {value}, expires FROM cache"  # noqa: S608
+            " WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            params,
+        ).fetchone()
+        if row is None:
+            return 0, None
+        data, expires = row
+        ttl = -1 if expires is None else math.ceil(expires - time.time())
+        return ttl, bytes(data)
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        return await self._run(self._get, key)
+
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        return await self._run(self._get, key, size)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self._run(self._get, key))[1]
+
+    def _get_many(
+        self, connection: sqlite3.Connection, keys: Sequence[str]
+    ) -> List[Optional[bytes]]:
+        values: Dict[str, bytes] = {}
+        now = time.time()
+        for batch in _batches(keys):
+            rows = connection.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({_placeholders(batch)})"  # noqa: S608
+                " AND (expires IS NULL OR expires > ?)",
+                (*batch, now),
+            )
+            values.update((key, bytes(value)) for key, value in rows)
+        return [values.get(key) for key in keys]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self._run(self._get_many, keys)
+
+    def _set_many(
+        self,
+        connection: sqlite3.Connection,
+        items: Mapping[str, bytes],
+        expire: Optional[int],
+    ) -> None:
+        now = time.time()
+        expires = now + expire if expire else None
+        with _Transaction(connection):
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                [(key, value, expires) for key, value in items.items()],
+            )
+        if now - self._purged >= self.purge_interval:
+            self._purge(connection)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self._run(self._set_many, {key: value}, expire)
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        if items:
+            await self._run(self._set_many, items, expire)
+
+    def _delete_many(self, connection: sqlite3.Connection, keys: Sequence[str]) -> int:
+        count = 0
+        now = time.time()
+        with _Transaction(connection):
+            for batch in _batches(keys):
+                # expired entries that weren't purged yet don't count
+                (live,) = connection.execute(
+                    f"SELECT count(*) FROM cache WHERE key IN ({_placeholders(batch)})"  # noqa: S608
+                    " AND (expires IS NULL OR expires > ?)",
+                    (*batch, now),
+                ).fetchone()
+                count += live
+                connection.execute(
+                    f"DELETE FROM cache WHERE key IN ({_placeholders(batch)})",  # noqa: S608
+                    batch,
+                )
+                connection.execute(
+                    f"DELETE FROM tags WHERE key IN ({_placeholders(batch)})",  # noqa: S608
+                    batch,
+                )
+        return count
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        if not keys:
+            return 0
+        return await self._run(self._delete_many, keys)
+
+    def _incr(self, connection: sqlite3.Connection, key: str, amount: int) -> int:
+        with _Transaction(connection):
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires IS NULL", (key,)
+            ).fetchone()
+            value = int(row[0] if row else 0) + amount
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, NULL)",
+                (key, str(value).encode()),
+            )
+        return value
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self._run(self._incr, key, amount)
+
+    def _add_tags(
+        self, connection: sqlite3.Connection, key: str, tags: Sequence[str]
+    ) -> None:
+        with _Transaction(connection):
+            connection.executemany(
+                "INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)",
+                [(tag, key) for tag in tags],
+            )
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        # tag rows of expired entries are removed when the entries are purged
+        if tags:
+            await self._run(self._add_tags, key, tags)
+
+    def _tagged_keys(
+        self, connection: sqlite3.Connection, tags: Sequence[str]
+    ) -> List[str]:
+        keys: Dict[str, None] = {}
+        for batch in _batches(tags):
+            rows = connection.execute(
+                f"SELECT DISTINCT key FROM tags WHERE tag IN ({_placeholders(batch)})",  # noqa: S608
+                batch,
+            )
+            keys.update((key, None) for (key,) in rows)
+        return list(keys)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        if not tags:
+            return []
+        return await self._run(self._tagged_keys, tags)
+
+    def _invalidate_tags(self, connection: sqlite3.Connection, tags: Sequence[str]) -> int:
+        with _Transaction(connection):
+            keys = self._tagged_keys(connection, tags)
+            # also removes the other tags of these keys
+            count = self._delete_many(connection, keys) if keys else 0
+            for batch in _batches(tags):
+                connection.execute(
+                    f"DELETE FROM tags WHERE tag IN ({_placeholders(batch)})",  # noqa: S608
+                    batch,
+                )
+        return count
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        if not tags:
+            return 0
+        return await self._run(self._invalidate_tags, tags)
+
+    def _clear(self, connection: sqlite3.Connection, namespace: str) -> int:
+        bounds = (namespace, _prefix_end(namespace))
+        with _Transaction(connection):
+            # range deletes on the primary keys
+            count: int = connection.execute(
+                "SELECT count(*) FROM cache WHERE key >= ? AND key < ?"
+                " AND (expires IS NULL OR expires > ?)",
+                (*bounds, time.time()),
+            ).fetchone()[0]
+            connection.execute("DELETE FROM cache WHERE key >= ? AND key < ?", bounds)
+            # the tags of the deleted keys, and the tags in the namespace
+            connection.execute("DELETE FROM tags WHERE key >= ? AND key < ?", bounds)
+            connection.execute("DELETE FROM tags WHERE tag >= ? AND tag < ?", bounds)
+        return count
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            return await self._run(self._clear, namespace)
+        elif key:
+            return await self.delete_many([key])
+        return 0
+
+    def _purge(self, connection: sqlite3.Connection) -> int:
+        self._purged = now = time.time()
+        with _Transaction(connection):
+            connection.execute(
+                "DELETE FROM tags WHERE key IN"
+                " (SELECT key FROM cache WHERE expires <= ?)",
+                (now,),
+            )
+            cursor = connection.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        count: int = cursor.rowcount
+        return count
+
+    async def purge(self) -> int:
+        """Delete expired entries, return the number of deleted entries"""
+        return await self._run(self._purge)
+
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import math
+import random
+import struct
+import time
+import uuid
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.types import Backend
+
+if TYPE_CHECKING:
+    from redis.asyncio.client import PubSub, Redis
+
+logger: logging.Logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# local entries are prefixed with the expiry time in the remote backend, so
+# the remaining TTL reported for local hits matches the remote backend, and
+# the epoch they were stored in; entries of older epochs are ignored.
+_HEADER = struct.Struct(">dI")
+# seconds to wait before subscribing again, doubled up to the maximum
+_RETRY_MIN = 0.5
+_RETRY_MAX = 30.0
+# keys per invalidation message
+_PUBLISH_BATCH = 1000
+
+
+class TieredBackend(Backend):
+    """
+    Two-tier backend: a small in-process cache in front of a remote backend
+
+    Hot keys are served from the local (L1) cache without a round trip to the
+    remote (L2) backend. Entries are kept locally for at most `local_expire`
+    seconds, or for as long as they remain in the remote backend.
+
+    To keep the local caches of multiple workers consistent, pass in a Redis
+    client; writes and clears are then broadcast over Redis pub/sub, and every
+    worker drops the affected keys or namespaces from its local cache. Tags are
+    only kept in the remote backend. Call
+    `init()` at startup to start listening for these, and `close()` at shutdown.
+    When the subscription is lost, the local cache is dropped and bypassed
+    until the worker has subscribed again, as invalidations may be missed in
+    the meantime.
+
+    Usage:
+        >> redis = aioredis.from_url("redis://localhost")
+        >> backend = TieredBackend(RedisBackend(redis), redis=redis)
+        >> await backend.init()
+        >> FastAPICache.init(backend)
+    """
+
+    def __init__(
+        self,
+        remote: Backend,
+        local: Optional[Backend] = None,
+        local_expire: Optional[int] = None,
+        redis: Optional["Redis[bytes]"] = None,
+        channel: str = "fastapi-cache:invalidate",
+    ) -> None:
+        self.remote = remote
+        self.local = InMemoryBackend(max_entries=1024) if local is None else local
+        self.local_expire = local_expire
+        self.redis = redis
+        self.channel = channel
+        self._id = uuid.uuid4().hex
+        self._pubsub: Optional["PubSub"] = None
+        self._listener: Optional["asyncio.Task[None]"] = None
+        self._epoch = 0
+        # whether invalidations may have been missed
+        self._unsubscribed = False
+
+    async def init(self) -> None:
+        if self.redis is None or self._listener is not None:
+            return
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._unsubscribe()
+
+    async def _unsubscribe(self) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.reset()
+            except Exception:
+                logger.debug("Error closing the invalidation subscription:", exc_info=True)
+
+    async def _listen(self) -> None:
+        assert self.redis is not None  # noqa: S101
+        delay = _RETRY_MIN
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self.redis.pubsub()
+                    await self._pubsub.subscribe(self.channel)
+                    self._unsubscribed = False
+                    delay = _RETRY_MIN
+                    logger.info("Subscribed to cache invalidations again")
+                async for message in self._pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        await self._handle(message["data"])
+                    except Exception:
+                        logger.warning("Error handling cache invalidation:", exc_info=True)
+                raise ConnectionError("Subscription ended")
+            except Exception:
+                logger.warning(
+                    "Lost the cache invalidation subscription, retrying in %.1fs:",
+                    delay,
+                    exc_info=True,
+                )
+            # drop the local cache, and bypass it until subscribed again
+            self._unsubscribed = True
+            self._epoch += 1
+            await self._unsubscribe()
+            await asyncio.sleep(delay * random.uniform(0.5, 1))  # noqa: S311
+            delay = min(delay * 2, _RETRY_MAX)
+
+    async def _handle(self, data: Any) -> None:
+        if isinstance(data, bytes):
+            data = data.decode()
+        sender, kind, name = data.split(":", 2)
+        if sender == self._id:
+            return
+        if kind == "n":
+            await self.local.clear(namespace=name)
+        else:
+            await self.local.delete_many(name.split("\n"))
+
+    async def _publish(self, kind: str, names: Sequence[str]) -> None:
+        """Broadcast an invalidation, with all keys of a batch in one message"""
+        if self.redis is None or not names:
+            return
+        try:
+            for start in range(0, len(names), _PUBLISH_BATCH):
+                batch = "\n".join(names[start : start + _PUBLISH_BATCH])
+                await self.redis.publish(self.channel, f"{self._id}:{kind}:{batch}")
+        except Exception:
+            logger.warning("Error publishing cache invalidation:", exc_info=True)
+
+    async def _set_local(self, key: str, value: bytes, ttl: int) -> None:
+        if self._unsubscribed:
+            return
+        expire: Optional[int] = ttl if ttl > 0 else None
+        if self.local_expire is not None and (expire is None or self.local_expire < expire):
+            expire = self.local_expire
+        deadline = time.time() + ttl if ttl > 0 else math.inf
+        await self.local.set(key, _HEADER.pack(deadline, self._epoch) + value, expire)
+
+    def _valid(self, local: bytes, now: float) -> bool:
+        deadline: float
+        deadline, epoch = _HEADER.unpack_from(local)
+        return epoch == self._epoch and deadline > now
+
+    async def _get_local(self, key: str) -> Tuple[int, Optional[bytes]]:
+        if self._unsubscribed:
+            return 0, None
+        local = await self.local.get(key)
+        if local is not None:
+            deadline, epoch = _HEADER.unpack_from(local)
+            if epoch != self._epoch:
+                return 0, None
+            if deadline == math.inf:
+                return -1, local
+            ttl = math.ceil(deadline - time.time())
+            if ttl > 0:
+                return ttl, local
+        return 0, None
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        ttl, local = await self._get_local(key)
+        if local is not None:
+            return ttl, local[_HEADER.size :]
+
+        ttl, value = await self.remote.get_with_ttl(key)
+        if value is not None:
+            await self._set_local(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        ttl, local = await self._get_local(key)
+        if local is not None:
+            return ttl, local[_HEADER.size : _HEADER.size + size]
+        # a partial value can't be kept locally
+        return await self.remote.get_head_with_ttl(key, size)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.remote.set(key, value, expire)
+        await self._set_local(key, value, expire or -1)
+        await self._publish("k", [key])
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values: Dict[str, Optional[bytes]] = {}
+        now = time.time()
+        if self._unsubscribed:
+            local_values: Sequence[Optional[bytes]] = [None] * len(keys)
+        else:
+            local_values = await self.local.get_many(keys)
+        for key, local in zip(keys, local_values):
+            if local is not None and self._valid(local, now):
+                values[key] = local[_HEADER.size :]
+        missing = [key for key in keys if key not in values]
+        if missing:
+            remote = await self.remote.get_many(missing)
+            values.update(zip(missing, remote))
+            if self.local_expire is not None:
+                # the remote TTL is not known, only cache for local_expire
+                for key, value in zip(missing, remote):
+                    if value is not None:
+                        await self._set_local(key, value, self.local_expire)
+        return [values[key] for key in keys]
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        await self.remote.set_many(items, expire)
+        for key, value in items.items():
+            await self._set_local(key, value, expire or -1)
+        await self._publish("k", list(items))
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        count = await self.remote.delete_many(keys)
+        await self.local.delete_many(keys)
+        await self._publish("k", keys)
+        return count
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        value = await self.remote.incr(key, amount)
+        await self._set_local(key, str(value).encode(), -1)
+        await self._publish("k", [key])
+        return value
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        await self.remote.add_tags(key, tags, expire)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        return await self.remote.get_tagged_keys(tags)
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        # local caches don't know about tags, drop the tagged keys instead
+        keys = await self.remote.get_tagged_keys(tags)
+        count = await self.remote.invalidate_tags(tags)
+        await self.local.delete_many(keys)
+        await self._publish("k", keys)
+        return count
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        count = await self.remote.clear(namespace, key)
+        await self.local.clear(namespace, key)
+        if namespace:
+            await self._publish("n", [namespace])
+        elif key:
+            await self._publish("k", [key])
+        return count
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from typing_extensions import Literal
+
+from fastapi_cache.types import Backend
+
+logger: logging.Logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# value and expire of a write that hasn't reached the backend yet
+_Write = Tuple[bytes, Optional[int]]
+
+
+class WriteBehindBackend(Backend):
+    """
+    Writes to a backend in the background, in batches
+
+    `set()` returns as soon as the value is queued, so cache misses don't wait
+    for a round trip to the backend. A background writer flushes queued values
+    with `set_many()` (a pipeline on Redis, BatchWriteItem on DynamoDB), in
+    batches of up to `batch_size`, collecting writes for up to `flush_interval`
+    seconds. Queued values are served by reads until they are written, and
+    repeated writes to a key are merged.
+
+    At most `max_pending` values are queued; when the queue is full, the
+    `drop` policy decides whether the oldest queued write or the new one is
+    dropped. Call `close()` at shutdown to write the queued values.
+
+    Usage:
+        >> backend = WriteBehindBackend(RedisBackend(redis))
+        >> FastAPICache.init(backend)
+        ...
+        >> await backend.close()
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        max_pending: int = 10_000,
+        batch_size: int = 100,
+        flush_interval: float = 0.01,
+        drop: Literal["oldest", "newest"] = "oldest",
+    ) -> None:
+        self.backend = backend
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop = drop
+        # number of writes dropped because the queue was full
+        self.dropped = 0
+        self._pending: "OrderedDict[str, _Write]" = OrderedDict()
+        # writes taken from the queue that the backend hasn't confirmed yet
+        self._writing: Dict[str, _Write] = {}
+        self._writer: Optional["asyncio.Task[None]"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._has_pending: Optional[asyncio.Event] = None
+
+    def _start(self) -> None:
+        loop = asyncio.get_event_loop()
+        writer = self._writer
+        if writer is not None and not writer.done() and self._loop is loop:
+            return
+        # (re)start the writer, also when the event loop has changed
+        self._loop = loop
+        self._has_pending = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        assert self._has_pending is not None  # noqa: S101
+        while True:
+            await self._has_pending.wait()
+            if len(self._pending) < self.batch_size:
+                # collect more writes into this batch
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            self._has_pending.clear()
+
+    def _queue(self, key: str, value: bytes, expire: Optional[int]) -> None:
+        if key in self._pending:
+            del self._pending[key]
+        elif len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            if self.drop == "newest":
+                return
+            self._pending.popitem(last=False)
+        self._pending[key] = (value, expire)
+        self._start()
+        assert self._has_pending is not None  # noqa: S101
+        self._has_pending.set()
+
+    def _queued(self, key: str) -> Optional[_Write]:
+        return self._pending.get(key) or self._writing.get(key)
+
+    def _discard(self, keys: Sequence[str]) -> List[str]:
+        """Drop queued writes to keys, return the keys that were queued"""
+        discarded: List[str] = []
+        for key in keys:
+            pending = self._pending.pop(key, None)
+            writing = self._writing.pop(key, None)
+            if pending is not None or writing is not None:
+                discarded.append(key)
+        return discarded
+
+    async def flush(self) -> None:
+        """Write all queued values"""
+        while self._pending:
+            batch: Dict[str, _Write] = {}
+            while self._pending and len(batch) < self.batch_size:
+                key, write = self._pending.popitem(last=False)
+                batch[key] = write
+            self._writing.update(batch)
+            # set_many takes a single expire for all keys
+            groups: Dict[Optional[int], Dict[str, bytes]] = defaultdict(dict)
+            for key, (value, expire) in batch.items():
+                groups[expire][key] = value
+            try:
+                await asyncio.gather(
+                    *(
+                        self.backend.set_many(items, expire)
+                        for expire, items in groups.items()
+                    )
+                )
+            except Exception:
+                logger.warning(
+                    f"Error writing {len(batch)} cache keys to backend:", exc_info=True
+                )
+            # when cancelled, the batch is left for close() to write
+            for key, write in batch.items():
+                if self._writing.get(key) is write:
+                    del self._writing[key]
+
+    async def close(self) -> None:
+        """Stop the background writer, and write all queued values"""
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        # a cancelled flush puts nothing back; retry what it was writing
+        for key, write in self._writing.items():
+            self._pending.setdefault(key, write)
+        self._writing.clear()
+        await self.flush()
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        queued = self._queued(key)
+        if queued is not None:
+            value, expire = queued
+            return expire or -1, value
+        return await self.backend.get_with_ttl(key)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        queued = self._queued(key)
+        if queued is not None:
+            return queued[0]
+        return await self.backend.get(key)
+
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        queued = self._queued(key)
+        if queued is not None:
+            value, expire = queued
+            return expire or -1, value[:size]
+        return await self.backend.get_head_with_ttl(key, size)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self._queue(key, value, expire)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values: Dict[str, Optional[bytes]] = {}
+        for key in keys:
+            queued = self._queued(key)
+            if queued is not None:
+                values[key] = queued[0]
+        missing = [key for key in keys if key not in values]
+        if missing:
+            values.update(zip(missing, await self.backend.get_many(missing)))
+        return [values[key] for key in keys]
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        for key, value in items.items():
+            self._queue(key, value, expire)
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        # queued keys count as deleted, whether or not they were written before
+        discarded = self._discard(keys)
+        if discarded:
+            await self.backend.delete_many(discarded)
+        others = [key for key in keys if key not in discarded]
+        count = await self.backend.delete_many(others) if others else 0
+        return len(discarded) + count
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        # counters (namespace generations) are written through
+        self._discard([key])
+        return await self.backend.incr(key, amount)
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        # tags are written through, so they are in place before the value is
+        await self.backend.add_tags(key, tags, expire)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        return await self.backend.get_tagged_keys(tags)
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        self._discard(await self.backend.get_tagged_keys(tags))
+        return await self.backend.invalidate_tags(tags)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            self._discard(
+                [k for k in (*self._pending, *self._writing) if k.startswith(namespace)]
+            )
+        elif key and self._discard([key]):
+            await self.backend.clear(key=key)
+            return 1
+        return await self.backend.clear(namespace, key)
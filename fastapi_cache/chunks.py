@@ -0,0 +1,142 @@
+"""Store large values and streamed bodies in fixed-size chunks
+
+Backends limit the size of a single value: 1 MB for memcached, 400 KB for a
+DynamoDB item. Large values are therefore stored as a manifest under the cache
+key, an envelope with an empty payload that lists the chunks, and the chunks
+themselves under separate keys::
+
+    <key>:<chunk id>:0, <key>:<chunk id>:1, ...
+
+The manifest stores the digest of the complete value, so ETags are the same as
+for values stored in one piece. Every value is written with a new random chunk
+id, so a reader of an older manifest never mixes in chunks of a newer value;
+the chunks of replaced values are left to expire. Chunks carry the tags of
+their manifest, and chunked entries always expire (after MAX_EXPIRE seconds if
+no expire time is set), so that chunks left behind by deleting or replacing a
+manifest don't stay in the backend forever.
+
+"""
+import asyncio
+import hashlib
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from fastapi_cache import envelope
+from fastapi_cache.envelope import DIGEST_SIZE
+from fastapi_cache.types import Backend
+
+# small enough for the item size limits of memcached and DynamoDB
+CHUNK_SIZE = 256 * 1024
+# expire time of chunked entries stored without one
+MAX_EXPIRE = 24 * 60 * 60
+# enough to hold the metadata of a manifest
+_MANIFEST_HEAD = 64 * 1024
+
+
+def chunk_keys(key: str, meta: Dict[str, Any]) -> List[str]:
+    """The keys of the chunks listed in a manifest"""
+    return [f"{key}:{meta['chunk_id']}:{index}" for index in range(meta["chunks"])]
+
+
+class ChunkWriter:
+    """Split a value that is written in parts into chunks"""
+
+    def __init__(self, key: str, chunk_size: int = CHUNK_SIZE) -> None:
+        self.key = key
+        self.chunk_size = chunk_size
+        self.chunk_id = uuid.uuid4().hex[:16]
+        self.chunks = 0
+        self.size = 0
+        self._buffer = bytearray()
+        self._hash = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    def _chunk(self, data: bytes) -> Tuple[str, bytes]:
+        key = f"{self.key}:{self.chunk_id}:{self.chunks}"
+        self.chunks += 1
+        return key, data
+
+    def write(self, data: bytes) -> Dict[str, bytes]:
+        """Add data, return the chunks that are complete"""
+        self.size += len(data)
+        self._hash.update(data)
+        self._buffer += data
+        size = self.chunk_size
+        if len(self._buffer) < size:
+            return {}
+        complete = len(self._buffer) // size * size
+        items = dict(
+            self._chunk(bytes(self._buffer[offset : offset + size]))
+            for offset in range(0, complete, size)
+        )
+        del self._buffer[:complete]
+        return items
+
+    def finish(self) -> Tuple[Dict[str, bytes], Dict[str, Any]]:
+        """Return the last chunk, if any, and the manifest metadata"""
+        items = dict([self._chunk(bytes(self._buffer))]) if self._buffer else {}
+        self._buffer.clear()
+        return items, {"chunks": self.chunks, "chunk_id": self.chunk_id, "size": self.size}
+
+    def digest(self) -> bytes:
+        """The digest of all data written"""
+        return self._hash.digest()
+
+
+def split(
+    key: str, payload: bytes, chunk_size: int = CHUNK_SIZE
+) -> Tuple[Dict[str, bytes], Dict[str, Any]]:
+    """The chunks of a payload, and the manifest metadata"""
+    writer = ChunkWriter(key, chunk_size)
+    items = writer.write(payload)
+    last, manifest = writer.finish()
+    items.update(last)
+    return items, manifest
+
+
+async def store(
+    backend: Backend,
+    items: Dict[str, bytes],
+    tags: Sequence[str],
+    expire: Optional[int],
+) -> None:
+    """Write chunks, tagged with the tags of their manifest"""
+    if tags:
+        await asyncio.gather(*(backend.add_tags(key, tags, expire) for key in items))
+    await backend.set_many(items, expire)
+
+
+async def delete(backend: Backend, key: str) -> int:
+    """Delete an entry, and its chunks if it is a manifest"""
+    _, head = await backend.get_head_with_ttl(key, _MANIFEST_HEAD)
+    if head is not None:
+        try:
+            _, meta = envelope.unpack(head)
+        except ValueError:
+            # not a manifest, its metadata doesn't fit in the head
+            meta = {}
+        if "chunks" in meta:
+            await backend.delete_many(chunk_keys(key, meta))
+    return await backend.clear(key=key)
+
+
+async def read(backend: Backend, key: str, meta: Dict[str, Any]) -> Optional[bytes]:
+    """The value of a manifest, or None if any of its chunks is missing"""
+    values = await backend.get_many(chunk_keys(key, meta))
+    if any(value is None for value in values):
+        return None
+    return b"".join(values)  # type: ignore[arg-type]
+
+
+async def iterate(
+    backend: Backend, key: str, meta: Dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """Read the chunks of a manifest one at a time
+
+    Raises LookupError if a chunk has expired or been evicted in the meantime.
+
+    """
+    for chunk_key in chunk_keys(key, meta):
+        value = await backend.get(chunk_key)
+        if value is None:
+            raise LookupError(f"Chunk '{chunk_key}' of a cached value is missing")
+        yield value
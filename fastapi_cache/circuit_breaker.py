@@ -0,0 +1,117 @@
+"""Bypass the cache while the backend is failing or slow
+
+A CircuitBreaker passed to `FastAPICache.init(backend, circuit_breaker=...)`
+applies timeouts to backend operations and counts failures and timeouts. After
+`failure_threshold` of them within `failure_window` seconds the circuit opens
+(successful operations in between don't reset the count, as e.g. reads may time
+out while writes still succeed): cached endpoints
+call the endpoint directly, without touching the backend. After `recovery_time`
+seconds the circuit is half-open, and a single request is let through as a
+probe; the circuit closes again if it succeeds, and opens for another
+`recovery_time` seconds if it fails.
+
+    >> breaker = CircuitBreaker(failure_threshold=5, recovery_time=30, get_timeout=0.05)
+    >> FastAPICache.init(backend, circuit_breaker=breaker)
+    >> breaker.state
+    'closed'
+
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Deque, Optional, TypeVar
+
+logger: logging.Logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """Timeouts for backend operations, and a circuit breaker around them"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_time: float = 30.0,
+        get_timeout: Optional[float] = None,
+        set_timeout: Optional[float] = None,
+        failure_window: float = 60.0,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failure_window = failure_window
+        self.timeouts = {"get": get_timeout, "set": set_timeout}
+        # times of the most recent failures
+        self._failures: Deque[float] = deque(maxlen=failure_threshold)
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """The state of the circuit: closed, open or half-open"""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.recovery_time:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a request may use the backend
+
+        In the half-open state, only one request at a time is let through; a
+        probe that never reports back is replaced after recovery_time seconds.
+
+        """
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at < self.recovery_time:
+            return False
+        probe = self._probe_started
+        if probe is not None and now - probe < self.recovery_time:
+            return False
+        self._probe_started = now
+        return True
+
+    def success(self) -> None:
+        # only the probe closes the circuit, not operations started before it
+        # opened
+        if self._probe_started is None:
+            return
+        logger.info("Cache backend recovered, closing the circuit")
+        self._failures.clear()
+        self._opened_at = self._probe_started = None
+
+    def failure(self) -> None:
+        now = time.monotonic()
+        self._failures.append(now)
+        if self._probe_started is not None or (
+            self._opened_at is None
+            and len(self._failures) == self.failure_threshold
+            and now - self._failures[0] <= self.failure_window
+        ):
+            logger.warning(
+                f"Cache backend failed {len(self._failures)} times, bypassing "
+                f"the cache for {self.recovery_time} seconds"
+            )
+            self._opened_at = now
+            self._probe_started = None
+
+    async def run(self, operation: str, awaitable: Awaitable[T]) -> T:
+        """Await a backend operation with its timeout, and record the outcome
+
+        Failures and timeouts are re-raised (timeouts as asyncio.TimeoutError).
+
+        """
+        timeout = self.timeouts.get(operation)
+        try:
+            if timeout is None:
+                result = await awaitable
+            else:
+                result = await asyncio.wait_for(awaitable, timeout)
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
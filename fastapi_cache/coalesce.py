@@ -0,0 +1,73 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Tuple
+
+
+class Coalescer:
+    """Coalesce concurrent computations for the same key into a single flight
+
+    The first caller for a key (the leader) runs the computation, every caller
+    that arrives while it is in flight waits for the leader instead and receives
+    the same result.
+
+    - If the leader raises an exception, that exception is raised in all
+      waiting callers too.
+    - If the leader is cancelled (e.g. because its client disconnected), the
+      waiting callers are not; one of them takes over the computation.
+
+    The `coalesced` attribute counts the callers that were served by another
+    caller's computation.
+
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[str, "asyncio.Future[bytes]"] = {}
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of computations currently in flight"""
+        return len(self._in_flight)
+
+    async def run(
+        self, key: str, func: Callable[[], Awaitable[bytes]]
+    ) -> Tuple[bool, bytes]:
+        """Run func for key, or wait for the computation already in flight
+
+        Returns a (leader, value) tuple; leader is True if func was run by
+        this caller.
+
+        """
+        counted = False
+        while key in self._in_flight:
+            future = self._in_flight[key]
+            if not counted:
+                self.coalesced += 1
+                counted = True
+            try:
+                return False, await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # this caller was cancelled, not the leader
+                    raise
+                # the leader was cancelled; try to take over.
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # mark the exception as retrieved, there may not be any waiters
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._in_flight[key]
+        return True, value
+
+
+default_coalescer = Coalescer()
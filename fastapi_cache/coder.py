@@ -1,6 +1,9 @@
 import datetime
+import gzip
 import json
+import lzma
 import pickle  # nosec:B403
+import zlib
 from decimal import Decimal
 from typing import (
     Any,
@@ -8,6 +11,7 @@ from typing import (
     ClassVar,
     Dict,
     Optional,
+    Type,
     TypeVar,
     Union,
     overload,
@@ -20,6 +24,7 @@ from starlette.responses import JSONResponse
 from starlette.templating import (
     _TemplateResponse as TemplateResponse,  # pyright: ignore[reportPrivateUsage]
 )
+from typing_extensions import Literal
 
 _T = TypeVar("_T", bound=type)
 
@@ -55,6 +60,12 @@ def object_hook(obj: Any) -> Any:
         raise TypeError(f"Unknown {_spec_type}")
 
 
+# json.dumps() and json.loads() create a new encoder or decoder for every call
+# with non-default options; these are reused instead.
+_json_encoder = JsonEncoder()
+_json_decoder = json.JSONDecoder(object_hook=object_hook)
+
+
 class Coder:
     @classmethod
     def encode(cls, value: Any) -> bytes:
@@ -109,14 +120,14 @@ class JsonCoder(Coder):
     def encode(cls, value: Any) -> bytes:
         if isinstance(value, JSONResponse):
             return value.body
-        return json.dumps(value, cls=JsonEncoder).encode()
+        return _json_encoder.encode(value).encode()
 
     @classmethod
     def decode(cls, value: bytes) -> Any:
         # explicitly decode from UTF-8 bytes first, as otherwise
         # json.loads() will first have to detect the correct UTF-
         # encoding used.
-        return json.loads(value.decode(), object_hook=object_hook)
+        return _json_decoder.decode(value.decode())
 
 
 class PickleCoder(Coder):
@@ -136,3 +147,89 @@ class PickleCoder(Coder):
         # in paying an extra performance penalty for pydantic to discover
         # the same.
         return cls.decode(value)
+
+
+Algorithm = Literal["zlib", "gzip", "lzma"]
+
+# Compressed payloads are tagged with a single byte; none of these can start
+# a JSON or pickle payload, so payloads without a tag are passed through as is.
+_UNCOMPRESSED = b"\x00"
+_TAGS: Dict[str, bytes] = {"zlib": b"z", "gzip": b"g", "lzma": b"x"}
+_DECOMPRESSORS: Dict[bytes, Callable[[bytes], bytes]] = {
+    b"z": zlib.decompress,
+    b"g": gzip.decompress,
+    b"x": lzma.decompress,
+}
+
+
+class CompressedCoder(Coder):
+    """Compress the payloads of another coder
+
+    Payloads of at least `threshold` bytes are compressed with the configured
+    algorithm, and tagged so they are decompressed transparently. Use the
+    `compressed()` function to create a compressed version of a coder.
+
+    """
+
+    coder: ClassVar[Type[Coder]] = JsonCoder
+    algorithm: ClassVar[Algorithm] = "gzip"
+    threshold: ClassVar[int] = 1024
+    level: ClassVar[Optional[int]] = None
+
+    @classmethod
+    def compress(cls, value: bytes) -> bytes:
+        if len(value) < cls.threshold:
+            return _UNCOMPRESSED + value
+        if cls.algorithm == "zlib":
+            data = zlib.compress(value, -1 if cls.level is None else cls.level)
+        elif cls.algorithm == "gzip":
+            data = gzip.compress(value, 9 if cls.level is None else cls.level)
+        else:
+            data = lzma.compress(value, preset=cls.level)
+        return _TAGS[cls.algorithm] + data
+
+    @classmethod
+    def decompress(cls, value: bytes) -> bytes:
+        tag = value[:1]
+        if tag == _UNCOMPRESSED:
+            return value[1:]
+        if tag in _DECOMPRESSORS:
+            return _DECOMPRESSORS[tag](value[1:])
+        return value
+
+    @classmethod
+    def is_gzip(cls, value: bytes) -> bool:
+        """Check if value is tagged as gzip data, which can be served as-is"""
+        return value[:1] == _TAGS["gzip"]
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        return cls.compress(cls.coder.encode(value))
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return cls.coder.decode(cls.decompress(value))
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Optional[_T]) -> Any:
+        return cls.coder.decode_as_type(cls.decompress(value), type_=type_)
+
+
+def compressed(
+    coder: Type[Coder],
+    algorithm: Algorithm = "gzip",
+    threshold: int = 1024,
+    level: Optional[int] = None,
+) -> Type[CompressedCoder]:
+    """Create a coder that compresses the payloads of the given coder
+
+    E.g. `@cache(coder=compressed(JsonCoder, "zlib"))`.
+
+    """
+    if algorithm not in _TAGS:
+        raise ValueError(f"Unknown compression algorithm {algorithm!r}")
+    return type(
+        f"Compressed{coder.__name__}",
+        (CompressedCoder,),
+        {"coder": coder, "algorithm": algorithm, "threshold": threshold, "level": level},
+    )
@@ -1,12 +1,36 @@
+import asyncio
 import logging
+import math
+import random
 import sys
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
 from functools import wraps
-from inspect import Parameter, Signature, isawaitable, iscoroutinefunction
+from inspect import (
+    Parameter,
+    Signature,
+    isasyncgenfunction,
+    isawaitable,
+    iscoroutinefunction,
+    isgeneratorfunction,
+)
+from string import Formatter
 from typing import (
+    Any,
+    AsyncIterator,
     Awaitable,
     Callable,
+    ContextManager,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
     List,
+    Mapping,
     Optional,
+    Sequence,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -18,23 +42,37 @@ if sys.version_info >= (3, 10):
 else:
     from typing_extensions import ParamSpec
 
+from fastapi import BackgroundTasks, params
 from fastapi.concurrency import run_in_threadpool
+from fastapi.datastructures import DefaultPlaceholder
 from fastapi.dependencies.utils import (
     get_typed_return_annotation,
     get_typed_signature,
 )
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import FastAPIError, HTTPException
+from fastapi.routing import APIRoute, serialize_response
+from fastapi.utils import create_response_field
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.status import HTTP_304_NOT_MODIFIED
+from typing_extensions import Annotated, get_args, get_origin
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.coder import Coder
-from fastapi_cache.types import KeyBuilder
+from fastapi_cache import FastAPICache, chunks, envelope, profiling
+from fastapi_cache.circuit_breaker import CircuitBreaker
+from fastapi_cache.coalesce import Coalescer, default_coalescer
+from fastapi_cache.coder import Coder, CompressedCoder
+from fastapi_cache.key_builder import CanonicalKeyBuilder
+from fastapi_cache.metrics import EndpointMetrics
+from fastapi_cache.profiling import Profile, ProfilingHook
+from fastapi_cache.types import Backend, KeyBuilder
 
 logger: logging.Logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 P = ParamSpec("P")
 R = TypeVar("R")
+T = TypeVar("T")
 
 
 def _augment_signature(signature: Signature, *extra: Parameter) -> Signature:
@@ -49,6 +87,33 @@ def _augment_signature(signature: Signature, *extra: Parameter) -> Signature:
     return signature.replace(parameters=[*parameters, *extra, *variadic_keyword_params])
 
 
+def _request_scoped(sig: Signature) -> List[str]:
+    """Parameters that are only valid while the request is handled
+
+    The request and response objects, background tasks, and dependencies with
+    yield, which FastAPI tears down once the response has been sent.
+
+    """
+    names: List[str] = []
+    for param in sig.parameters.values():
+        annotation, default = param.annotation, param.default
+        if get_origin(annotation) is Annotated:
+            annotation, *metadata = get_args(annotation)
+            default = next(
+                (m for m in metadata if isinstance(m, params.Depends)), default
+            )
+        if isinstance(annotation, type) and issubclass(
+            annotation, (Request, Response, BackgroundTasks)
+        ):
+            names.append(param.name)
+        elif isinstance(default, params.Depends) and (
+            isgeneratorfunction(default.dependency)
+            or isasyncgenfunction(default.dependency)
+        ):
+            names.append(param.name)
+    return names
+
+
 def _locate_param(
     sig: Signature, dep: Parameter, to_inject: List[Parameter]
 ) -> Parameter:
@@ -84,12 +149,355 @@ def _uncacheable(request: Optional[Request]) -> bool:
     return request.headers.get("Cache-Control") in ("no-store", "no-cache")
 
 
+def _return_field(return_type: Any) -> Any:
+    """A field to validate results with, as FastAPI does for the return annotation"""
+    if return_type is None or (
+        isinstance(return_type, type) and issubclass(return_type, Response)
+    ):
+        return None
+    try:
+        return create_response_field(name="response", type_=return_type)
+    except FastAPIError:
+        return None
+
+
+async def _render(value: Any, request: Optional[Request], return_field: Any) -> Response:
+    """Render value the way FastAPI renders the result of the endpoint
+
+    For a request to a route, the response model of the route (by default the
+    return annotation) filters and serializes the value, and the response class
+    and status code of the route are used. Otherwise, the value is validated
+    against the return annotation.
+
+    """
+    route = request.scope.get("route") if request is not None else None
+    if not isinstance(route, APIRoute):
+        return JSONResponse(
+            await serialize_response(field=return_field, response_content=value)
+        )
+    content = await serialize_response(
+        field=route.response_field,
+        response_content=value,
+        include=route.response_model_include,
+        exclude=route.response_model_exclude,
+        by_alias=route.response_model_by_alias,
+        exclude_unset=route.response_model_exclude_unset,
+        exclude_defaults=route.response_model_exclude_defaults,
+        exclude_none=route.response_model_exclude_none,
+    )
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    if route.status_code is not None:
+        return response_class(content, status_code=route.status_code)
+    return response_class(content)
+
+
+async def _response_payload(
+    value: Any, coder: Type[Coder], request: Optional[Request], return_field: Any
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Render value as a response, return the body and what's needed to replay it
+
+    Values that are not responses are rendered the same way FastAPI does, through
+    the response model, so that a hit never serves fields the model leaves out.
+    The body is compressed if the coder is a compressed coder.
+
+    """
+    if not isinstance(value, Response):
+        value = await _render(value, request, return_field)
+    body = getattr(value, "body", None)
+    if body is None:
+        raise TypeError(f"Can't cache the body of {type(value).__name__}")
+    headers = [
+        (name.decode("latin-1"), header.decode("latin-1"))
+        for name, header in value.raw_headers
+        if name != b"content-length"
+    ]
+    if issubclass(coder, CompressedCoder):
+        body = coder.compress(body)
+    return body, {"status": value.status_code, "headers": headers}
+
+
+def _accepts_gzip(request: Optional[Request]) -> bool:
+    if request is None:
+        return False
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            params = params.replace(" ", "")
+            try:
+                return not params.startswith("q=") or float(params[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _replay_response(
+    body: bytes, meta: Dict[str, Any], coder: Type[Coder], request: Optional[Request]
+) -> Response:
+    extra_headers: List[Tuple[bytes, bytes]] = []
+    if issubclass(coder, CompressedCoder):
+        if coder.is_gzip(body):
+            extra_headers.append((b"vary", b"Accept-Encoding"))
+        if coder.is_gzip(body) and _accepts_gzip(request):
+            # serve the compressed body as-is
+            body = body[1:]
+            extra_headers.append((b"content-encoding", b"gzip"))
+        else:
+            body = coder.decompress(body)
+    response = Response(body, status_code=meta.get("status", 200))
+    response.raw_headers.extend(
+        (name.encode("latin-1"), header.encode("latin-1"))
+        for name, header in meta["headers"]
+    )
+    response.raw_headers.extend(extra_headers)
+    return response
+
+
+def _etag(value: bytes, payload: bytes) -> str:
+    """The ETag of a cached value
+
+    Values cached by older versions don't store a digest; it is computed from
+    the payload instead.
+
+    """
+    return f'W/"{envelope.stored_digest(value) or envelope.digest(payload)}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Compare an If-None-Match header with an ETag, using weak comparison"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _recompute_early(ttl: int, delta: float, beta: float) -> bool:
+    """Decide if a cached value should be recomputed before it expires
+
+    Implements probabilistic early expiration (XFetch, as described in
+    "Optimal Probabilistic Cache Stampede Prevention" by Vattani et al.); the
+    probability of recomputing rises exponentially as the expiry time
+    approaches, scaled by the time it took to compute the value (delta) and
+    beta. Because each worker decides independently, recomputation is spread
+    out instead of all workers missing at the same time.
+
+    """
+    return -delta * beta * math.log(1.0 - random.random()) >= ttl  # noqa: S311
+
+
+@dataclass(frozen=True)
+class _EndpointConfig:
+    """The settings of a decorated function, resolved against the global settings
+
+    Resolved on the first call, and again after FastAPICache.init() or reset(),
+    so calls don't have to look up each setting.
+
+    """
+
+    version: int
+    backend: Backend
+    coder: Type[Coder]
+    expire: Optional[int]
+    key_builder: KeyBuilder
+    cache_status_header: str
+    # None with versioned namespaces, which are looked up on every call
+    namespace: Optional[str]
+    # seconds entries are kept beyond expire for stale-while-revalidate
+    grace: int
+    store_expire: Optional[int]
+    # for cached errors and empty results
+    negative_expire: Optional[int]
+    negative_store_expire: Optional[int]
+    # None unless a metrics sink is configured
+    metrics: Optional[EndpointMetrics]
+    profiling_hooks: Sequence[ProfilingHook]
+    circuit_breaker: Optional[CircuitBreaker]
+
+    @classmethod
+    def resolve(
+        cls,
+        coder: Optional[Type[Coder]],
+        expire: Optional[int],
+        key_builder: Optional[KeyBuilder],
+        namespace: str,
+        stale_while_revalidate: Optional[int] = None,
+        negative_expire: Optional[int] = None,
+    ) -> "_EndpointConfig":
+        expire = expire or FastAPICache.get_expire()
+        grace = (stale_while_revalidate or 0) if expire else 0
+        negative_expire = negative_expire or expire
+        backend = FastAPICache.get_backend()
+        sink = FastAPICache.get_metrics()
+        return cls(
+            version=FastAPICache.get_config_version(),
+            backend=backend,
+            coder=coder or FastAPICache.get_coder(),
+            expire=expire,
+            key_builder=key_builder or FastAPICache.get_key_builder(),
+            cache_status_header=FastAPICache.get_cache_status_header(),
+            namespace=(
+                None
+                if FastAPICache.get_versioned_namespaces()
+                else f"{FastAPICache.get_prefix()}:{namespace}"
+            ),
+            grace=grace,
+            store_expire=expire + grace if expire else expire,
+            negative_expire=negative_expire,
+            negative_store_expire=(
+                negative_expire + grace if negative_expire else negative_expire
+            ),
+            metrics=(
+                EndpointMetrics(sink, namespace, type(backend).__name__) if sink else None
+            ),
+            profiling_hooks=FastAPICache.get_profiling_hooks(),
+            circuit_breaker=FastAPICache.get_circuit_breaker(),
+        )
+
+
+def _ensure_async(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """Run cached sync functions in thread pool just like FastAPI."""
+    if iscoroutinefunction(func):
+        return func
+
+    async def run(*args: P.args, **kwargs: P.kwargs) -> R:
+        return await run_in_threadpool(func, *args, **kwargs)  # type: ignore[arg-type]
+
+    return run
+
+
+def _with_headers(
+    result: Any,
+    response: Optional[Response],
+    headers: Dict[str, str],
+    raw_response: bool,
+) -> Any:
+    if isinstance(result, Response) and raw_response:
+        # FastAPI ignores the headers of the injected response when the
+        # endpoint returns a response object.
+        result.headers.update(headers)
+    elif response:
+        response.headers.update(headers)
+    return result
+
+
+def _guard(
+    breaker: Optional[CircuitBreaker], operation: str, awaitable: Awaitable[T]
+) -> Awaitable[T]:
+    """Run a backend operation through the circuit breaker, if there is one"""
+    return breaker.run(operation, awaitable) if breaker else awaitable
+
+
+_unprofiled = nullcontext()
+
+
+def _phase(profile: Optional[Profile], name: str) -> ContextManager[Any]:
+    return profile.phase(name) if profile else _unprofiled
+
+
+Tags = Union[Sequence[str], Callable[..., Iterable[str]]]
+CacheErrors = Sequence[Union[int, Type[Exception]]]
+
+
+def _type_name(type_: type) -> str:
+    return f"{type_.__module__}.{type_.__qualname__}"
+
+
+def _error_meta(
+    exc: Exception,
+    statuses: FrozenSet[int],
+    types: Dict[str, Type[Exception]],
+) -> Optional[Dict[str, Any]]:
+    """What is needed to raise an exception again, if it is to be cached
+
+    HTTP exceptions are cached by status code (or if their type is listed) and
+    replayed as an HTTPException with the same status, detail and headers. Other
+    exceptions are cached if their type is listed, and replayed by calling the
+    type with the same arguments.
+
+    """
+    if isinstance(exc, StarletteHTTPException):
+        if exc.status_code not in statuses and _type_name(type(exc)) not in types:
+            return None
+        return {
+            "status": exc.status_code,
+            "detail": jsonable_encoder(exc.detail),
+            "headers": getattr(exc, "headers", None),
+        }
+    if _type_name(type(exc)) not in types:
+        return None
+    return {"type": _type_name(type(exc)), "args": jsonable_encoder(exc.args)}
+
+
+def _replay_error(
+    error: Dict[str, Any],
+    types: Dict[str, Type[Exception]],
+    headers: Dict[str, str],
+) -> Exception:
+    if "status" in error:
+        return HTTPException(
+            error["status"],
+            detail=error["detail"],
+            headers={**(error["headers"] or {}), **headers},
+        )
+    return types[error["type"]](*error["args"])
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or (
+        isinstance(value, (str, bytes, list, tuple, dict, set, frozenset)) and not value
+    )
+
+
+def _check_tags(tags: Tags, signature: Signature, func: Callable[..., Any]) -> None:
+    """Raise for static tags that refer to arguments the endpoint doesn't have"""
+    if callable(tags):
+        return
+    for tag in tags:
+        for _, field, _, _ in Formatter().parse(tag):
+            if field is None:
+                continue
+            # the argument of e.g. "{product.sku}" or "{skus[0]}"
+            name = field.split(".", 1)[0].split("[", 1)[0]
+            if name not in signature.parameters:
+                raise ValueError(
+                    f"Tag {tag!r} of {func.__module__}.{func.__qualname__} refers to "
+                    f"{name!r}, which is not one of its parameters"
+                )
+
+
+def _format_tags(
+    tags: Tags, signature: Signature, args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> List[str]:
+    """Tags for a call; static tags are formatted with the call arguments"""
+    if callable(tags):
+        return list(tags(*args, **kwargs))
+    bound = signature.bind_partial(*args, **kwargs)
+    bound.apply_defaults()
+    return [tag.format(**bound.arguments) for tag in tags]
+
+
 def cache(
     expire: Optional[int] = None,
     coder: Optional[Type[Coder]] = None,
     key_builder: Optional[KeyBuilder] = None,
     namespace: str = "",
     injected_dependency_namespace: str = "__fastapi_cache",
+    coalesce: Union[bool, Coalescer] = False,
+    stale_while_revalidate: Optional[int] = None,
+    early_recompute_beta: Optional[float] = None,
+    raw_response: bool = False,
+    tags: Optional[Tags] = None,
+    profile: bool = False,
+    cache_errors: CacheErrors = (),
+    negative_expire: Optional[int] = None,
+    chunk_size: Optional[int] = None,
 ) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[Union[R, Response]]]]:
     """
     cache all function
@@ -97,9 +505,47 @@ def cache(
     :param expire:
     :param coder:
     :param key_builder:
+    :param coalesce: let concurrent misses for the same key wait for a single
+        computation; pass a Coalescer instance to use instead of the default one.
+    :param stale_while_revalidate: number of seconds past expire during which
+        the stale value is still returned, while it is refreshed in the background.
+        The refresh calls the endpoint with the arguments of the request that
+        found the stale value, after its response has been sent; endpoints
+        that take the request or response, or dependencies with yield, can't
+        be refreshed reliably, and a warning is logged for them.
+    :param early_recompute_beta: recompute values probabilistically before they
+        expire, based on how long they took to compute. 1.0 is a good default,
+        larger values favour earlier recomputation.
+    :param raw_response: cache the rendered response body and headers, and
+        replay those on a hit instead of decoding and validating the cached
+        value and serializing it again. With a gzip compressed coder, the
+        compressed body is served as-is to clients that accept gzip.
+    :param tags: tags for the cached entries, so they can be removed with
+        FastAPICache.invalidate_tags(). Either strings, formatted with the
+        arguments of the endpoint (e.g. "product:{sku}"; a ValueError is raised
+        when decorating an endpoint without such an argument), or a callable
+        that is passed the arguments of the endpoint and returns the tags.
+    :param profile: time each phase of a call (building the key, reading,
+        decoding, calling the endpoint, encoding and writing) separately, report
+        the timings in a Server-Timing header and call the profiling hooks
+        passed to FastAPICache.init() for each phase.
+    :param cache_errors: HTTP status codes and exception types to cache. An
+        HTTPException with a listed status code, a response returned with a
+        listed status code, or an exception of exactly a listed type is cached,
+        and raised or returned again on a hit.
+    :param negative_expire: expire time for cached errors and for empty results
+        (None, or an empty string or collection); defaults to expire.
+    :param chunk_size: store cached values larger than this many bytes in
+        chunks of this size. Streaming responses are always stored in chunks
+        (of 256 KiB by default) while they are sent, and replayed lazily.
 
     :return:
     """
+    coalescer: Optional[Coalescer] = None
+    if isinstance(coalesce, Coalescer):
+        coalescer = coalesce
+    elif coalesce:
+        coalescer = default_coalescer
 
     injected_request = Parameter(
         name=f"{injected_dependency_namespace}_request",
@@ -111,6 +557,10 @@ def cache(
         annotation=Response,
         kind=Parameter.KEYWORD_ONLY,
     )
+    error_statuses = frozenset(e for e in cache_errors if isinstance(e, int))
+    error_types = {
+        _type_name(e): e for e in cache_errors if not isinstance(e, int)
+    }
 
     def wrapper(
         func: Callable[P, Awaitable[R]]
@@ -120,108 +570,759 @@ def cache(
         to_inject: List[Parameter] = []
         request_param = _locate_param(wrapped_signature, injected_request, to_inject)
         response_param = _locate_param(wrapped_signature, injected_response, to_inject)
+        # request and response parameters of the endpoint itself; these are not
+        # passed to the key builder
+        declared = tuple(
+            p.name for p in (request_param, response_param) if p not in to_inject
+        )
+        if stale_while_revalidate:
+            scoped = _request_scoped(wrapped_signature)
+            if scoped:
+                logger.warning(
+                    f"{func.__module__}.{func.__qualname__} uses stale_while_revalidate, "
+                    "but the background refresh calls it after the response has been "
+                    f"sent, when its parameters {', '.join(scoped)} are no longer "
+                    "valid; these refreshes are likely to fail"
+                )
+        if tags:
+            _check_tags(tags, wrapped_signature, func)
         return_type = get_typed_return_annotation(func)
+        return_field = _return_field(return_type) if raw_response else None
+        call = _ensure_async(func)
+        config: Optional[_EndpointConfig] = None
+        attributes = {
+            "namespace": namespace,
+            "endpoint": f"{func.__module__}:{func.__qualname__}",
+        }
+        # background revalidation tasks, by cache key
+        revalidating: Dict[str, "asyncio.Task[None]"] = {}
+
+        def decode(
+            cfg: _EndpointConfig,
+            cache_key: str,
+            payload: bytes,
+            meta: Dict[str, Any],
+            request: Optional[Request],
+            phases: Optional[Profile],
+        ) -> Any:
+            metrics = cfg.metrics
+            start = time.perf_counter() if metrics else 0
+            with _phase(phases, profiling.DECODE):
+                if "stream" in meta:
+                    result: Any = StreamingResponse(
+                        chunks.iterate(cfg.backend, cache_key, meta),
+                        status_code=meta["status"],
+                    )
+                    result.raw_headers.extend(
+                        (name.encode("latin-1"), value.encode("latin-1"))
+                        for name, value in meta["headers"]
+                    )
+                # error responses are cached as raw responses
+                elif "headers" in meta and (raw_response or "negative" in meta):
+                    result = _replay_response(payload, meta, cfg.coder, request)
+                else:
+                    result = cfg.coder.decode_as_type(payload, type_=return_type)
+            if metrics:
+                metrics.coder("decode", time.perf_counter() - start)
+            return result
+
+        def tee(
+            cfg: _EndpointConfig,
+            cache_key: str,
+            response: StreamingResponse,
+            tag_keys: List[str],
+            start: float,
+        ) -> None:
+            """Cache the body of a streaming response in chunks, while it is sent
+
+            The manifest is only stored once the whole body has been sent, so
+            an interrupted stream leaves no entry behind.
+
+            """
+            metrics = cfg.metrics
+            writer = chunks.ChunkWriter(cache_key, chunk_size or chunks.CHUNK_SIZE)
+            expire = cfg.store_expire or chunks.MAX_EXPIRE
+            body = response.body_iterator
+            # before the cache headers are added
+            headers = [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in response.raw_headers
+                if name != b"content-length"
+            ]
+
+            async def save(store: Awaitable[None]) -> bool:
+                try:
+                    await _guard(cfg.circuit_breaker, "set", store)
+                except Exception:
+                    logger.warning(
+                        f"Error setting cache key '{cache_key}' in backend:",
+                        exc_info=True,
+                    )
+                    if metrics:
+                        metrics.error("set")
+                    return False
+                return True
+
+            async def store(to_cache: bytes) -> None:
+                # tag first, so an entry never exists without its tags
+                if tag_keys:
+                    await cfg.backend.add_tags(cache_key, tag_keys, expire)
+                await cfg.backend.set(cache_key, to_cache, expire)
+
+            async def iterate() -> AsyncIterator[Union[str, bytes]]:
+                saving = True
+                async for data in body:
+                    yield data
+                    if saving:
+                        if isinstance(data, str):
+                            data = data.encode(response.charset)
+                        items = writer.write(data)
+                        if items:
+                            saving = await save(
+                                chunks.store(cfg.backend, items, tag_keys, expire)
+                            )
+                if not saving:
+                    return
+                items, manifest = writer.finish()
+                if items and not await save(
+                    chunks.store(cfg.backend, items, tag_keys, expire)
+                ):
+                    return
+                to_cache = envelope.pack(
+                    b"",
+                    payload_digest=writer.digest(),
+                    status=response.status_code,
+                    headers=headers,
+                    stream=1,
+                    delta=round(time.monotonic() - start, 6),
+                    **manifest,
+                )
+                if await save(store(to_cache)) and metrics:
+                    metrics.payload("set", writer.size)
+
+            response.body_iterator = iterate()
+
+        async def fill(
+            cfg: _EndpointConfig,
+            cache_key: str,
+            args: Tuple[Any, ...],
+            kwargs: Dict[str, Any],
+            request: Optional[Request],
+            phases: Optional[Profile],
+        ) -> Tuple[Any, bytes]:
+            """Call the endpoint and cache the result, return it and the cached value"""
+            metrics = cfg.metrics
+            start = time.monotonic()
+            result: Any = None
+            error: Optional[Dict[str, Any]] = None
+            exception: Optional[Exception] = None
+            try:
+                with _phase(phases, profiling.ENDPOINT):
+                    result = await call(*args, **kwargs)
+            except Exception as exc:
+                error = _error_meta(exc, error_statuses, error_types)
+                if error is None:
+                    raise
+                exception = exc
+            tag_keys = (
+                [
+                    FastAPICache.get_tag_key(tag)
+                    for tag in _format_tags(tags, wrapped_signature, args, kwargs)
+                ]
+                if tags
+                else []
+            )
+            if error is None and isinstance(result, StreamingResponse):
+                tee(cfg, cache_key, result, tag_keys, start)
+                # the stream is cached once it has been sent
+                return result, envelope.pack(b"", stream=1)
+            encode_start = time.perf_counter() if metrics else 0
+            meta: Dict[str, Any]
+            with _phase(phases, profiling.ENCODE):
+                if error is not None:
+                    payload, meta = b"", {"error": error, "negative": 1}
+                elif raw_response or (
+                    isinstance(result, Response) and result.status_code in error_statuses
+                ):
+                    payload, meta = await _response_payload(
+                        result, cfg.coder, request, return_field
+                    )
+                    if meta["status"] in error_statuses:
+                        meta["negative"] = 1
+                else:
+                    payload, meta = cfg.coder.encode(result), {}
+                    if negative_expire and _is_empty(result):
+                        meta["negative"] = 1
+                # time to recompute, for probabilistic early expiration
+                meta["delta"] = round(time.monotonic() - start, 6)
+                to_cache = envelope.pack(payload, **meta)
+            negative = "negative" in meta
+            store_expire = cfg.negative_store_expire if negative else cfg.store_expire
+            if metrics:
+                metrics.coder("encode", time.perf_counter() - encode_start)
+                metrics.payload("set", len(to_cache))
+                if negative:
+                    metrics.negative_store()
+            stored = to_cache
+            chunk_items: Dict[str, bytes] = {}
+            if chunk_size and len(payload) > chunk_size and not negative:
+                chunk_items, manifest = chunks.split(cache_key, payload, chunk_size)
+                stored = envelope.pack(
+                    b"",
+                    payload_digest=to_cache[len(envelope.MAGIC) : envelope.HEAD_SIZE],
+                    **meta,
+                    **manifest,
+                )
+                store_expire = store_expire or chunks.MAX_EXPIRE
+
+            async def store() -> None:
+                # tag first, so an entry never exists without its tags, and
+                # write the chunks before the manifest that lists them
+                if tag_keys:
+                    await cfg.backend.add_tags(cache_key, tag_keys, store_expire)
+                if chunk_items:
+                    await chunks.store(cfg.backend, chunk_items, tag_keys, store_expire)
+                await cfg.backend.set(cache_key, stored, store_expire)
+
+            set_start = time.perf_counter() if metrics else 0
+            try:
+                with _phase(phases, profiling.SET):
+                    await _guard(cfg.circuit_breaker, "set", store())
+            except Exception:
+                logger.warning(
+                    f"Error setting cache key '{cache_key}' in backend:",
+                    exc_info=True,
+                )
+                if metrics:
+                    metrics.error("set")
+            else:
+                if metrics:
+                    metrics.backend("set", time.perf_counter() - set_start)
+            # a cached exception is raised by the caller
+            return (exception if error is not None else result), to_cache
+
+        async def read_chunks(
+            cfg: _EndpointConfig, cache_key: str, meta: Dict[str, Any]
+        ) -> Optional[bytes]:
+            """The value of a chunked entry, None if it can't be read completely"""
+            try:
+                return await _guard(
+                    cfg.circuit_breaker, "get", chunks.read(cfg.backend, cache_key, meta)
+                )
+            except Exception:
+                logger.warning(
+                    f"Error retrieving the chunks of cache key '{cache_key}' from backend:",
+                    exc_info=True,
+                )
+                if cfg.metrics:
+                    cfg.metrics.error("get")
+                return None
+
+        async def match_etag(
+            cfg: _EndpointConfig,
+            cache_key: str,
+            if_none_match: str,
+            phases: Optional[Profile],
+        ) -> Optional[Dict[str, str]]:
+            """The headers of a 304 response, if the cached ETag matches
+
+            Only the head of the cached value, with its ETag, is read.
+
+            """
+            metrics = cfg.metrics
+            start = time.perf_counter() if metrics else 0
+            try:
+                with _phase(phases, profiling.GET):
+                    ttl, head = await _guard(
+                        cfg.circuit_breaker,
+                        "get",
+                        cfg.backend.get_head_with_ttl(cache_key, envelope.HEAD_SIZE),
+                    )
+            except Exception:
+                logger.warning(
+                    f"Error retrieving cache key '{cache_key}' from backend:",
+                    exc_info=True,
+                )
+                if metrics:
+                    metrics.error("get")
+                return None
+            if metrics:
+                metrics.backend("get", time.perf_counter() - start)
+
+            digest = envelope.stored_digest(head) if head is not None else None
+            if cfg.grace and ttl >= 0:
+                ttl -= cfg.grace
+            etag = f'W/"{digest}"'
+            if (
+                digest is None
+                or (cfg.grace and ttl <= 0)
+                or not _etag_matches(if_none_match, etag)
+            ):
+                return None
+            if metrics:
+                metrics.hit()
+                metrics.payload("get", envelope.HEAD_SIZE)
+            return {
+                "Cache-Control": f"max-age={ttl}",
+                "ETag": etag,
+                cfg.cache_status_header: "HIT",
+            }
 
         @wraps(func)
         async def inner(*args: P.args, **kwargs: P.kwargs) -> Union[R, Response]:
-            nonlocal coder
-            nonlocal expire
-            nonlocal key_builder
-
-            async def ensure_async_func(*args: P.args, **kwargs: P.kwargs) -> R:
-                """Run cached sync functions in thread pool just like FastAPI."""
-                # if the wrapped function does NOT have request or response in
-                # its function signature, make sure we don't pass them in as
-                # keyword arguments
-                kwargs.pop(injected_request.name, None)
-                kwargs.pop(injected_response.name, None)
-
-                if iscoroutinefunction(func):
-                    # async, return as is.
-                    # unintuitively, we have to await once here, so that caller
-                    # does not have to await twice. See
-                    # https://stackoverflow.com/a/59268198/532513
-                    return await func(*args, **kwargs)
-                else:
-                    # sync, wrap in thread and return async
-                    # see above why we have to await even although caller also awaits.
-                    return await run_in_threadpool(func, *args, **kwargs)  # type: ignore[arg-type]
+            nonlocal config
 
-            copy_kwargs = kwargs.copy()
-            request: Optional[Request] = copy_kwargs.pop(request_param.name, None)  # type: ignore[assignment]
-            response: Optional[Response] = copy_kwargs.pop(response_param.name, None)  # type: ignore[assignment]
+            # the injected dependencies are not passed on to the endpoint
+            request: Optional[Request]
+            response: Optional[Response]
+            if request_param is injected_request:
+                request = kwargs.pop(request_param.name, None)  # type: ignore[assignment]
+            else:
+                request = kwargs.get(request_param.name)  # type: ignore[assignment]
+            if response_param is injected_response:
+                response = kwargs.pop(response_param.name, None)  # type: ignore[assignment]
+            else:
+                response = kwargs.get(response_param.name)  # type: ignore[assignment]
 
             if _uncacheable(request):
-                return await ensure_async_func(*args, **kwargs)
+                return await call(*args, **kwargs)
 
-            prefix = FastAPICache.get_prefix()
-            coder = coder or FastAPICache.get_coder()
-            expire = expire or FastAPICache.get_expire()
-            key_builder = key_builder or FastAPICache.get_key_builder()
-            backend = FastAPICache.get_backend()
-            cache_status_header = FastAPICache.get_cache_status_header()
+            cfg = config
+            if cfg is None or cfg.version != FastAPICache.get_config_version():
+                cfg = config = _EndpointConfig.resolve(
+                    coder,
+                    expire,
+                    key_builder,
+                    namespace,
+                    stale_while_revalidate,
+                    negative_expire,
+                )
+            if cfg.circuit_breaker and not cfg.circuit_breaker.allow():
+                return await call(*args, **kwargs)
 
-            cache_key = key_builder(
-                func,
-                f"{prefix}:{namespace}",
-                request=request,
-                response=response,
-                args=args,
-                kwargs=copy_kwargs,
-            )
-            if isawaitable(cache_key):
-                cache_key = await cache_key
+            cache_namespace = cfg.namespace
+            if cache_namespace is None:
+                try:
+                    cache_namespace = await _guard(
+                        cfg.circuit_breaker, "get", FastAPICache.get_namespace(namespace)
+                    )
+                except Exception:
+                    logger.warning(
+                        "Error retrieving namespace generation from backend:",
+                        exc_info=True,
+                    )
+                    if cfg.metrics:
+                        cfg.metrics.error("namespace")
+                    return await call(*args, **kwargs)
+
+            phases = Profile(cfg.profiling_hooks, attributes) if profile else None
+            with _phase(phases, profiling.KEY):
+                cache_key = cfg.key_builder(
+                    func,
+                    cache_namespace,
+                    request=request,
+                    response=response,
+                    args=args,
+                    kwargs=(
+                        {k: v for k, v in kwargs.items() if k not in declared}
+                        if declared
+                        else kwargs
+                    ),
+                )
+                if isawaitable(cache_key):
+                    cache_key = await cache_key
             assert isinstance(cache_key, str)  # noqa: S101  # assertion is a type guard
 
+            if_none_match = request.headers.get("if-none-match") if request else None
+            if if_none_match and response:
+                headers = await match_etag(cfg, cache_key, if_none_match, phases)
+                if headers is not None:
+                    if phases:
+                        headers["Server-Timing"] = phases.server_timing()
+                    response.headers.update(headers)
+                    response.status_code = HTTP_304_NOT_MODIFIED
+                    return response
+
+            metrics = cfg.metrics
+            start = time.perf_counter() if metrics else 0
             try:
-                ttl, cached = await backend.get_with_ttl(cache_key)
+                with _phase(phases, profiling.GET):
+                    ttl, cached = await _guard(
+                        cfg.circuit_breaker, "get", cfg.backend.get_with_ttl(cache_key)
+                    )
             except Exception:
                 logger.warning(
                     f"Error retrieving cache key '{cache_key}' from backend:",
                     exc_info=True,
                 )
                 ttl, cached = 0, None
+                if metrics:
+                    metrics.error("get")
+            else:
+                if metrics:
+                    metrics.backend("get", time.perf_counter() - start)
+                    if cached is not None:
+                        metrics.payload("get", len(cached))
+
+            payload: Optional[bytes] = None
+            meta: Dict[str, Any] = {}
+            etag = ""
+            if cached is not None:
+                payload, meta = envelope.unpack(cached)
+                # with stale-while-revalidate the backend keeps entries for the
+                # grace period beyond expire; the remaining TTL tells if it is stale.
+                if cfg.grace and ttl >= 0:
+                    ttl -= cfg.grace
+                if (
+                    early_recompute_beta
+                    and ttl > 0
+                    and _recompute_early(ttl, meta.get("delta", 0), early_recompute_beta)
+                ):
+                    payload = None
+                # exceptions of a type no longer listed aren't replayed
+                error = meta.get("error")
+                if error and "type" in error and error["type"] not in error_types:
+                    payload = None
+                if payload is not None and "chunks" in meta and "stream" not in meta:
+                    payload = await read_chunks(cfg, cache_key, meta)
+            negative = "negative" in meta
+
+            if payload is not None and not (cfg.grace and ttl <= 0):  # cache hit
+                assert cached is not None  # noqa: S101
+                headers = {
+                    "Cache-Control": f"max-age={ttl}",
+                    cfg.cache_status_header: "HIT",
+                }
+                if negative:
+                    if metrics:
+                        metrics.negative_hit()
+                    if phases:
+                        headers["Server-Timing"] = phases.server_timing()
+                    if "error" in meta:
+                        raise _replay_error(meta["error"], error_types, headers)
+                    value = decode(cfg, cache_key, payload, meta, request, phases)
+                    return cast(R, _with_headers(value, response, headers, True))
+                if metrics:
+                    metrics.hit()
+                headers["ETag"] = _etag(cached, payload)
+                # values cached without a digest aren't matched by match_etag
+                if (
+                    if_none_match
+                    and response
+                    and _etag_matches(if_none_match, headers["ETag"])
+                ):
+                    if phases:
+                        headers["Server-Timing"] = phases.server_timing()
+                    response.headers.update(headers)
+                    response.status_code = HTTP_304_NOT_MODIFIED
+                    return response
+                value = decode(cfg, cache_key, payload, meta, request, phases)
+                if phases:
+                    headers["Server-Timing"] = phases.server_timing()
+                return cast(
+                    R,
+                    _with_headers(
+                        value, response, headers, raw_response or "headers" in meta
+                    ),
+                )
+
+            result: Any = None
+
+            async def compute() -> bytes:
+                nonlocal result
+                result, to_cache = await fill(cfg, cache_key, args, kwargs, request, phases)
+                return to_cache
+
+            async def coalesced_compute() -> Tuple[bool, bytes]:
+                if coalescer is None:
+                    return True, await compute()
+                return await coalescer.run(cache_key, compute)
+
+            if payload is None:  # cache miss
+                if metrics:
+                    metrics.miss()
+                leader, to_cache = await coalesced_compute()
+                payload, meta = envelope.unpack(to_cache)
+                negative = "negative" in meta
+                if "error" in meta:
+                    if leader:
+                        raise result
+                    raise _replay_error(
+                        meta["error"], error_types, {cfg.cache_status_header: "MISS"}
+                    )
+                if "stream" in meta:
+                    if not leader:
+                        # a stream can't be shared with the waiting callers
+                        result = await call(*args, **kwargs)
+                elif raw_response or negative or not leader:
+                    # another caller computed the result, or the response is
+                    # replayed from the cached body
+                    result = decode(cfg, cache_key, payload, meta, request, phases)
+                if "stream" not in meta:
+                    etag = _etag(to_cache, payload)
+                status = "MISS"
+                max_age = cfg.negative_expire if negative else cfg.expire
+
+            else:  # stale, revalidate
+                if cache_key not in revalidating:
+
+                    async def revalidate() -> None:
+                        try:
+                            await coalesced_compute()
+                        except Exception:
+                            logger.warning(
+                                f"Error revalidating cache key '{cache_key}':",
+                                exc_info=True,
+                            )
+
+                    task = asyncio.ensure_future(revalidate())
+                    revalidating[cache_key] = task
+                    task.add_done_callback(
+                        lambda _: revalidating.pop(cache_key, None)
+                    )
+
+                if metrics:
+                    metrics.stale()
+                status, max_age = "STALE", 0
+                if "error" in meta:
+                    raise _replay_error(
+                        meta["error"], error_types, {cfg.cache_status_header: status}
+                    )
+                assert cached is not None  # noqa: S101
+                etag = _etag(cached, payload)
+                result = decode(cfg, cache_key, payload, meta, request, phases)
+
+            headers = {
+                "Cache-Control": f"max-age={max_age}",
+                cfg.cache_status_header: status,
+            }
+            # cached errors and empty results have no ETag, nor do streams
+            # before they have been sent
+            if etag and not negative:
+                headers["ETag"] = etag
+            if phases:
+                headers["Server-Timing"] = phases.server_timing()
+            replayed = raw_response or "headers" in meta or "stream" in meta
+            return cast(R, _with_headers(result, response, headers, replayed))
+
+        inner.__signature__ = _augment_signature(wrapped_signature, *to_inject)  # type: ignore[attr-defined]
+
+        return inner
+
+    return wrapper
+
+
+def _item_type(return_type: Any) -> Any:
+    """The type of the items in a batch result, e.g. Item for List[Item]"""
+    args = get_args(return_type)
+    if not args:
+        return None
+    return args[-1] if _is_mapping_type(return_type) else args[0]
+
+
+def _is_mapping_type(type_: Any) -> bool:
+    origin = get_origin(type_)
+    return isinstance(origin, type) and issubclass(origin, Mapping)
+
+
+def cache_many(
+    ids: str,
+    expire: Optional[int] = None,
+    coder: Optional[Type[Coder]] = None,
+    namespace: str = "",
+    item_id: Optional[Callable[[Any], Hashable]] = None,
+    key_builder: Optional[KeyBuilder] = None,
+    injected_dependency_namespace: str = "__fastapi_cache",
+) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+    """
+    cache the items of a batch function individually
+    :param ids: name of the parameter with the item ids; a sequence of ids or
+        a comma-separated string
+    :param expire:
+    :param coder:
+    :param namespace:
+    :param item_id: callable returning the id of an item; only needed if the
+        function returns a sequence of items not matching the ids it was given
+    :param key_builder: builds the part of the keys shared by the items of a
+        call, from the other arguments; defaults to a CanonicalKeyBuilder, which
+        leaves out dependencies without a canonical form, such as sessions
+    :param injected_dependency_namespace:
+
+    The function must return a mapping from id to item, or a sequence of items
+    in the same order as the ids. It is only called for the ids that are not
+    cached yet, and the cached and computed items are combined in the order of
+    the requested ids. A dictionary is returned if the function is annotated to
+    return a mapping, and a list otherwise.
+
+    :return:
+    """
+
+    injected_request = Parameter(
+        name=f"{injected_dependency_namespace}_request",
+        annotation=Request,
+        kind=Parameter.KEYWORD_ONLY,
+    )
+    injected_response = Parameter(
+        name=f"{injected_dependency_namespace}_response",
+        annotation=Response,
+        kind=Parameter.KEYWORD_ONLY,
+    )
+
+    def wrapper(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        wrapped_signature = get_typed_signature(func)
+        to_inject: List[Parameter] = []
+        request_param = _locate_param(wrapped_signature, injected_request, to_inject)
+        response_param = _locate_param(wrapped_signature, injected_response, to_inject)
+        return_type = get_typed_return_annotation(func)
+        item_type = _item_type(return_type)
+        as_mapping = _is_mapping_type(return_type)
+        # a repr() of the arguments differs between requests for dependencies
+        # like database sessions, so the items would never be found again
+        build_prefix = key_builder or CanonicalKeyBuilder()
 
-            if cached is None:  # cache miss
-                result = await ensure_async_func(*args, **kwargs)
-                to_cache = coder.encode(result)
+        call = _ensure_async(func)
+        config: Optional[_EndpointConfig] = None
 
+        @wraps(func)
+        async def inner(*args: P.args, **kwargs: P.kwargs) -> R:
+            nonlocal config
+
+            request: Optional[Request] = kwargs.get(request_param.name)  # type: ignore[assignment]
+            response: Optional[Response] = kwargs.get(response_param.name)  # type: ignore[assignment]
+            kwargs.pop(injected_request.name, None)
+            kwargs.pop(injected_response.name, None)
+            bound = wrapped_signature.bind(*args, **kwargs)
+
+            if _uncacheable(request):
+                return await call(*bound.args, **bound.kwargs)
+
+            cfg = config
+            if cfg is None or cfg.version != FastAPICache.get_config_version():
+                cfg = config = _EndpointConfig.resolve(coder, expire, None, namespace)
+            if cfg.circuit_breaker and not cfg.circuit_breaker.allow():
+                return await call(*bound.args, **bound.kwargs)
+
+            cache_namespace = cfg.namespace
+            if cache_namespace is None:
                 try:
-                    await backend.set(cache_key, to_cache, expire)
+                    cache_namespace = await _guard(
+                        cfg.circuit_breaker, "get", FastAPICache.get_namespace(namespace)
+                    )
                 except Exception:
                     logger.warning(
-                        f"Error setting cache key '{cache_key}' in backend:",
+                        "Error retrieving namespace generation from backend:",
                         exc_info=True,
                     )
+                    if cfg.metrics:
+                        cfg.metrics.error("namespace")
+                    return await call(*bound.args, **bound.kwargs)
 
-                if response:
-                    response.headers.update(
-                        {
-                            "Cache-Control": f"max-age={expire}",
-                            "ETag": f"W/{hash(to_cache)}",
-                            cache_status_header: "MISS",
-                        }
-                    )
+            requested = bound.arguments[ids]
+            if isinstance(requested, str):
+                requested_ids: List[Any] = [i for i in requested.split(",") if i]
+            else:
+                requested_ids = list(requested)
+            # items are keyed by the string value of their id; duplicate ids
+            # are fetched and computed once, and returned as often as requested
+            unique = {str(i): i for i in requested_ids}
 
-            else:  # cache hit
-                if response:
-                    etag = f"W/{hash(cached)}"
-                    response.headers.update(
-                        {
-                            "Cache-Control": f"max-age={ttl}",
-                            "ETag": etag,
-                            cache_status_header: "HIT",
-                        }
-                    )
+            others = {
+                name: value
+                for name, value in bound.arguments.items()
+                if name not in (ids, request_param.name, response_param.name)
+            }
+            prefix = build_prefix(
+                func,
+                cache_namespace,
+                request=request,
+                response=response,
+                args=(),
+                kwargs=others,
+            )
+            if isawaitable(prefix):
+                prefix = await prefix
+            keys = {i: f"{prefix}:{i}" for i in unique}
 
-                    if_none_match = request and request.headers.get("if-none-match")
-                    if if_none_match == etag:
-                        response.status_code = HTTP_304_NOT_MODIFIED
-                        return response
+            metrics = cfg.metrics
+            start = time.perf_counter() if metrics else 0
+            try:
+                cached = await _guard(
+                    cfg.circuit_breaker, "get", cfg.backend.get_many(list(keys.values()))
+                )
+            except Exception:
+                logger.warning("Error retrieving cache keys from backend:", exc_info=True)
+                cached = [None] * len(keys)
+                if metrics:
+                    metrics.error("get")
+            else:
+                if metrics:
+                    metrics.backend("get", time.perf_counter() - start)
 
-                result = cast(R, coder.decode_as_type(cached, type_=return_type))
+            start = time.perf_counter() if metrics else 0
+            items: Dict[str, Any] = {}
+            for i, value in zip(keys, cached):
+                if value is not None:
+                    payload, _ = envelope.unpack(value)
+                    items[i] = cfg.coder.decode_as_type(payload, type_=item_type)
+                    if metrics:
+                        metrics.payload("get", len(value))
 
-            return result
+            missing = [unique[i] for i in unique if i not in items]
+            if metrics:
+                if items:
+                    metrics.coder("decode", time.perf_counter() - start)
+                    metrics.hit(len(items))
+                if missing:
+                    metrics.miss(len(missing))
+            if missing:
+                if isinstance(requested, str):
+                    bound.arguments[ids] = ",".join(map(str, missing))
+                elif isinstance(requested, (tuple, set, frozenset)):
+                    bound.arguments[ids] = type(requested)(missing)
+                else:
+                    bound.arguments[ids] = missing
+                result: Any = await call(*bound.args, **bound.kwargs)
+
+                if isinstance(result, Mapping):
+                    computed = {str(i): item for i, item in result.items()}
+                elif item_id is not None:
+                    computed = {str(item_id(item)): item for item in result}
+                else:
+                    computed = {str(i): item for i, item in zip(missing, result)}
+                items.update(computed)
+
+                start = time.perf_counter() if metrics else 0
+                to_cache = {
+                    keys[i]: envelope.pack(cfg.coder.encode(item))
+                    for i, item in computed.items()
+                    if i in keys
+                }
+                if metrics:
+                    metrics.coder("encode", time.perf_counter() - start)
+                    for value in to_cache.values():
+                        metrics.payload("set", len(value))
+                    start = time.perf_counter()
+                try:
+                    await _guard(
+                        cfg.circuit_breaker, "set", cfg.backend.set_many(to_cache, cfg.expire)
+                    )
+                except Exception:
+                    logger.warning("Error setting cache keys in backend:", exc_info=True)
+                    if metrics:
+                        metrics.error("set")
+                else:
+                    if metrics:
+                        metrics.backend("set", time.perf_counter() - start)
+
+            if response:
+                status = "MISS" if len(missing) == len(unique) else "PARTIAL"
+                response.headers[cfg.cache_status_header] = status if missing else "HIT"
+
+            if as_mapping:
+                return cast(R, {unique[i]: items[i] for i in unique if i in items})
+            return cast(
+                R, [items[str(i)] for i in requested_ids if str(i) in items]
+            )
 
         inner.__signature__ = _augment_signature(wrapped_signature, *to_inject)  # type: ignore[attr-defined]
 
@@ -0,0 +1,76 @@
+"""Metadata envelope around cached payloads
+
+The cache decorator stores a small amount of metadata with each cached value,
+such as the time it took to compute. The envelope is a magic prefix, followed by
+a hash of the payload, the length of a compact JSON header and the header
+itself, and then the payload produced by the coder::
+
+    MAGIC | digest (16 bytes) | header length (uint32, big endian) | JSON header | payload
+
+The digest (a BLAKE2b hash of the payload) is computed once, when the value is
+packed, and serves as its ETag. As it is at a fixed position, the ETag can be
+read from the first HEAD_SIZE bytes of a value, without fetching the payload.
+
+Values without a magic prefix are returned unchanged, with empty metadata.
+
+"""
+import hashlib
+import json
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+# 0x93 can't start a UTF-8 text (JSON) or pickle payload
+MAGIC = b"\x93FC\x02"
+DIGEST_SIZE = 16
+# the bytes needed to read the digest of a value
+HEAD_SIZE = len(MAGIC) + DIGEST_SIZE
+_HEADER = struct.Struct(">I")
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def digest(payload: bytes) -> str:
+    """The hex digest of a payload"""
+    return hashlib.blake2b(payload, digest_size=DIGEST_SIZE).hexdigest()
+
+
+def pack(payload: bytes, *, payload_digest: Optional[bytes] = None, **meta: Any) -> bytes:
+    """Wrap payload in an envelope with the given metadata
+
+    payload_digest overrides the digest of the payload, for envelopes that
+    describe content stored elsewhere (see `fastapi_cache.chunks`).
+
+    """
+    header = _dumps(meta).encode()
+    if payload_digest is None:
+        payload_digest = hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest()
+    return b"".join(
+        (
+            MAGIC,
+            payload_digest,
+            _HEADER.pack(len(header)),
+            header,
+            payload,
+        )
+    )
+
+
+def unpack(value: bytes) -> Tuple[bytes, Dict[str, Any]]:
+    """Return the payload and metadata from an envelope"""
+    if not value.startswith(MAGIC):
+        return value, {}
+    (length,) = _HEADER.unpack_from(value, HEAD_SIZE)
+    offset = HEAD_SIZE + _HEADER.size
+    start = offset + length
+    meta: Dict[str, Any] = json.loads(value[offset:start].decode())
+    return value[start:], meta
+
+
+def stored_digest(value: bytes) -> Optional[str]:
+    """The hex digest stored in an envelope, from the value or its head
+
+    Returns None for values without a stored digest.
+
+    """
+    if len(value) < HEAD_SIZE or not value.startswith(MAGIC):
+        return None
+    return value[len(MAGIC) : HEAD_SIZE].hex()
@@ -1,9 +1,31 @@
+import dataclasses
+import datetime
+import decimal
+import enum
 import hashlib
-from typing import Any, Callable, Dict, Optional, Tuple
+import inspect
+import json
+import logging
+import uuid
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+)
 
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
 from starlette.requests import Request
 from starlette.responses import Response
 
+logger: logging.Logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
 
 def default_key_builder(
     func: Callable[..., Any],
@@ -18,3 +40,181 @@ def default_key_builder(
         f"{func.__module__}:{func.__name__}:{args}:{kwargs}".encode()
     ).hexdigest()
     return f"{namespace}:{cache_key}"
+
+
+# types with a deterministic string form
+_SCALARS = (datetime.date, datetime.time, datetime.timedelta, decimal.Decimal, uuid.UUID)
+
+
+class _Skip(Exception):
+    """Raised for values that can't be encoded canonically"""
+
+
+def _default(value: Any) -> Any:
+    """Canonical JSON form of values the json module can't encode itself"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, _SCALARS):
+        return str(value)
+    if isinstance(value, bytes):
+        # tagged, so that bytes don't give the same key as the equal string
+        return {"__bytes__": value.hex()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=_dumps)
+    if isinstance(value, BaseModel) or (
+        dataclasses.is_dataclass(value) and not isinstance(value, type)
+    ):
+        return _fields(value)
+    raise _Skip
+
+
+def _fields(value: Any) -> Any:
+    """The fields of a model or dataclass, encoded canonically if possible"""
+    fields = value.dict() if isinstance(value, BaseModel) else dataclasses.asdict(value)
+    try:
+        _dumps(fields)
+    except (_Skip, TypeError, ValueError):
+        # fields that FastAPI can encode, but not canonically; a model is never
+        # left out of the key, e.g. the current user returned by a dependency
+        return jsonable_encoder(value)
+    return fields
+
+
+def _whitelisted_default(value: Any) -> Any:
+    try:
+        return _default(value)
+    except _Skip:
+        return jsonable_encoder(value)
+
+
+# json.dumps() creates a new encoder for every call with non-default options
+_dumps = json.JSONEncoder(sort_keys=True, separators=(",", ":"), default=_default).encode
+_dumps_whitelisted = json.JSONEncoder(
+    sort_keys=True, separators=(",", ":"), default=_whitelisted_default
+).encode
+_CONTAINERS = (list, tuple, dict, set, frozenset)
+
+
+class _FunctionKey:
+    """Precomputed state for building the keys of one function"""
+
+    __slots__ = ("hasher", "positional", "defaults")
+
+    def __init__(self, func: Callable[..., Any], digest_size: int) -> None:
+        self.hasher = hashlib.blake2b(
+            f"{func.__module__}:{func.__qualname__}".encode(), digest_size=digest_size
+        )
+        parameters = inspect.signature(func).parameters.values()
+        self.positional = tuple(
+            p.name
+            for p in parameters
+            if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+        )
+        self.defaults = {
+            p.name: p.default for p in parameters if p.default is not p.empty
+        }
+
+
+class CanonicalKeyBuilder:
+    """Key builder that gives the same key for the same arguments, in every process
+
+    Arguments are encoded canonically: strings, numbers, booleans, None, bytes,
+    enums, dates, times, decimals, UUIDs, Pydantic models, dataclasses, and
+    lists, tuples, sets and dicts of these. Other arguments, such as database
+    sessions and clients injected as dependencies, have no canonical form and
+    are left out, with a warning the first time an argument of that type is
+    dropped; types in `exclude` are left out without one. List arguments in
+    `params` to include them (they are encoded with FastAPI's
+    jsonable_encoder). With `params`, only those arguments are part of the key.
+
+    Arguments are keyed by name, with defaults applied, so positional and keyword
+    calls give the same key. The function name is hashed once per function,
+    and keys are hashed with BLAKE2b.
+
+    Usage:
+        >> FastAPICache.init(backend, key_builder=CanonicalKeyBuilder())
+        >> @cache(key_builder=CanonicalKeyBuilder(params=["sku", "filters"]))
+        >> @cache(key_builder=CanonicalKeyBuilder(exclude=[AsyncSession]))
+
+    """
+
+    def __init__(
+        self,
+        params: Optional[Iterable[str]] = None,
+        digest_size: int = 16,
+        exclude: Iterable[type] = (),
+    ) -> None:
+        self.params: Optional[FrozenSet[str]] = None if params is None else frozenset(params)
+        self.digest_size = digest_size
+        self.exclude = tuple(exclude)
+        self._functions: Dict[Callable[..., Any], _FunctionKey] = {}
+        self._skipped: Set[type] = set()
+
+    def _encodable(
+        self, func: Callable[..., Any], arguments: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """The arguments that can be encoded canonically"""
+        encodable: Dict[str, Any] = {}
+        for name, value in arguments.items():
+            try:
+                _dumps(value)
+            except (_Skip, TypeError, ValueError):
+                if not isinstance(value, _CONTAINERS):
+                    # skip arguments of this type without trying from now on
+                    self._skipped.add(type(value))
+                logger.warning(
+                    "Argument '%s' of %s.%s (%s) can't be encoded canonically and "
+                    "is left out of the cache key; pass it in `params` to include "
+                    "it, or in `exclude` to silence this warning",
+                    name,
+                    func.__module__,
+                    func.__qualname__,
+                    type(value).__name__,
+                )
+                continue
+            encodable[name] = value
+        return encodable
+
+    def __call__(
+        self,
+        func: Callable[..., Any],
+        namespace: str = "",
+        *,
+        request: Optional[Request] = None,
+        response: Optional[Response] = None,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> str:
+        function_key = self._functions.get(func)
+        if function_key is None:
+            function_key = self._functions[func] = _FunctionKey(func, self.digest_size)
+
+        # FastAPI calls endpoints with keyword arguments only
+        arguments = {**function_key.defaults, **kwargs}
+        if args:
+            arguments.update(zip(function_key.positional, args))
+            # variadic positional arguments
+            arguments.update(
+                (f"*{i}", arg)
+                for i, arg in enumerate(args[len(function_key.positional) :])
+            )
+
+        if self.params is not None:
+            encoded = _dumps_whitelisted(
+                {k: v for k, v in arguments.items() if k in self.params}
+            )
+        else:
+            if self._skipped or self.exclude:
+                arguments = {
+                    k: v
+                    for k, v in arguments.items()
+                    if type(v) not in self._skipped and not isinstance(v, self.exclude)
+                }
+            try:
+                encoded = _dumps(arguments)
+            except (_Skip, TypeError, ValueError):
+                encoded = _dumps(self._encodable(func, arguments))
+
+        hasher = function_key.hasher.copy()
+        hasher.update(encoded.encode())
+        return f"{namespace}:{hasher.hexdigest()}"
@@ -0,0 +1,228 @@
+"""Cache metrics
+
+The cache decorators record metrics through a MetricsSink, configured with
+`FastAPICache.init(backend, metrics=...)`. Metrics are labelled with the
+namespace of the decorated endpoint and the backend class:
+
+- fastapi_cache_hits_total, fastapi_cache_misses_total and
+  fastapi_cache_stale_total: requests served from the cache, computed, or
+  served stale while revalidating
+- fastapi_cache_negative_hits_total and fastapi_cache_negative_stores_total:
+  cached errors and empty results (see the cache_errors and negative_expire
+  arguments of @cache) served and stored; negative hits are not counted as hits
+- fastapi_cache_errors_total: backend errors, by operation
+- fastapi_cache_backend_duration_seconds: backend latency, by operation
+- fastapi_cache_coder_duration_seconds: encoding and decoding time, by operation
+- fastapi_cache_payload_bytes: size of values read from and written to the
+  backend, by operation
+
+PrometheusMetrics keeps these in memory and renders them in the Prometheus text
+format; it is also an ASGI app, to serve them:
+
+    >> metrics = PrometheusMetrics()
+    >> FastAPICache.init(backend, metrics=metrics)
+    >> app.mount("/metrics", metrics)
+
+"""
+import abc
+import bisect
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+HITS = "fastapi_cache_hits_total"
+MISSES = "fastapi_cache_misses_total"
+STALE = "fastapi_cache_stale_total"
+NEGATIVE_HITS = "fastapi_cache_negative_hits_total"
+NEGATIVE_STORES = "fastapi_cache_negative_stores_total"
+ERRORS = "fastapi_cache_errors_total"
+BACKEND_DURATION = "fastapi_cache_backend_duration_seconds"
+CODER_DURATION = "fastapi_cache_coder_duration_seconds"
+PAYLOAD_BYTES = "fastapi_cache_payload_bytes"
+
+DESCRIPTIONS: Dict[str, str] = {
+    HITS: "Requests served from the cache",
+    MISSES: "Requests not found in the cache",
+    STALE: "Stale values served while revalidating",
+    NEGATIVE_HITS: "Cached errors and empty results served",
+    NEGATIVE_STORES: "Errors and empty results stored in the cache",
+    ERRORS: "Backend errors",
+    BACKEND_DURATION: "Backend operation latency",
+    CODER_DURATION: "Time to encode and decode values",
+    PAYLOAD_BYTES: "Size of values read from and written to the backend",
+}
+
+Labels = Mapping[str, str]
+
+
+class MetricsSink(abc.ABC):
+    """Receives the metrics recorded by the cache decorators
+
+    Implement this to forward metrics to e.g. StatsD or OpenTelemetry. Methods
+    are called on the hot path, from the event loop, and should not block.
+
+    """
+
+    @abc.abstractmethod
+    def increment(self, name: str, labels: Labels, value: float = 1) -> None:
+        """Increment a counter"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """Record a value in a histogram"""
+        raise NotImplementedError
+
+
+# latencies of cache operations are mostly well below the Prometheus defaults
+DURATION_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)  # fmt: skip
+SIZE_BUCKETS = tuple(float(4**i) for i in range(3, 13))  # 64 B to 16 MiB
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: _LabelKey) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class PrometheusMetrics(MetricsSink):
+    """In-memory metrics, rendered in the Prometheus text format
+
+    Histogram buckets are chosen by the metric name: names ending in `_seconds`
+    use DURATION_BUCKETS, names ending in `_bytes` SIZE_BUCKETS. Mount an
+    instance as an ASGI app to serve the metrics.
+
+    """
+
+    media_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, buckets: Optional[Mapping[str, Sequence[float]]] = None) -> None:
+        self.buckets: Dict[str, Sequence[float]] = dict(buckets or {})
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, _Histogram]] = {}
+
+    def _buckets(self, name: str) -> Sequence[float]:
+        if name in self.buckets:
+            return self.buckets[name]
+        return SIZE_BUCKETS if name.endswith("_bytes") else DURATION_BUCKETS
+
+    def increment(self, name: str, labels: Labels, value: float = 1) -> None:
+        counters = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        histograms = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self._buckets(name))
+        histogram.observe(value)
+
+    def get(self, name: str, **labels: str) -> float:
+        """The value of a counter, or the number of observations in a histogram"""
+        key = tuple(sorted(labels.items()))
+        if name in self._histograms:
+            histogram = self._histograms[name].get(key)
+            return histogram.count if histogram else 0
+        return self._counters.get(name, {}).get(key, 0)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, counters in sorted(self._counters.items()):
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(counters.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, histograms in sorted(self._histograms.items()):
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels((*labels, ("le", repr(float(bound)))))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = _format_labels((*labels, ("le", "+Inf")))
+                lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {repr(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = Response(self.render(), media_type=self.media_type)
+        await response(scope, receive, send)
+
+
+class EndpointMetrics:
+    """Records the metrics of a decorated endpoint, with labels built once"""
+
+    __slots__ = ("sink", "labels", "_operations")
+
+    def __init__(self, sink: MetricsSink, namespace: str, backend: str) -> None:
+        self.sink = sink
+        self.labels = {"namespace": namespace, "backend": backend}
+        self._operations: Dict[str, Labels] = {}
+
+    def _with_operation(self, operation: str) -> Labels:
+        labels = self._operations.get(operation)
+        if labels is None:
+            labels = self._operations[operation] = {**self.labels, "operation": operation}
+        return labels
+
+    def hit(self, count: int = 1) -> None:
+        self.sink.increment(HITS, self.labels, count)
+
+    def miss(self, count: int = 1) -> None:
+        self.sink.increment(MISSES, self.labels, count)
+
+    def stale(self) -> None:
+        self.sink.increment(STALE, self.labels)
+
+    def negative_hit(self) -> None:
+        self.sink.increment(NEGATIVE_HITS, self.labels)
+
+    def negative_store(self) -> None:
+        self.sink.increment(NEGATIVE_STORES, self.labels)
+
+    def error(self, operation: str) -> None:
+        self.sink.increment(ERRORS, self._with_operation(operation))
+
+    def backend(self, operation: str, seconds: float) -> None:
+        self.sink.observe(BACKEND_DURATION, self._with_operation(operation), seconds)
+
+    def coder(self, operation: str, seconds: float) -> None:
+        self.sink.observe(CODER_DURATION, self._with_operation(operation), seconds)
+
+    def payload(self, operation: str, size: int) -> None:
+        self.sink.observe(PAYLOAD_BYTES, self._with_operation(operation), size)
@@ -0,0 +1,249 @@
+"""Cache whole responses at the ASGI layer, before routing
+
+The `@cache` decorator runs after FastAPI has routed the request, resolved its
+dependencies and validated its parameters. `CacheMiddleware` caches complete
+responses (status, headers and body) in front of the application instead, and
+replays hits without calling the application at all:
+
+    >> app.add_middleware(CacheMiddleware, expire=60, paths=["/public"])
+
+It uses the backend, prefix, coder and other settings passed to
+`FastAPICache.init()`, and doesn't cache the same requests the decorator
+doesn't cache (see `decorator._uncacheable`). Responses are cached by method,
+path, query string (with its parameters sorted) and the values of the request
+headers listed in `vary`.
+
+"""
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from fastapi_cache import FastAPICache, envelope
+from fastapi_cache.coder import Coder, CompressedCoder
+from fastapi_cache.decorator import _guard, _replay_response, _uncacheable
+from fastapi_cache.metrics import EndpointMetrics
+
+logger: logging.Logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Cache-Control directives of responses that must not be stored in a shared cache
+_NOT_STORED = frozenset(("no-store", "no-cache", "private"))
+
+
+def _header_names(value: str) -> List[str]:
+    return [name.strip().lower() for name in value.split(",") if name.strip()]
+
+
+class CacheMiddleware:
+    """Cache complete responses in front of an ASGI application
+
+    Only responses with a status in `statuses` and a body of at most
+    `max_body_size` bytes are cached. Responses that set cookies, have a
+    Cache-Control header with no-store, no-cache or private, or vary on request
+    headers not listed in `vary` are passed through uncached, as are requests
+    with an Authorization header.
+
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        expire: Optional[int] = None,
+        namespace: str = "",
+        paths: Optional[Sequence[str]] = None,
+        vary: Sequence[str] = (),
+        statuses: Sequence[int] = (200,),
+        max_body_size: int = 1024 * 1024,
+    ) -> None:
+        self.app = app
+        self.expire = expire
+        self.namespace = namespace
+        # path prefixes to cache; all paths if None
+        self.paths = tuple(paths) if paths is not None else None
+        self.vary = tuple(name.lower() for name in vary)
+        self.statuses = frozenset(statuses)
+        self.max_body_size = max_body_size
+        self._metrics: Tuple[int, Optional[EndpointMetrics]] = (-1, None)
+
+    def _get_metrics(self) -> Optional[EndpointMetrics]:
+        version, metrics = self._metrics
+        if version != FastAPICache.get_config_version():
+            sink = FastAPICache.get_metrics()
+            backend = type(FastAPICache.get_backend()).__name__
+            metrics = EndpointMetrics(sink, self.namespace, backend) if sink else None
+            self._metrics = (FastAPICache.get_config_version(), metrics)
+        return metrics
+
+    def cache_key(self, request: Request, namespace: str) -> str:
+        scope = request.scope
+        query = urlencode(
+            sorted(
+                parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+            )
+        )
+        varies = "\n".join(request.headers.get(name, "") for name in self.vary)
+        cache_key = hashlib.md5(  # noqa: S324
+            f"{request.method}:{scope['path']}?{query}\n{varies}".encode()
+        ).hexdigest()
+        return f"{namespace}:{cache_key}"
+
+    def _storable(self, status: int, headers: List[Tuple[bytes, bytes]]) -> bool:
+        if status not in self.statuses:
+            return False
+        for name, value in headers:
+            if name == b"set-cookie":
+                return False
+            if name == b"cache-control":
+                directives = {
+                    directive.partition("=")[0]
+                    for directive in _header_names(value.decode("latin-1"))
+                }
+                if directives & _NOT_STORED:
+                    return False
+            if name == b"vary":
+                names = _header_names(value.decode("latin-1"))
+                if any(name not in self.vary for name in names):
+                    return False
+        return True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (
+            self.paths is not None and not scope["path"].startswith(self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        breaker = FastAPICache.get_circuit_breaker()
+        if (
+            _uncacheable(request)
+            or "authorization" in request.headers
+            or (breaker and not breaker.allow())
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        backend = FastAPICache.get_backend()
+        metrics = self._get_metrics()
+        try:
+            namespace = await _guard(
+                breaker, "get", FastAPICache.get_namespace(self.namespace)
+            )
+        except Exception:
+            logger.warning(
+                "Error retrieving namespace generation from backend:", exc_info=True
+            )
+            if metrics:
+                metrics.error("namespace")
+            await self.app(scope, receive, send)
+            return
+        cache_key = self.cache_key(request, namespace)
+
+        start = time.perf_counter() if metrics else 0
+        try:
+            cached = await _guard(breaker, "get", backend.get(cache_key))
+        except Exception:
+            logger.warning(
+                f"Error retrieving cache key '{cache_key}' from backend:",
+                exc_info=True,
+            )
+            cached = None
+            if metrics:
+                metrics.error("get")
+        else:
+            if metrics:
+                metrics.backend("get", time.perf_counter() - start)
+                if cached is not None:
+                    metrics.payload("get", len(cached))
+
+        status_header = FastAPICache.get_cache_status_header()
+        if cached is not None:
+            payload, meta = envelope.unpack(cached)
+            if "headers" in meta:
+                if metrics:
+                    metrics.hit()
+                # bodies that were already encoded are stored as-is
+                coder = Coder if meta.get("encoded") else FastAPICache.get_coder()
+                response = _replay_response(payload, meta, coder, request)
+                response.headers[status_header] = "HIT"
+                await response(scope, receive, send)
+                return
+
+        if metrics:
+            metrics.miss()
+        await self._fill(scope, receive, send, cache_key, status_header, metrics)
+
+    async def _fill(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        cache_key: str,
+        status_header: str,
+        metrics: Optional[EndpointMetrics],
+    ) -> None:
+        """Call the application, and cache the response while it is sent"""
+        meta: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+        size = 0
+        storable = complete = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal size, storable, complete
+            if message["type"] == "http.response.start":
+                headers: List[Tuple[bytes, bytes]] = list(message.get("headers", []))
+                storable = self._storable(message["status"], headers)
+                meta["status"] = message["status"]
+                meta["headers"] = [
+                    (name.decode("latin-1"), value.decode("latin-1"))
+                    for name, value in headers
+                    if name != b"content-length"
+                ]
+                if any(name == b"content-encoding" for name, _ in headers):
+                    meta["encoded"] = 1
+                message["headers"] = [
+                    *headers, (status_header.lower().encode("latin-1"), b"MISS")
+                ]
+            elif message["type"] == "http.response.body" and storable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.max_body_size:
+                    storable = False
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                    complete = not message.get("more_body", False)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if not (storable and complete):
+            return
+
+        coder: Type[Coder] = FastAPICache.get_coder()
+        body = b"".join(chunks)
+        if issubclass(coder, CompressedCoder) and "encoded" not in meta:
+            body = coder.compress(body)
+        to_cache = envelope.pack(body, **meta)
+        if metrics:
+            metrics.payload("set", len(to_cache))
+        expire = self.expire or FastAPICache.get_expire()
+        start = time.perf_counter() if metrics else 0
+        try:
+            await _guard(
+                FastAPICache.get_circuit_breaker(),
+                "set",
+                FastAPICache.get_backend().set(cache_key, to_cache, expire),
+            )
+        except Exception:
+            logger.warning(
+                f"Error setting cache key '{cache_key}' in backend:", exc_info=True
+            )
+            if metrics:
+                metrics.error("set")
+        else:
+            if metrics:
+                metrics.backend("set", time.perf_counter() - start)
@@ -0,0 +1,72 @@
+"""Per-phase timing of cached endpoints
+
+With `@cache(profile=True)`, each phase of a call is timed separately and
+reported in a Server-Timing response header, e.g.
+
+    Server-Timing: cache-key;dur=0.012, cache-get;dur=0.210, cache-decode;dur=0.031
+
+The phases are:
+
+- cache-key: building the cache key
+- cache-get: reading the entry from the backend
+- cache-decode: decoding the cached value
+- endpoint: calling the endpoint, on a miss
+- cache-encode: encoding the result
+- cache-set: writing the entry to the backend
+
+Hooks passed to `FastAPICache.init(backend, profiling_hooks=[...])` are called
+at the start of each phase with its name and the attributes of the call, and
+return a context manager that is exited at the end of the phase; for example
+to create a tracing span per phase:
+
+    >> def span(phase, attributes):
+    ..     return tracer.start_as_current_span(phase, attributes=attributes)
+
+"""
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+)
+
+ProfilingHook = Callable[[str, Mapping[str, str]], ContextManager[Any]]
+
+KEY = "cache-key"
+GET = "cache-get"
+DECODE = "cache-decode"
+ENDPOINT = "endpoint"
+ENCODE = "cache-encode"
+SET = "cache-set"
+
+
+class Profile:
+    """The phase timings of a call"""
+
+    __slots__ = ("hooks", "attributes", "timings")
+
+    def __init__(self, hooks: Sequence[ProfilingHook], attributes: Mapping[str, str]) -> None:
+        self.hooks = hooks
+        self.attributes = attributes
+        self.timings: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        with ExitStack() as stack:
+            for hook in self.hooks:
+                stack.enter_context(hook(name, self.attributes))
+            start = perf_counter()
+            try:
+                yield
+            finally:
+                self.timings.append((name, perf_counter() - start))
+
+    def server_timing(self) -> str:
+        """The timings as a Server-Timing header value, in milliseconds"""
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.timings)
@@ -1,5 +1,17 @@
 import abc
-from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+import asyncio
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from starlette.requests import Request
 from starlette.responses import Response
@@ -38,3 +50,93 @@ class Backend(abc.ABC):
     @abc.abstractmethod
     async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
         raise NotImplementedError
+
+    async def get_head_with_ttl(
+        self, key: str, size: int
+    ) -> Tuple[int, Optional[bytes]]:
+        """Get the TTL and the first size bytes of the value of a key
+
+        Used to read the metadata at the start of cached values without
+        transferring the whole value. The default implementation gets the
+        whole value; backends should override it if they can read a range.
+
+        """
+        ttl, value = await self.get_with_ttl(key)
+        return ttl, value if value is None else value[:size]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Get the values for multiple keys, in order
+
+        Backends should override this (and set_many and delete_many) if they can
+        handle multiple keys in a single round trip; the default implementation
+        gets all keys concurrently.
+
+        """
+        return list(await asyncio.gather(*(self.get(key) for key in keys)))
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        """Set the values for multiple keys"""
+        await asyncio.gather(
+            *(self.set(key, value, expire) for key, value in items.items())
+        )
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        """Delete multiple keys, returning the number of deleted keys"""
+        counts = await asyncio.gather(*(self.clear(key=key) for key in keys))
+        return sum(counts)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """Increment the integer value of a key that doesn't expire
+
+        Missing keys count as 0. The value is stored as a decimal number, so it
+        can be read with get(). The default implementation is not atomic;
+        backends should override it with an atomic increment.
+
+        """
+        value = int(await self.get(key) or 0) + amount
+        await self.set(key, str(value).encode())
+        return value
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expire: Optional[int] = None
+    ) -> None:
+        """Record that a key carries the given tags
+
+        Each tag is stored as an index of the keys carrying it, under the tag's
+        own key. `expire` is the expiry of the tagged key; backends may use it to
+        expire indexes once none of their keys can still exist. The default
+        implementation stores indexes as newline separated keys that don't
+        expire, and is not atomic; backends should override it (and
+        get_tagged_keys and invalidate_tags) with their native sets.
+
+        """
+        k = key.encode()
+        indexes = await self.get_many(tags)
+        updates = {
+            tag: (index + b"\n" + k if index else k)
+            for tag, index in zip(tags, indexes)
+            if not index or k not in index.split(b"\n")
+        }
+        if updates:
+            await self.set_many(updates)
+
+    async def get_tagged_keys(self, tags: Sequence[str]) -> List[str]:
+        """Get the keys carrying any of the given tags"""
+        indexes = await self.get_many(tags)
+        keys = dict.fromkeys(
+            k.decode() for index in indexes if index for k in index.split(b"\n")
+        )
+        return list(keys)
+
+    async def invalidate_tags(self, tags: Sequence[str]) -> int:
+        """Delete all keys carrying any of the given tags, and the tag indexes
+
+        Returns the number of deleted keys.
+
+        """
+        keys = await self.get_tagged_keys(tags)
+        count = await self.delete_many(keys) if keys else 0
+        await self.delete_many(tags)
+        return count
@@ -0,0 +1,817 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import pytest
+from aiomcache.exceptions import ClientException
+
+from fastapi_cache.backends import dynamodb, tiered
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.memcached import MemcachedBackend
+from fastapi_cache.backends.sharded import ShardedBackend
+from fastapi_cache.backends.shared_memory import SharedMemoryBackend
+from fastapi_cache.backends.sqlite import SQLiteBackend
+from fastapi_cache.backends.tiered import TieredBackend
+from fastapi_cache.backends.write_behind import WriteBehindBackend
+from fastapi_cache.types import Backend
+
+_T = TypeVar("_T")
+
+
+def run(coro: Coroutine[Any, Any, _T]) -> _T:
+    return asyncio.run(coro)
+
+
+def sqlite_backend(tmp_path: Path) -> SQLiteBackend:
+    return SQLiteBackend(str(tmp_path / "cache.db"))
+
+
+def shared_memory_backend(tmp_path: Path, **kwargs: Any) -> SharedMemoryBackend:
+    return SharedMemoryBackend(str(tmp_path / "cache"), **kwargs)
+
+
+def sharded_backend(*names: str) -> ShardedBackend:
+    return ShardedBackend({name: InMemoryBackend() for name in names or "abc"})
+
+
+class DictBackend(Backend):
+    """Minimal backend, without batch operations of its own"""
+
+    def __init__(self) -> None:
+        self.store: Dict[str, bytes] = {}
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        return -1, self.store.get(key)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self.store[key] = value
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return int(self.store.pop(key or "", None) is not None)
+
+
+@pytest.fixture()
+def backend(request: pytest.FixtureRequest, tmp_path: Path) -> Iterator[Backend]:
+    """Create the backend of a parametrized test in its own directory, and close it"""
+    factory: Callable[[Path], Backend] = request.param
+    backend = factory(tmp_path)
+    yield backend
+    if isinstance(backend, SQLiteBackend):
+        run(backend.close())
+    elif isinstance(backend, SharedMemoryBackend):
+        backend.close()
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        lambda _: DictBackend(),
+        lambda _: InMemoryBackend(),
+        lambda _: TieredBackend(InMemoryBackend()),
+        lambda _: WriteBehindBackend(InMemoryBackend()),
+        sqlite_backend,
+        shared_memory_backend,
+        lambda _: sharded_backend(),
+    ],
+    indirect=True,
+    ids=[
+        "fallback",
+        "inmemory",
+        "tiered",
+        "write-behind",
+        "sqlite",
+        "shared-memory",
+        "sharded",
+    ],
+)
+def test_batch_operations_and_incr(backend: Backend) -> None:
+    async def main() -> None:
+        await backend.set_many({"a": b"1", "b": b"2", "c": b"3"}, 10)
+        assert await backend.get_many(["c", "missing", "a"]) == [b"3", None, b"1"]
+        assert await backend.get_many([]) == []
+        assert await backend.delete_many(["a", "b", "missing"]) == 2
+        assert await backend.get_many(["a", "b", "c"]) == [None, None, b"3"]
+
+        assert await backend.incr("counter") == 1
+        assert await backend.incr("counter", 2) == 3
+        assert await backend.get("counter") == b"3"
+
+    run(main())
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        lambda _: DictBackend(),
+        lambda _: InMemoryBackend(),
+        lambda _: TieredBackend(InMemoryBackend()),
+        sqlite_backend,
+        shared_memory_backend,
+        lambda _: sharded_backend(),
+    ],
+    indirect=True,
+    ids=["fallback", "inmemory", "tiered", "sqlite", "shared-memory", "sharded"],
+)
+def test_get_head_with_ttl(backend: Backend) -> None:
+    async def main() -> None:
+        await backend.set("head", b"0123456789", 10)
+        ttl, head = await backend.get_head_with_ttl("head", 4)
+        assert head == b"0123"
+        assert ttl in (10, -1)  # DictBackend doesn't expire keys
+        assert (await backend.get_head_with_ttl("missing", 4))[1] is None
+
+    run(main())
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        lambda _: DictBackend(),
+        lambda _: InMemoryBackend(),
+        lambda _: TieredBackend(InMemoryBackend()),
+        sqlite_backend,
+        shared_memory_backend,
+        lambda _: sharded_backend(),
+    ],
+    indirect=True,
+    ids=["fallback", "inmemory", "tiered", "sqlite", "shared-memory", "sharded"],
+)
+def test_tags(backend: Backend) -> None:
+    async def main() -> None:
+        await backend.set_many({"a": b"1", "b": b"2", "c": b"3"})
+        await backend.add_tags("a", ["t:x", "t:y"])
+        await backend.add_tags("b", ["t:y"])
+        await backend.add_tags("b", ["t:y"])
+        await backend.add_tags("c", ["t:z"])
+        assert sorted(await backend.get_tagged_keys(["t:y", "t:missing"])) == ["a", "b"]
+
+        assert await backend.invalidate_tags(["t:x"]) == 1
+        assert await backend.get_many(["a", "b", "c"]) == [None, b"2", b"3"]
+        assert await backend.invalidate_tags(["t:y", "t:z"]) == 2
+        assert await backend.get_many(["a", "b", "c"]) == [None, None, None]
+        assert await backend.get_tagged_keys(["t:x", "t:y", "t:z"]) == []
+
+    run(main())
+
+
+def test_inmemory_instances_are_separate() -> None:
+    first, second = InMemoryBackend(), InMemoryBackend()
+    run(first.set("key", b"value"))
+    assert run(first.get("key")) == b"value"
+    assert run(second.get("key")) is None
+
+
+def test_inmemory_ttl() -> None:
+    backend = InMemoryBackend()
+    run(backend.set("forever", b"value"))
+    run(backend.set("expiring", b"value", 10))
+    assert run(backend.get_with_ttl("forever")) == (-1, b"value")
+    assert run(backend.get_with_ttl("expiring")) == (10, b"value")
+    assert run(backend.get_with_ttl("missing")) == (0, None)
+
+
+def test_inmemory_reclaims_expired(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend = InMemoryBackend()
+    for i in range(10):
+        run(backend.set(f"key{i}", b"value", 1 + i % 2))
+    run(backend.set("forever", b"value"))
+
+    now += 1.5
+    # any operation reclaims expired entries, not only reading those entries
+    run(backend.get("forever"))
+    assert backend.size == 5 * len("key0value") + len("forevervalue")
+    now += 1
+    run(backend.get("forever"))
+    assert backend.size == len("forevervalue")
+
+
+def test_inmemory_lru_eviction() -> None:
+    backend = InMemoryBackend(max_entries=3)
+    for key in ("a", "b", "c"):
+        run(backend.set(key, b"value"))
+    run(backend.get("a"))
+    run(backend.set("d", b"value"))
+    assert [run(backend.get(key)) is not None for key in "abcd"] == [True, False, True, True]
+
+
+def test_inmemory_max_bytes() -> None:
+    backend = InMemoryBackend(max_bytes=100)
+    for i in range(10):
+        run(backend.set(f"key{i}", b"x" * 26))
+    assert backend.size <= 100
+    assert run(backend.get("key9")) is not None
+    assert run(backend.get("key0")) is None
+    # values that can never fit are not stored
+    run(backend.set("huge", b"x" * 200))
+    assert run(backend.get("huge")) is None
+
+
+def test_inmemory_lfu_admission() -> None:
+    backend = InMemoryBackend(max_entries=10, eviction="lfu")
+    hot = [f"hot{i}" for i in range(10)]
+    for key in hot:
+        run(backend.set(key, b"value"))
+        for _ in range(3):
+            run(backend.get(key))
+    # a scan over one-off keys doesn't flush out the frequently used entries
+    for i in range(100):
+        run(backend.set(f"cold{i}", b"value"))
+    assert all(run(backend.get(key)) is not None for key in hot)
+
+
+def test_inmemory_tags_follow_entries() -> None:
+    backend = InMemoryBackend(max_entries=2)
+    for key in ("a", "b", "c"):
+        run(backend.add_tags(key, ["tag"]))
+        run(backend.set(key, b"value"))
+    run(backend.set("b", b"changed"))
+    # evicted entries leave the index, replaced entries keep their tags
+    assert sorted(run(backend.get_tagged_keys(["tag"]))) == ["b", "c"]
+    run(backend.clear(key="c"))
+    assert run(backend.get_tagged_keys(["tag"])) == ["b"]
+
+
+def test_inmemory_clear() -> None:
+    backend = InMemoryBackend()
+    run(backend.set("ns:a", b"value"))
+    run(backend.set("ns:b", b"value"))
+    run(backend.set("other", b"value"))
+    assert run(backend.clear(key="missing")) == 0
+    assert run(backend.clear(namespace="ns")) == 2
+    assert run(backend.clear(key="other")) == 1
+    assert backend.size == 0
+
+
+def test_sqlite_ttl_and_purge(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    backend = sqlite_backend(tmp_path)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    async def main() -> None:
+        await backend.set("forever", b"value")
+        await backend.set("expiring", b"value", 10)
+        assert await backend.get_with_ttl("forever") == (-1, b"value")
+        assert await backend.get_with_ttl("expiring") == (10, b"value")
+
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert await backend.get_with_ttl("expiring") == (0, None)
+        assert await backend.delete_many(["expiring"]) == 0
+        await backend.set("expired", b"value", 1)
+        monkeypatch.setattr(time, "time", lambda: now + 13)
+        assert await backend.purge() == 1
+        await backend.close()
+
+    run(main())
+
+
+def test_sqlite_clear(tmp_path: Path) -> None:
+    backend = sqlite_backend(tmp_path)
+
+    async def main() -> None:
+        await backend.set_many({"ns:a": b"1", "ns:b": b"2", "nt:a": b"3", "n": b"4"})
+        await backend.add_tags("ns:a", ["ns:__tags__:t"])
+        assert await backend.clear(namespace="ns") == 2
+        assert await backend.get_many(["ns:a", "ns:b", "nt:a", "n"]) == [None, None, b"3", b"4"]
+        assert await backend.get_tagged_keys(["ns:__tags__:t"]) == []
+        assert await backend.clear(key="n") == 1
+
+        # tags outside the namespace no longer list the deleted keys
+        await backend.set_many({f"p:ns:{i}": b"1" for i in range(100)})
+        for i in range(100):
+            await backend.add_tags(f"p:ns:{i}", ["p:tags:t", "p:tags:u"])
+        assert await backend.clear(namespace="p:ns") == 100
+        assert await backend.get_tagged_keys(["p:tags:t"]) == []
+        # nor do the tags of deleted keys
+        await backend.set("p:a", b"1")
+        await backend.add_tags("p:a", ["p:tags:t"])
+        assert await backend.delete_many(["p:a"]) == 1
+        assert await backend.get_tagged_keys(["p:tags:t"]) == []
+        await backend.close()
+
+    run(main())
+
+
+def _sqlite_worker(path: str, worker: int) -> None:
+    async def main() -> None:
+        backend = SQLiteBackend(path)
+        for i in range(50):
+            await backend.set(f"{worker}:{i}", str(i).encode(), 60)
+            await backend.incr("counter")
+        await backend.close()
+
+    asyncio.run(main())
+
+
+def test_sqlite_shared_between_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "cache.db")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_sqlite_worker, args=(path, w)) for w in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    async def main() -> None:
+        backend = SQLiteBackend(path)
+        assert await backend.get("counter") == b"200"
+        assert await backend.get_many(["0:0", "3:49"]) == [b"0", b"49"]
+        await backend.close()
+
+    run(main())
+
+
+def test_shared_memory_ttl_and_clear(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    backend = shared_memory_backend(tmp_path)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    async def main() -> None:
+        await backend.set("ns:forever", b"value")
+        await backend.set("ns:expiring", b"value", 10)
+        await backend.set("other", b"value")
+        assert await backend.get_with_ttl("ns:forever") == (-1, b"value")
+        assert await backend.get_with_ttl("ns:expiring") == (10, b"value")
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert await backend.get_with_ttl("ns:expiring") == (0, None)
+
+        assert await backend.clear(namespace="ns") == 1
+        assert await backend.get_many(["ns:forever", "other"]) == [None, b"value"]
+        assert await backend.clear(key="other") == 1
+
+    run(main())
+    backend.close()
+
+
+def test_shared_memory_evicts_oldest(tmp_path: Path) -> None:
+    backend = shared_memory_backend(tmp_path, buckets=64, slab_size=1000)
+
+    async def main() -> None:
+        for i in range(20):
+            await backend.set(f"key{i:02}", b"x" * 100)
+        # the slab holds the last 9 values
+        values = await backend.get_many([f"key{i:02}" for i in range(20)])
+        assert [value is not None for value in values] == [False] * 11 + [True] * 9
+        with pytest.raises(ValueError, match="doesn't fit"):
+            await backend.set("large", b"x" * 1000)
+
+    run(main())
+    # another mapping of the file sees the same entries
+    other = SharedMemoryBackend(backend.path, buckets=64, slab_size=1000)
+    assert run(other.get("key19")) == b"x" * 100
+    with pytest.raises(ValueError, match="not a cache file"):
+        SharedMemoryBackend(backend.path, buckets=32, slab_size=1000)
+    other.close()
+    backend.close()
+
+
+def test_shared_memory_counters(tmp_path: Path) -> None:
+    backend = shared_memory_backend(tmp_path, buckets=64, slab_size=1000, counters=4)
+
+    async def main() -> None:
+        await backend.set("ns:set", b"41")
+        assert await backend.incr("ns:set") == 42
+        assert await backend.incr("ns:counter", 5) == 5
+        # counters aren't evicted when the slab wraps around
+        for i in range(20):
+            await backend.set(f"key{i:02}", b"x" * 100)
+        assert await backend.get_many(["ns:set", "ns:counter"]) == [b"42", b"5"]
+        assert await backend.get_with_ttl("ns:counter") == (-1, b"5")
+
+        # a value replaces a counter
+        await backend.set("ns:set", b"value")
+        assert await backend.get("ns:set") == b"value"
+        await backend.incr("a")
+        await backend.incr("b")
+        await backend.incr("c")
+        with pytest.raises(ValueError, match="counter table is full"):
+            await backend.incr("d")
+        assert await backend.delete_many(["a"]) == 1
+        assert await backend.incr("d") == 1
+        assert await backend.clear(namespace="ns") == 2
+        assert await backend.get_many(["ns:set", "ns:counter", "b"]) == [None, None, b"1"]
+
+    run(main())
+    backend.close()
+
+
+def test_shared_memory_tags(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    backend = shared_memory_backend(tmp_path, buckets=1 << 12, slab_size=1 << 16, tag_slots=16)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    async def main() -> None:
+        keys = [f"key{i}" for i in range(8)]
+        for key in keys:
+            await backend.add_tags(key, ["tag"])
+            await backend.set(key, b"x" * 100)
+        await backend.add_tags(keys[-1], ["tag", "other"])
+        # the tags aren't evicted with the other entries
+        for i in range(1000):
+            await backend.set(f"filler{i}", b"x" * 100)
+        await backend.set_many({key: b"x" * 100 for key in keys})
+        assert sorted(await backend.get_tagged_keys(["tag"])) == keys
+
+        # when the table is full, keys aren't cached without their tags
+        for i in range(7):
+            await backend.add_tags(f"more{i}", ["tag"])
+        with pytest.raises(ValueError, match="tag table is full"):
+            await backend.add_tags("full", ["tag"])
+        assert await backend.invalidate_tags(["tag"]) == 8
+        assert await backend.get_many(keys) == [None] * 8
+        assert await backend.get_tagged_keys(["tag", "other"]) == []
+
+        # the tags of keys that weren't written are reclaimed
+        for i in range(15):
+            await backend.add_tags(f"more{i}", ["tag"])
+        monkeypatch.setattr(time, "time", lambda: now + 61)
+        for i in range(15):
+            await backend.add_tags(f"new{i}", ["tag"])
+        await backend.set("new0", b"value")
+        assert await backend.get_tagged_keys(["tag"]) == ["new0"]
+
+    run(main())
+    backend.close()
+
+
+def _checksum(key: str, body: bytes) -> bytes:
+    return hashlib.blake2b(key.encode() + body, digest_size=8).digest()
+
+
+def _shared_memory_worker(path: str, worker: int, errors: "multiprocessing.Queue[str]") -> None:
+    async def main() -> None:
+        # a small slab, so that values are overwritten while they are read
+        backend = SharedMemoryBackend(path, buckets=256, slab_size=64 * 1024)
+        for i in range(3000):
+            key = f"key{(i * 7 + worker) % 300}"
+            if i % 3 == 0:
+                # the value ends with a checksum of the key and the rest of it
+                body = os.urandom(i % 500 + 1)
+                await backend.set(key, body + _checksum(key, body))
+            elif i % 97 == 0:
+                await backend.incr("counter")
+            else:
+                value = await backend.get(key)
+                if value is not None and value[-8:] != _checksum(key, value[:-8]):
+                    errors.put(f"{key}: {value[:40]!r}")
+        backend.close()
+
+    asyncio.run(main())
+
+
+def test_shared_memory_between_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "cache")
+    SharedMemoryBackend(path, buckets=256, slab_size=64 * 1024).close()
+    context = multiprocessing.get_context("spawn")
+    errors: "multiprocessing.Queue[str]" = context.Queue()
+    workers = [
+        context.Process(target=_shared_memory_worker, args=(path, w, errors))
+        for w in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+    assert errors.empty()
+
+    backend = SharedMemoryBackend(path, buckets=256, slab_size=64 * 1024)
+    # increments are atomic
+    assert run(backend.get("counter")) == str(
+        4 * sum(1 for i in range(3000) if i % 3 and i % 97 == 0)
+    ).encode()
+    backend.close()
+
+
+def _placement(backend: ShardedBackend, keys: List[str]) -> Dict[str, str]:
+    names = {id(shard): name for name, shard in backend.shards.items()}
+    return {key: names[id(backend.shard(key))] for key in keys}
+
+
+def test_sharded_redistribution() -> None:
+    keys = [f"key{i}" for i in range(10_000)]
+    before = _placement(sharded_backend("a", "b", "c", "d"), keys)
+    # keys are spread evenly
+    counts = Counter(before.values())
+    assert min(counts.values()) > 2000
+
+    # a new shard takes about 1/5 of the keys, from all other shards
+    after = _placement(sharded_backend("a", "b", "c", "d", "e"), keys)
+    moved = [key for key in keys if before[key] != after[key]]
+    assert {after[key] for key in moved} == {"e"}
+    assert 1500 < len(moved) < 2500
+
+    # removing a shard only moves its own keys
+    after = _placement(sharded_backend("a", "b", "c"), keys)
+    moved = [key for key in keys if before[key] != after[key]]
+    assert {before[key] for key in moved} == {"d"}
+    assert len(moved) == counts["d"]
+
+
+def test_sharded_weights_and_fan_out() -> None:
+    backend = ShardedBackend(
+        {"small": InMemoryBackend(), "large": InMemoryBackend()}, weights={"large": 3}
+    )
+    counts = Counter(_placement(backend, [f"key{i}" for i in range(10_000)]).values())
+    assert 2.5 < counts["large"] / counts["small"] < 3.5
+    with pytest.raises(ValueError, match="unknown shards: other"):
+        ShardedBackend({"a": InMemoryBackend()}, weights={"other": 2})
+
+    async def main() -> None:
+        await backend.set_many({f"ns:{i}": b"value" for i in range(100)})
+        await backend.set("other", b"value")
+        # both shards have some of the keys
+        for shard in backend.shards.values():
+            assert any(await shard.get_many([f"ns:{i}" for i in range(100)]))
+        assert await backend.clear(namespace="ns") == 100
+        assert await backend.get("other") == b"value"
+
+    run(main())
+
+
+class FakePubSub:
+    def __init__(self, channels: "Dict[str, List[asyncio.Queue[Any]]]") -> None:
+        self.channels = channels
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def subscribe(self, channel: str) -> None:
+        self.channels.setdefault(channel, []).append(self.queue)
+
+    async def listen(self) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            message = await self.queue.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    async def reset(self) -> None:
+        for queues in self.channels.values():
+            if self.queue in queues:
+                queues.remove(self.queue)
+
+
+class FakeRedis:
+    """Just enough of the redis client for pub/sub"""
+
+    def __init__(self) -> None:
+        self.channels: "Dict[str, List[asyncio.Queue[Any]]]" = {}
+        self.published: List[str] = []
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self.channels)
+
+    async def publish(self, channel: str, message: str) -> None:
+        self.published.append(message)
+        for queue in self.channels.get(channel, []):
+            queue.put_nowait({"type": "message", "data": message.encode()})
+
+    def disconnect(self) -> None:
+        """Drop the connections of all subscribers"""
+        for queues in self.channels.values():
+            for queue in queues:
+                queue.put_nowait(ConnectionError("Connection closed by server."))
+            queues.clear()
+
+
+def test_tiered_serves_locally() -> None:
+    async def main() -> None:
+        remote = InMemoryBackend()
+        backend = TieredBackend(remote, local_expire=60)
+        await backend.set("key", b"value", 10)
+        # change the remote value behind the back of the tiered backend
+        await remote.set("key", b"changed", 10)
+        assert await backend.get_with_ttl("key") == (10, b"value")
+
+        await remote.set("other", b"value")
+        assert await backend.get_with_ttl("other") == (-1, b"value")
+        await remote.clear(key="other")
+        assert await backend.get("other") == b"value"
+
+    run(main())
+
+
+def test_tiered_invalidation() -> None:
+    async def main() -> None:
+        redis = FakeRedis()
+        remote = InMemoryBackend()
+        workers = [TieredBackend(remote, redis=redis) for _ in range(2)]  # type: ignore[arg-type]
+        for worker in workers:
+            await worker.init()
+        first, second = workers
+
+        await first.set("ns:key", b"value")
+        assert await second.get("ns:key") == b"value"
+        await first.set("ns:key", b"changed")
+        await asyncio.sleep(0)
+        assert await second.get("ns:key") == b"changed"
+
+        await second.get("ns:other")
+        await remote.set("ns:other", b"value")
+        assert await second.get("ns:other") == b"value"
+        assert await first.clear(namespace="ns") == 2
+        await asyncio.sleep(0)
+        assert await second.get("ns:key") is None
+        assert await second.get("ns:other") is None
+
+        await first.add_tags("ns:key", ["tag"])
+        await first.set("ns:key", b"value")
+        assert await second.get("ns:key") == b"value"
+        assert await first.invalidate_tags(["tag"]) == 1
+        await asyncio.sleep(0)
+        assert await second.get("ns:key") is None
+
+        # batches are broadcast in one message
+        redis.published.clear()
+        await first.set_many({"ns:a": b"1", "ns:b": b"2"})
+        assert await second.get_many(["ns:a", "ns:b"]) == [b"1", b"2"]
+        assert await first.delete_many(["ns:a", "ns:b"]) == 2
+        assert len(redis.published) == 2
+        await asyncio.sleep(0)
+        assert await second.get_many(["ns:a", "ns:b"]) == [None, None]
+
+        for worker in workers:
+            await worker.close()
+
+    run(main())
+
+
+def test_tiered_resubscribes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(tiered, "_RETRY_MIN", 0.01)
+
+    async def main() -> None:
+        redis = FakeRedis()
+        remote = InMemoryBackend()
+        first, second = (TieredBackend(remote, redis=redis) for _ in range(2))  # type: ignore[arg-type]
+        await second.init()
+
+        await first.set("key", b"value")
+        assert await second.get("key") == b"value"
+        redis.disconnect()
+        await asyncio.sleep(0)
+        # invalidations are missed while not subscribed; the local cache is
+        # dropped and bypassed
+        await first.set("key", b"changed")
+        assert await second.get("key") == b"changed"
+        await remote.set("key", b"again")
+        assert await second.get("key") == b"again"
+
+        # subscribed again, after the backoff
+        await asyncio.sleep(0.05)
+        assert await second.get("key") == b"again"
+        await first.set("key", b"last")
+        await asyncio.sleep(0)
+        assert await second.get("key") == b"last"
+        await second.close()
+
+    run(main())
+
+
+class CountingBackend(InMemoryBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.batches: List[Tuple[List[str], Optional[int]]] = []
+
+    async def set_many(
+        self, items: Mapping[str, bytes], expire: Optional[int] = None
+    ) -> None:
+        self.batches.append((sorted(items), expire))
+        await super().set_many(items, expire)
+
+
+def test_write_behind_batches_writes() -> None:
+    async def main() -> None:
+        remote = CountingBackend()
+        backend = WriteBehindBackend(remote, batch_size=3, flush_interval=0.01)
+        await backend.set("a", b"1", 10)
+        await backend.set("b", b"2", 10)
+        await backend.set("a", b"3", 10)
+        await backend.set("c", b"4")
+        # queued values are served before they are written
+        assert await backend.get_with_ttl("a") == (10, b"3")
+        assert await remote.get("a") is None
+
+        await asyncio.sleep(0.05)
+        assert sorted(remote.batches) == [(["a", "b"], 10), (["c"], None)]
+        assert await remote.get("a") == b"3"
+
+        # cleared values are not written
+        await backend.set("d", b"5")
+        await backend.clear(key="d")
+        await asyncio.sleep(0.05)
+        assert await remote.get("d") is None
+        await backend.close()
+
+    run(main())
+
+
+def test_write_behind_drops_and_flushes_on_close() -> None:
+    async def main() -> None:
+        remote = InMemoryBackend()
+        backend = WriteBehindBackend(remote, max_pending=2, flush_interval=60)
+        for key in "abc":
+            await backend.set(key, key.encode())
+        assert backend.dropped == 1
+        newest = WriteBehindBackend(remote, max_pending=2, drop="newest")
+        for key in "xyz":
+            await newest.set(key, key.encode())
+        assert await newest.get_many(["x", "y", "z"]) == [b"x", b"y", None]
+        await newest.close()
+
+        await backend.close()
+        assert await remote.get_many(["a", "b", "c"]) == [None, b"b", b"c"]
+
+    run(main())
+
+
+class FakeMemcache:
+    """Just enough of the aiomcache client for counters, with its errors"""
+
+    def __init__(self) -> None:
+        self.store: Dict[bytes, bytes] = {}
+
+    async def incr(self, key: bytes, increment: int = 1) -> int:
+        if key not in self.store:
+            raise ClientException("Memcached b'incr' command failed", bytearray(b"NOT_FOUND"))
+        if not self.store[key].isdigit():
+            raise ClientException(
+                "Memcached b'incr' command failed",
+                bytearray(b"CLIENT_ERROR cannot increment or decrement non-numeric value"),
+            )
+        self.store[key] = str(int(self.store[key]) + increment).encode()
+        return int(self.store[key])
+
+    async def get(self, key: bytes) -> Optional[bytes]:
+        return self.store.get(key)
+
+    async def add(self, key: bytes, value: bytes) -> bool:
+        return self.store.setdefault(key, value) is value
+
+
+def test_memcached_incr() -> None:
+    async def main() -> None:
+        mcache = FakeMemcache()
+        backend = MemcachedBackend(mcache)  # type: ignore[arg-type]
+        assert await backend.incr("counter") == 1
+        assert await backend.incr("counter", 2) == 3
+        # a value that isn't a number can't be added either, don't retry forever
+        mcache.store[b"text"] = b"text"
+        with pytest.raises(ClientException):
+            await backend.incr("text")
+
+    run(main())
+
+
+class ThrottlingDynamoDB:
+    """Just enough of a DynamoDB client for batch writes, throttling the first ones"""
+
+    def __init__(self, throttled: int) -> None:
+        self.throttled = throttled
+        self.calls = 0
+
+    async def batch_write_item(self, RequestItems: Dict[str, Any]) -> Dict[str, Any]:  # noqa: N803
+        self.calls += 1
+        if self.calls <= self.throttled:
+            return {"UnprocessedItems": RequestItems}
+        return {"UnprocessedItems": {}}
+
+
+def test_dynamodb_backs_off(monkeypatch: pytest.MonkeyPatch) -> None:
+    delays: List[float] = []
+
+    async def sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)
+
+    async def main() -> None:
+        backend = dynamodb.DynamoBackend("cache")
+        backend.client = ThrottlingDynamoDB(throttled=8)  # type: ignore[assignment]
+        await backend.set_many({"a": b"1", "b": b"2"})
+        # unprocessed items are resubmitted after exponentially longer waits
+        assert delays == [0.1, 0.2, 0.4, 0.8, 1.6, 3.2, 5.0, 5.0]
+
+    run(main())
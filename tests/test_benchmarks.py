@@ -0,0 +1,28 @@
+import asyncio
+from typing import Any, Dict, List
+
+from benchmarks import suite
+
+
+def test_suite_runs_on_every_backend() -> None:
+    results = asyncio.run(suite.run(sizes=[100], requests=5))
+    assert len(results) == len(suite.BACKENDS) * len(suite.CODERS) * len(suite.SCENARIOS)
+    assert all(result["rps"] > 0 for result in results)
+
+
+def test_compare() -> None:
+    baseline: List[Dict[str, Any]] = [
+        {
+            "backend": "redis",
+            "coder": "json",
+            "size": 100,
+            "scenario": "hit",
+            "p50_ms": 1.0,
+            "p99_ms": 2.0,
+            "rps": 100.0,
+        }
+    ]
+    results = [{**baseline[0], "p50_ms": 0.5, "rps": 200.0}]
+    (line,) = suite.compare(results, baseline)
+    assert "p50_ms   -50.0%" in line
+    assert "rps  +100.0%" in line
@@ -0,0 +1,36 @@
+import asyncio
+
+from fastapi_cache import chunks, envelope
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+
+def test_writer() -> None:
+    writer = chunks.ChunkWriter("key", chunk_size=4)
+    assert writer.write(b"ab") == {}
+    items = writer.write(b"cdefghij")
+    assert list(items.values()) == [b"abcd", b"efgh"]
+    last, manifest = writer.finish()
+    assert list(last.values()) == [b"ij"]
+    assert manifest == {"chunks": 3, "chunk_id": writer.chunk_id, "size": 10}
+    assert [*items, *last] == chunks.chunk_keys("key", manifest)
+    assert writer.digest().hex() == envelope.digest(b"abcdefghij")
+
+
+def test_split_and_read() -> None:
+    backend = InMemoryBackend()
+    items, manifest = chunks.split("key", b"x" * 10, chunk_size=5)
+    assert len(items) == manifest["chunks"] == 2
+    # every value gets its own chunk keys
+    assert chunks.split("key", b"x" * 10, chunk_size=5)[1]["chunk_id"] != manifest["chunk_id"]
+
+    async def main() -> None:
+        await backend.set_many(items)
+        assert await chunks.read(backend, "key", manifest) == b"x" * 10
+        assert [chunk async for chunk in chunks.iterate(backend, "key", manifest)] == [
+            b"x" * 5,
+            b"x" * 5,
+        ]
+        await backend.clear(key=next(iter(items)))
+        assert await chunks.read(backend, "key", manifest) is None
+
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Any, Generator, List, Optional, Tuple
+
+import pytest
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.circuit_breaker import CircuitBreaker
+from fastapi_cache.decorator import cache
+
+
+class SlowBackend(InMemoryBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.delay = 1.0
+        self.reads: List[str] = []
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        self.reads.append(key)
+        await asyncio.sleep(self.delay)
+        return await super().get_with_ttl(key)
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache() -> Generator[Any, Any, None]:  # pyright: ignore[reportUnusedFunction]
+    yield
+    FastAPICache.reset()
+
+
+def test_states() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=0.05)
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.allow()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    # operations started before the circuit opened don't close it
+    breaker.success()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    # a single probe is let through
+    assert breaker.allow()
+    assert not breaker.allow()
+    # a failed probe opens the circuit again
+    breaker.failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+
+    # failures are counted within failure_window seconds
+    breaker = CircuitBreaker(failure_threshold=2, failure_window=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+
+def test_run() -> None:
+    breaker = CircuitBreaker(failure_threshold=1, get_timeout=0.01)
+
+    async def main() -> None:
+        assert await breaker.run("get", asyncio.sleep(0, "value")) == "value"
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.run("get", asyncio.sleep(1))
+        assert breaker.state == "open"
+
+    asyncio.run(main())
+
+
+def test_decorator_bypasses_slow_backend() -> None:
+    backend = SlowBackend()
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=0.05, get_timeout=0.01)
+    FastAPICache.init(backend, circuit_breaker=breaker)
+    calls: List[int] = []
+
+    @cache(namespace="slow", expire=60)
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        start = time.monotonic()
+        # timeouts count as misses until the circuit opens
+        assert await counter() == 1
+        assert await counter() == 2
+        assert breaker.state == "open"
+        # then the backend isn't used at all
+        assert await counter() == 3
+        assert len(backend.reads) == 2
+        assert time.monotonic() - start < 0.5
+
+        # the backend recovers; the half-open probe closes the circuit
+        backend.delay = 0
+        await asyncio.sleep(0.06)
+        assert await counter() == 2
+        assert breaker.state == "closed"
+
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, Generator, List
+
+import pytest
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.coalesce import Coalescer
+from fastapi_cache.decorator import cache
+
+
+@pytest.fixture(autouse=True)
+def _init_cache() -> Generator[Any, Any, None]:  # pyright: ignore[reportUnusedFunction]
+    FastAPICache.init(InMemoryBackend())
+    yield
+    FastAPICache.reset()
+
+
+def test_coalesce_concurrent_runs() -> None:
+    coalescer = Coalescer()
+    calls: List[int] = []
+
+    async def compute() -> bytes:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"value"
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(*(coalescer.run("key", compute) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results[0] == (True, b"value")
+    assert results[1:] == [(False, b"value")] * 4
+    assert coalescer.coalesced == 4
+    assert coalescer.in_flight == 0
+
+
+def test_coalesce_exception_propagates() -> None:
+    coalescer = Coalescer()
+
+    async def compute() -> bytes:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(
+            *(coalescer.run("key", compute) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert coalescer.in_flight == 0
+
+
+def test_coalesce_leader_cancelled() -> None:
+    coalescer = Coalescer()
+    calls: List[int] = []
+
+    async def compute() -> bytes:
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return b"value"
+
+    async def main() -> Any:
+        leader = asyncio.ensure_future(coalescer.run("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(coalescer.run("key", compute))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        result = await waiter
+        assert leader.cancelled()
+        return result
+
+    # the waiter took over and computed the value itself
+    assert asyncio.run(main()) == (True, b"value")
+    assert len(calls) == 2
+
+
+def test_cache_coalesce() -> None:
+    coalescer = Coalescer()
+    calls: List[int] = []
+
+    @cache(namespace="test", expire=5, coalesce=coalescer)
+    async def expensive(item_id: int) -> int:
+        calls.append(item_id)
+        await asyncio.sleep(0.01)
+        return item_id * 2
+
+    async def main() -> List[Any]:
+        return await asyncio.gather(*(expensive(21) for _ in range(10)))
+
+    assert asyncio.run(main()) == [42] * 10
+    assert calls == [21]
+    assert coalescer.coalesced == 9
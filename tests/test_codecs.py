@@ -4,7 +4,8 @@ from typing import Any, Optional, Tuple, Type
 import pytest
 from pydantic import BaseModel, ValidationError
 
-from fastapi_cache.coder import JsonCoder, PickleCoder
+from fastapi_cache import envelope
+from fastapi_cache.coder import JsonCoder, PickleCoder, compressed
 
 
 @dataclass
@@ -64,3 +65,37 @@ def test_json_coder_validation_error() -> None:
     invalid = b'{"name": "incomplete"}'
     with pytest.raises(ValidationError):
         JsonCoder.decode_as_type(invalid, type_=PDItem)
+
+
+def test_envelope() -> None:
+    payload = JsonCoder.encode({"some_key": 1})
+    packed = envelope.pack(payload, delta=0.25)
+    assert envelope.unpack(packed) == (payload, {"delta": 0.25})
+    # the digest of the payload is stored at a fixed position
+    assert envelope.stored_digest(packed) == envelope.digest(payload)
+    assert envelope.stored_digest(packed[: envelope.HEAD_SIZE]) == envelope.digest(payload)
+    assert envelope.stored_digest(packed[: envelope.HEAD_SIZE - 1]) is None
+    # values without an envelope are passed through
+    assert envelope.unpack(payload) == (payload, {})
+    assert envelope.unpack(PickleCoder.encode(42)) == (PickleCoder.encode(42), {})
+
+
+@pytest.mark.parametrize("algorithm", ["zlib", "gzip", "lzma"])
+def test_compressed_coder(algorithm: Any) -> None:
+    coder = compressed(JsonCoder, algorithm, threshold=100)
+    large = {"items": [PDItem(name=f"item {i}", price=i) for i in range(100)]}
+    encoded = coder.encode(large)
+    assert len(encoded) < len(JsonCoder.encode(large)) / 5
+    assert coder.decode(encoded) == JsonCoder.decode(JsonCoder.encode(large))
+
+    small = PDItem(name="foo", price=42.0)
+    assert coder.decode_as_type(coder.encode(small), type_=PDItem) == small
+    # payloads written without compression are still decoded
+    assert coder.decode(JsonCoder.encode([1, 2])) == [1, 2]
+
+
+def test_compressed_pickle_coder() -> None:
+    coder = compressed(PickleCoder, threshold=0)
+    value = DCItem(name="foo", price=42.0)
+    assert coder.is_gzip(coder.encode(value))
+    assert coder.decode(coder.encode(value)) == value
@@ -1,13 +1,35 @@
+import asyncio
+import logging
 import time
-from typing import Any, Generator
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
 
 import pendulum
 import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel
+from starlette.responses import Response, StreamingResponse
 from starlette.testclient import TestClient
+from typing_extensions import Annotated
 
-from examples.in_memory.main import app
-from fastapi_cache import FastAPICache
+from examples.in_memory.main import app, fetched_items
+from fastapi_cache import FastAPICache, chunks, envelope
 from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import (
+    _recompute_early,  # pyright: ignore[reportPrivateUsage]
+    cache,
+    cache_many,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -97,6 +119,135 @@ def test_pydantic_model() -> None:
         assert r1.json() == r2.json()
 
 
+def test_raw_response() -> None:
+    with TestClient(app) as client:
+        r1 = client.get("/raw_response")
+        assert r1.headers.get("X-FastAPI-Cache") == "MISS"
+        r2 = client.get("/raw_response")
+        assert r2.headers.get("X-FastAPI-Cache") == "HIT"
+        assert r2.headers["content-type"] == "application/json"
+        assert r1.content == r2.content
+        assert r2.json()["description"] == "Served from raw bytes"
+
+        r3 = client.get("/raw_response", headers={"If-None-Match": r2.headers["etag"]})
+        assert r3.status_code == 304
+
+
+class Public(BaseModel):
+    name: str
+
+
+class Private(Public):
+    email: str
+
+
+def test_raw_response_model() -> None:
+    private_app = FastAPI()
+
+    @private_app.get("/user", response_model=Public, response_model_exclude_unset=True)
+    @cache(namespace="test", expire=5, raw_response=True)
+    async def user() -> Any:
+        return Private(name="a", email="a@example.com")
+
+    @cache(namespace="test", expire=5, raw_response=True)
+    async def annotated() -> Public:
+        return Private(name="b", email="a@example.com")
+
+    with TestClient(private_app) as client:
+        for status in ("MISS", "HIT"):
+            response = client.get("/user")
+            assert response.headers.get("X-FastAPI-Cache") == status
+            assert response.json() == {"name": "a"}
+
+    async def main() -> None:
+        for _ in range(2):
+            response = await annotated()
+            assert isinstance(response, Response)
+            assert response.body == b'{"name":"b"}'
+
+    asyncio.run(main())
+
+
+def test_etag() -> None:
+    reads: List[str] = []
+
+    class CountingBackend(InMemoryBackend):
+        async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+            reads.append("value")
+            return await super().get_with_ttl(key)
+
+        async def get_head_with_ttl(
+            self, key: str, size: int
+        ) -> Tuple[int, Optional[bytes]]:
+            reads.append("head")
+            ttl, value = await InMemoryBackend.get_with_ttl(self, key)
+            return ttl, value and value[:size]
+
+    FastAPICache.reset()
+    backend = CountingBackend()
+    FastAPICache.init(backend)
+    with TestClient(app) as client:
+        r1 = client.get("/pydantic_instance")
+        (key,) = backend._store  # pyright: ignore[reportPrivateUsage]
+        value = asyncio.run(backend.get(key))
+        assert value is not None
+        # the ETag is a hash of the cached payload, the same in every process
+        etag = f'W/"{envelope.digest(envelope.unpack(value)[0])}"'
+        assert r1.headers["etag"] == etag
+        assert client.get("/pydantic_instance").headers["etag"] == etag
+
+        # conditional requests only read the head of the cached value
+        reads.clear()
+        r2 = client.get("/pydantic_instance", headers={"If-None-Match": f'"other", {etag}'})
+        assert r2.status_code == 304
+        assert r2.headers["etag"] == etag
+        assert reads == ["head"]
+
+        reads.clear()
+        r3 = client.get("/pydantic_instance", headers={"If-None-Match": '"other"'})
+        assert r3.status_code == 200
+        assert reads == ["head", "value"]
+
+        # values cached by older versions, without an envelope, have no digest
+        payload = envelope.unpack(value)[0]
+        asyncio.run(backend.set(key, payload))
+        r4 = client.get("/pydantic_instance", headers={"If-None-Match": etag})
+        assert r4.status_code == 304
+        assert r4.headers["etag"] == f'W/"{envelope.digest(payload)}"'
+
+
+def test_compressed_raw_response() -> None:
+    with TestClient(app) as client:
+        r1 = client.get("/compressed_response")
+        assert r1.headers.get("X-FastAPI-Cache") == "MISS"
+        r2 = client.get("/compressed_response")
+        assert r2.headers.get("X-FastAPI-Cache") == "HIT"
+        assert r2.headers["content-encoding"] == "gzip"
+        assert int(r2.headers["content-length"]) < len(r2.content) / 5
+        assert r1.json() == r2.json()
+
+        r3 = client.get("/compressed_response", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r3.headers
+        assert r3.json() == r1.json()
+
+
+def test_raw_response_object() -> None:
+    @cache(namespace="test", expire=5, raw_response=True)
+    async def created() -> Response:
+        return Response(b"created", status_code=201, headers={"X-Custom": "1"})
+
+    async def main() -> None:
+        for status in ("MISS", "HIT"):
+            response = await created()
+            assert isinstance(response, Response)
+            assert response.status_code == 201
+            assert response.body == b"created"
+            assert response.headers["x-custom"] == "1"
+            assert response.headers["x-fastapi-cache"] == status
+
+    asyncio.run(main())
+
+
 def test_non_get() -> None:
     with TestClient(app) as client:
         response = client.put("/uncached_put")
@@ -112,3 +263,573 @@ def test_alternate_injected_namespace() -> None:
         response = client.get("/namespaced_injection")
         assert response.headers.get("X-FastAPI-Cache") == "MISS"
         assert response.json() == {"__fastapi_cache_request": 42, "__fastapi_cache_response": 17}
+
+
+def test_stale_while_revalidate() -> None:
+    calls: List[int] = []
+
+    def key_builder(*args: Any, **kwargs: Any) -> str:
+        return "test:swr"
+
+    @cache(namespace="test", expire=5, stale_while_revalidate=10, key_builder=key_builder)
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        assert await counter() == 1
+        ttl, _ = await backend.get_with_ttl("test:swr")
+        assert ttl > 10
+
+        # move the entry into its grace period; the stale value is served
+        await backend.set("test:swr", envelope.pack(b"1"), 10)
+        assert await counter() == 1
+        await asyncio.sleep(0.01)  # let the background revalidation run
+
+        ttl, value = await backend.get_with_ttl("test:swr")
+        assert value is not None
+        assert envelope.unpack(value)[0] == b"2"
+        assert ttl > 10
+        assert await counter() == 2
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_stale_while_revalidate_warns(caplog: pytest.LogCaptureFixture) -> None:
+    async def get_db() -> AsyncIterator[str]:
+        yield "session"
+
+    with caplog.at_level(logging.WARNING, logger="fastapi_cache.decorator"):
+
+        @cache(expire=5, stale_while_revalidate=10)
+        async def plain(db: str = Depends(lambda: "session")) -> int:
+            return 1
+
+        assert not caplog.records
+
+        @cache(expire=5, stale_while_revalidate=10)
+        async def scoped(
+            request: Request,
+            db: Annotated[str, Depends(get_db)],
+            other: str = Depends(get_db),
+        ) -> int:
+            return 1
+
+    (record,) = caplog.records
+    assert "request, db, other" in record.getMessage()
+
+
+def test_recompute_early() -> None:
+    assert not any(_recompute_early(3600, 0.01, 1.0) for _ in range(1000))
+    assert any(_recompute_early(1, 0.5, 1.0) for _ in range(1000))
+
+
+def test_early_recompute() -> None:
+    calls: List[int] = []
+
+    def key_builder(*args: Any, **kwargs: Any) -> str:
+        return "test:xfetch"
+
+    @cache(namespace="test", expire=60, early_recompute_beta=1.0, key_builder=key_builder)
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        assert await counter() == 1
+        assert await counter() == 1
+        value = await backend.get("test:xfetch")
+        assert value is not None
+        assert envelope.unpack(value)[1]["delta"] >= 0
+
+        # a value that took very long to compute is recomputed well before expiry
+        await backend.set("test:xfetch", envelope.pack(b"1", delta=3600), 30)
+        assert await counter() == 2
+
+    asyncio.run(main())
+
+
+def test_cache_many() -> None:
+    with TestClient(app) as client:
+        fetched_items.clear()
+        response = client.get("/items", params={"ids": [1, 2]})
+        assert response.headers.get("X-FastAPI-Cache") == "MISS"
+        assert response.json() == {"1": "item 1", "2": "item 2"}
+
+        response = client.get("/items", params={"ids": [3, 2]})
+        assert response.headers.get("X-FastAPI-Cache") == "PARTIAL"
+        assert list(response.json().items()) == [("3", "item 3"), ("2", "item 2")]
+        assert fetched_items == [1, 2, 3]
+
+        response = client.get("/items", params={"ids": [2, 1, 3]})
+        assert response.headers.get("X-FastAPI-Cache") == "HIT"
+        assert list(response.json()) == ["2", "1", "3"]
+        assert fetched_items == [1, 2, 3]
+
+
+def test_cache_many_sequence() -> None:
+    calls: List[str] = []
+
+    @cache_many("ids", namespace="test", item_id=lambda item: item["id"])
+    async def lookup(ids: str, suffix: str = "") -> List[Dict[str, str]]:
+        calls.append(ids)
+        # unknown ids are left out of the result
+        return [{"id": i, "name": i + suffix} for i in ids.split(",") if i != "x"]
+
+    async def main() -> None:
+        assert await lookup("a,b,x") == [{"id": "a", "name": "a"}, {"id": "b", "name": "b"}]
+        assert await lookup("c,a,b") == [
+            {"id": "c", "name": "c"},
+            {"id": "a", "name": "a"},
+            {"id": "b", "name": "b"},
+        ]
+        assert calls == ["a,b,x", "c"]
+        # other arguments are part of the cache keys
+        assert await lookup("a", suffix="!") == [{"id": "a", "name": "a!"}]
+
+    asyncio.run(main())
+
+
+def test_cache_many_duplicate_ids() -> None:
+    calls: List[List[int]] = []
+
+    @cache_many("ids", namespace="duplicates")
+    async def lookup(ids: List[int]) -> List[str]:
+        calls.append(ids)
+        return [f"item {i}" for i in ids]
+
+    async def main() -> None:
+        # duplicates are returned like the endpoint returns them, and fetched once
+        assert await lookup([1, 1, 2]) == ["item 1", "item 1", "item 2"]
+        assert await lookup([2, 3, 2, 1]) == ["item 2", "item 3", "item 2", "item 1"]
+        assert calls == [[1, 2], [3]]
+
+    asyncio.run(main())
+
+
+def test_cache_many_dependencies() -> None:
+    class Session:
+        """Stand-in for a database session, a new one for each request"""
+
+    calls: List[str] = []
+
+    @cache_many("ids", namespace="test")
+    async def lookup(ids: str, db: Session, user: Optional[str] = None) -> Dict[str, str]:
+        calls.append(ids)
+        return {i: f"{i} for {user}" for i in ids.split(",")}
+
+    async def main() -> None:
+        assert await lookup("a,b", Session()) == {"a": "a for None", "b": "b for None"}
+        assert await lookup("b,a", Session()) == {"b": "b for None", "a": "a for None"}
+        assert calls == ["a,b"]
+        assert await lookup("a", Session(), user="u") == {"a": "a for u"}
+        assert calls == ["a,b", "a"]
+
+    asyncio.run(main())
+
+
+def test_tags() -> None:
+    with TestClient(app) as client:
+        assert client.get("/products/a1").json() == {"sku": "a1", "name": "Apple"}
+        assert client.get("/products/b2").json() == {"sku": "b2", "name": "Banana"}
+        assert client.put("/products/a1", params={"name": "Apricot"}).json() == 1
+        response = client.get("/products/a1")
+        assert response.headers.get("X-FastAPI-Cache") == "MISS"
+        assert response.json() == {"sku": "a1", "name": "Apricot"}
+        # other products are unaffected
+        assert client.get("/products/b2").headers.get("X-FastAPI-Cache") == "HIT"
+
+
+def test_tags_callable() -> None:
+    calls: List[int] = []
+
+    @cache(expire=60, tags=lambda user_id, page=1: [f"user:{user_id}", "users"])
+    async def user_page(user_id: int, page: int = 1) -> int:
+        calls.append(user_id)
+        return len(calls)
+
+    async def main() -> None:
+        assert await user_page(1) == 1
+        assert await user_page(2, page=2) == 2
+        assert await user_page(1) == 1
+        assert await FastAPICache.invalidate_tags("user:1") == 1
+        assert await user_page(1) == 3
+        assert await user_page(2, page=2) == 2
+        assert await FastAPICache.invalidate_tags("users", "missing") == 2
+        assert await user_page(2, page=2) == 4
+
+    asyncio.run(main())
+
+
+def test_tags_unknown_argument() -> None:
+    # a typo in a tag fails when the endpoint is decorated, not after it ran
+    with pytest.raises(ValueError, match="'skuu', which is not one of its parameters"):
+
+        @cache(expire=60, tags=["product:{skuu}"])
+        async def product(sku: str) -> str:
+            return sku
+
+    @cache(expire=60, tags=["product:{product.sku}", "first:{skus[0]}", "{{literal}}"])
+    async def products(product: Any, skus: List[str]) -> None:
+        pass
+
+
+def test_settings_follow_init() -> None:
+    calls: List[int] = []
+
+    @cache(namespace="settings")
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        response = Response()
+        await counter(__fastapi_cache_response=response)  # type: ignore[call-arg]
+        assert response.headers["cache-control"] == "max-age=None"
+
+        # settings are resolved again after init, they are not frozen by the
+        # first call
+        FastAPICache.reset()
+        backend = InMemoryBackend()
+        FastAPICache.init(backend, prefix="other", expire=30)
+        response = Response()
+        assert await counter(__fastapi_cache_response=response) == 2  # type: ignore[call-arg]
+        assert response.headers["cache-control"] == "max-age=30"
+        assert await backend.clear(namespace="other:settings") == 1
+
+    asyncio.run(main())
+
+
+async def generations(namespace: str) -> List[int]:
+    full_namespace = await FastAPICache.get_namespace(namespace)
+    return [int(g) for g in full_namespace.rpartition(":v")[2].split(".")]
+
+
+def test_versioned_namespaces() -> None:
+    FastAPICache.reset()
+    backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix="app", versioned_namespaces=True)
+    calls: List[int] = []
+
+    @cache(namespace="versioned", expire=60)
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        assert await counter() == 1
+        assert await counter() == 1
+        prefix, namespace = await generations("versioned")
+
+        # clearing only increments the generation of the namespace
+        assert await FastAPICache.clear(namespace="versioned") == 0
+        assert await generations("versioned") == [prefix, namespace + 1]
+        assert await counter() == 2
+        assert await counter() == 2
+
+        # clearing the prefix invalidates all namespaces
+        await FastAPICache.clear()
+        assert await generations("versioned") == [prefix + 1, namespace + 1]
+        assert await counter() == 3
+
+        # the old entries are left to expire
+        assert await backend.clear(namespace="app:versioned") == 3
+
+    asyncio.run(main())
+
+
+def test_versioned_namespaces_generation_cache() -> None:
+    FastAPICache.reset()
+    backend = InMemoryBackend()
+    FastAPICache.init(backend, versioned_namespaces=True, generation_cache_ttl=60)
+
+    async def main() -> None:
+        prefix, namespace = await generations("test")
+        # another worker clears the namespace; this worker sees it later
+        await backend.incr("__fastapi_cache_generation__::test")
+        assert await generations("test") == [prefix, namespace]
+        # clearing in this worker is seen immediately
+        await FastAPICache.clear(namespace="test")
+        assert await generations("test") == [prefix, namespace + 2]
+
+    asyncio.run(main())
+
+
+def test_versioned_namespaces_evicted_generation() -> None:
+    FastAPICache.reset()
+    backend = InMemoryBackend(max_entries=4)
+    FastAPICache.init(backend, prefix="app", versioned_namespaces=True)
+    calls: List[int] = []
+
+    @cache(namespace="evicted", expire=60)
+    async def counter() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main() -> None:
+        assert await counter() == 1
+        await FastAPICache.clear(namespace="evicted")
+        # the cleared entry is used again, and other entries push the less
+        # recently used generation counters out of the backend
+        store = backend._store  # pyright: ignore[reportPrivateUsage]
+        await backend.get(next(key for key in store if key.startswith("app:evicted:")))
+        await backend.set_many({"other:a": b"1", "other:b": b"2", "other:c": b"3"})
+        assert await backend.get("__fastapi_cache_generation__:app:evicted") is None
+
+        # the namespace doesn't return to the cleared generation
+        assert await counter() == 2
+        assert await counter() == 2
+
+    asyncio.run(main())
+
+
+def test_profile() -> None:
+    phases: List[Tuple[str, str]] = []
+
+    @contextmanager
+    def span(phase: str, attributes: Mapping[str, str]) -> Iterator[None]:
+        phases.append((phase, attributes["namespace"]))
+        yield
+
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), profiling_hooks=[span])
+
+    @cache(namespace="profiled", profile=True)
+    async def profiled() -> int:
+        return 42
+
+    def timed(response: Response) -> List[str]:
+        timings = [timing.split(";dur=") for timing in response.headers["server-timing"].split(", ")]
+        assert all(float(duration) >= 0 for _, duration in timings)
+        return [name for name, _ in timings]
+
+    async def main() -> None:
+        response = Response()
+        assert await profiled(__fastapi_cache_response=response) == 42  # type: ignore[call-arg]
+        assert timed(response) == [
+            "cache-key", "cache-get", "endpoint", "cache-encode", "cache-set"
+        ]  # fmt: skip
+        assert [phase for phase, _ in phases] == timed(response)
+        assert {namespace for _, namespace in phases} == {"profiled"}
+
+        response = Response()
+        assert await profiled(__fastapi_cache_response=response) == 42  # type: ignore[call-arg]
+        assert timed(response) == ["cache-key", "cache-get", "cache-decode"]
+
+    asyncio.run(main())
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def test_cache_errors() -> None:
+    calls: List[str] = []
+
+    @cache(namespace="errors", expire=60, negative_expire=5, cache_errors=[404, OutOfStock])
+    async def item(name: str) -> Any:
+        calls.append(name)
+        if name == "missing":
+            raise HTTPException(404, detail="Not found", headers={"X-Item": name})
+        if name == "sold":
+            raise OutOfStock(name, 0)
+        if name == "gone":
+            return Response(b"gone", status_code=404)
+        if name == "broken":
+            raise HTTPException(500)
+        return name
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        for _ in range(2):
+            response = Response()
+            with pytest.raises(HTTPException) as info:
+                await item("missing", __fastapi_cache_response=response)  # type: ignore[call-arg]
+            assert info.value.status_code == 404
+            assert info.value.detail == "Not found"
+            assert info.value.headers is not None
+            assert info.value.headers["X-Item"] == "missing"
+        # replayed from the cache, with the cache headers
+        assert info.value.headers is not None
+        assert info.value.headers["X-FastAPI-Cache"] == "HIT"
+        assert calls == ["missing"]
+
+        for _ in range(2):
+            with pytest.raises(OutOfStock) as stock:
+                await item("sold")
+            assert stock.value.args == ("sold", 0)
+        assert calls == ["missing", "sold"]
+
+        for _ in range(2):
+            response = Response()
+            result = await item("gone", __fastapi_cache_response=response)  # type: ignore[call-arg]
+            assert isinstance(result, Response)
+            assert (result.status_code, result.body) == (404, b"gone")
+        assert result.headers["X-FastAPI-Cache"] == "HIT"
+        assert "ETag" not in result.headers
+        assert calls == ["missing", "sold", "gone"]
+
+        # other errors aren't cached
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await item("broken")
+        assert calls[-2:] == ["broken", "broken"]
+
+        # cached errors expire after negative_expire
+        assert await item("ok") == "ok"
+        keys = list(backend._store)  # type: ignore[attr-defined]
+        ttls = sorted([(await backend.get_with_ttl(key))[0] for key in keys])
+        assert ttls == [5, 5, 5, 60]
+
+    asyncio.run(main())
+
+
+def test_negative_expire() -> None:
+    calls: List[int] = []
+
+    @cache(namespace="empty", expire=60, negative_expire=1)
+    async def search(query: str) -> List[str]:
+        calls.append(1)
+        return [query] if query else []
+
+    async def main() -> None:
+        response = Response()
+        assert await search("", __fastapi_cache_response=response) == []  # type: ignore[call-arg]
+        assert response.headers["Cache-Control"] == "max-age=1"
+        assert "ETag" not in response.headers
+        assert await search("") == []
+        assert await search("a") == ["a"]
+        assert len(calls) == 2
+
+        backend = FastAPICache.get_backend()
+        keys = list(backend._store)  # type: ignore[attr-defined]
+        ttls = sorted([(await backend.get_with_ttl(key))[0] for key in keys])
+        assert ttls == [1, 60]
+
+    asyncio.run(main())
+
+
+async def _read_body(response: StreamingResponse) -> bytes:
+    return b"".join(
+        [chunk if isinstance(chunk, bytes) else chunk.encode() async for chunk in response.body_iterator]
+    )
+
+
+def test_streaming_response() -> None:
+    calls: List[int] = []
+
+    @cache(namespace="stream", expire=60, chunk_size=1000)
+    async def export(rows: int) -> StreamingResponse:
+        calls.append(rows)
+
+        async def generate() -> AsyncIterator[str]:
+            for row in range(rows):
+                yield f"{row:0>99}\n"
+
+        return StreamingResponse(generate(), media_type="text/csv")
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        expected = "".join(f"{row:0>99}\n" for row in range(25)).encode()
+
+        response = Response()
+        result = await export(25, __fastapi_cache_response=response)  # type: ignore[call-arg]
+        assert isinstance(result, StreamingResponse)
+        assert result.headers["X-FastAPI-Cache"] == "MISS"
+        assert "ETag" not in result.headers
+        assert await _read_body(result) == expected
+        # the body is stored in chunks, next to the manifest
+        assert len(backend._store) == 1 + 3  # type: ignore[attr-defined]
+
+        result = await export(25, __fastapi_cache_response=response)  # type: ignore[call-arg]
+        assert isinstance(result, StreamingResponse)
+        assert result.headers["X-FastAPI-Cache"] == "HIT"
+        assert result.headers["content-type"] == "text/csv; charset=utf-8"
+        assert result.headers["ETag"] == f'W/"{envelope.digest(expected)}"'
+        assert await _read_body(result) == expected
+        assert calls == [25]
+
+        # an interrupted stream isn't cached
+        result = await export(30)
+        assert isinstance(result, StreamingResponse)
+        iterator = result.body_iterator
+        await iterator.__anext__()  # type: ignore[attr-defined]
+        await iterator.aclose()  # type: ignore[attr-defined]
+        result = await export(30)
+        assert isinstance(result, StreamingResponse)
+        assert await _read_body(result) == "".join(f"{row:0>99}\n" for row in range(30)).encode()
+        assert calls == [25, 30, 30]
+
+    asyncio.run(main())
+
+
+def test_chunks_are_removed_with_their_entry() -> None:
+    @cache(namespace="stream", tags=["export"], chunk_size=1000)
+    async def export(rows: int) -> StreamingResponse:
+        async def generate() -> AsyncIterator[str]:
+            for row in range(rows):
+                yield f"{row:0>99}\n"
+
+        return StreamingResponse(generate(), media_type="text/csv")
+
+    @cache(namespace="chunked", tags=["numbers"], chunk_size=100)
+    async def numbers(count: int) -> List[int]:
+        return list(range(count))
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        store = backend._store  # type: ignore[attr-defined]
+        for _ in range(2):
+            result = await export(25)
+            assert isinstance(result, StreamingResponse)
+            await _read_body(result)
+            assert len(store) == 1 + 3
+            # chunked entries expire, even without an expire time
+            for key in list(store):
+                ttl, _ = await backend.get_with_ttl(key)
+                assert 0 < ttl <= chunks.MAX_EXPIRE
+            # the chunks carry the tags of the entry
+            assert await FastAPICache.invalidate_tags("export") == 4
+            assert not store
+
+        await numbers(100)
+        manifest = min(store, key=len)
+        assert len(store) > 2
+        # clearing the entry removes its chunks
+        assert await FastAPICache.clear(key=manifest) == 1
+        assert not store
+
+    asyncio.run(main())
+
+
+def test_chunked_values() -> None:
+    calls: List[int] = []
+
+    @cache(namespace="chunked", expire=60, chunk_size=100)
+    async def numbers(count: int) -> List[int]:
+        calls.append(count)
+        return list(range(count))
+
+    async def main() -> None:
+        backend = FastAPICache.get_backend()
+        assert await numbers(100) == list(range(100))
+        assert await numbers(100) == list(range(100))
+        assert calls == [100]
+        # the chunk keys extend the key of the manifest
+        manifest, *keys = sorted(backend._store, key=len)  # type: ignore[attr-defined]
+        values = await backend.get_many(keys)
+        assert len(values) > 1
+        assert all(len(value or b"") <= 100 for value in values)
+        value = await backend.get(manifest)
+        assert value is not None
+        assert envelope.unpack(value)[0] == b""
+
+        # an entry with a missing chunk is a miss
+        await backend.clear(key=keys[-1])
+        assert await numbers(100) == list(range(100))
+        assert calls == [100, 100]
+
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+import dataclasses
+import datetime
+import enum
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pytest
+from pydantic import BaseModel
+
+from fastapi_cache import CanonicalKeyBuilder
+
+
+class Color(enum.Enum):
+    red = "red"
+
+
+class Filters(BaseModel):
+    tags: List[str]
+
+
+class Session:
+    """Stand-in for a dependency with an identity based repr"""
+
+
+class User(BaseModel):
+    id: int
+    roles: Set[str] = set()
+
+
+@dataclasses.dataclass
+class Page:
+    number: int
+    size: int = 10
+
+
+def endpoint(
+    sku: str, page: int = 1, filters: Optional[Filters] = None, db: Any = None
+) -> None:
+    ...
+
+
+def build(builder: CanonicalKeyBuilder, *args: Any, **kwargs: Any) -> str:
+    return builder(endpoint, "ns", args=args, kwargs=kwargs)
+
+
+def test_canonical_keys() -> None:
+    builder = CanonicalKeyBuilder()
+    key = build(builder, "a1")
+    assert key.startswith("ns:")
+    assert len(key) == len("ns:") + 32
+    # positional, keyword and default arguments give the same key
+    assert build(builder, sku="a1") == key
+    assert build(builder, "a1", page=1) == key
+    assert build(builder, "a1", 2) != key
+    # arguments that can't be encoded canonically are left out
+    assert build(builder, "a1", db=Session()) == build(builder, "a1", db=Session())
+    # a new builder (e.g. in another worker) gives the same keys
+    assert build(CanonicalKeyBuilder(), "a1") == key
+
+
+def test_models_and_dataclasses() -> None:
+    builder = CanonicalKeyBuilder()
+    # e.g. the current user, injected with Depends(), must be part of the key
+    assert build(builder, "a1", db=User(id=1)) != build(builder, "a1", db=User(id=2))
+    assert build(builder, "a1", db=User(id=1, roles={"a", "b", "c"})) == build(
+        builder, "a1", db=User(id=1, roles={"c", "b", "a"})
+    )
+    assert build(builder, "a1", filters=Filters(tags=["x"])) != build(
+        builder, "a1", filters=Filters(tags=["y"])
+    )
+    assert build(builder, "a1", db=Page(1)) != build(builder, "a1", db=Page(2))
+    assert build(builder, "a1", db=Page(1)) == build(builder, "a1", db=Page(1, 10))
+
+
+def test_dropped_arguments(caplog: pytest.LogCaptureFixture) -> None:
+    builder = CanonicalKeyBuilder()
+    with caplog.at_level(logging.WARNING, logger="fastapi_cache.key_builder"):
+        build(builder, "a1", db=Session())
+        build(builder, "a1", db=Session())
+    # logged once per type
+    assert len(caplog.records) == 1
+    assert "'db'" in caplog.records[0].getMessage()
+
+    caplog.clear()
+    excluding = CanonicalKeyBuilder(exclude=[Session, User])
+    with caplog.at_level(logging.WARNING, logger="fastapi_cache.key_builder"):
+        assert build(excluding, "a1", db=Session()) == build(excluding, "a1", db=Session())
+        assert build(excluding, "a1", db=User(id=1)) == build(excluding, "a1", db=User(id=2))
+    assert not caplog.records
+
+
+@pytest.mark.parametrize(
+    ("first", "second"),
+    [
+        ({"b", "a", "c"}, {"c", "b", "a"}),
+        ({"x": 1, "y": 2}, {"y": 2, "x": 1}),
+        (Color.red, "red"),
+        (datetime.date(2023, 1, 2), "2023-01-02"),
+    ],
+)
+def test_canonical_values(first: Any, second: Any) -> None:
+    builder = CanonicalKeyBuilder()
+    assert build(builder, first) == build(builder, second)
+
+
+def test_bytes_differ_from_strings() -> None:
+    builder = CanonicalKeyBuilder()
+    assert build(builder, b"a1") != build(builder, "a1")
+    assert build(builder, b"a1") == build(builder, b"a1")
+
+
+def test_params() -> None:
+    builder = CanonicalKeyBuilder(params=["sku", "filters"])
+    key = build(builder, "a1", filters=Filters(tags=["x"]))
+    # only the listed params are part of the key, also non-primitive ones
+    assert build(builder, "a1", 3, Filters(tags=["x"])) == key
+    assert build(builder, "a1", filters=Filters(tags=["y"])) != key
+
+
+def test_function_prefix() -> None:
+    def other(
+        sku: str, page: int = 1, filters: Optional[Filters] = None, db: Any = None
+    ) -> None:
+        ...
+
+    builder = CanonicalKeyBuilder()
+    args: Tuple[Any, ...] = ("a1",)
+    kwargs: Dict[str, Any] = {}
+    assert builder(other, "ns", args=args, kwargs=kwargs) != build(builder, "a1")
@@ -0,0 +1,136 @@
+import asyncio
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+import pytest
+from starlette.testclient import TestClient
+
+from fastapi_cache import FastAPICache, metrics
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache, cache_many
+from fastapi_cache.metrics import PrometheusMetrics
+
+
+class FailingBackend(InMemoryBackend):
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        raise ConnectionError("backend down")
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache() -> Generator[Any, Any, None]:  # pyright: ignore[reportUnusedFunction]
+    yield
+    FastAPICache.reset()
+
+
+def test_render() -> None:
+    sink = PrometheusMetrics(buckets={"latency_seconds": [0.1, 1.0]})
+    sink.increment(metrics.HITS, {"namespace": "items", "backend": "Redis"})
+    sink.increment(metrics.HITS, {"namespace": "items", "backend": "Redis"}, 2)
+    sink.increment(metrics.MISSES, {"namespace": 'say "hi"', "backend": "Redis"})
+    sink.observe("latency_seconds", {"operation": "get"}, 0.05)
+    sink.observe("latency_seconds", {"operation": "get"}, 5)
+
+    assert sink.get(metrics.HITS, namespace="items", backend="Redis") == 3
+    assert sink.get("latency_seconds", operation="get") == 2
+    assert sink.render().splitlines() == [
+        "# HELP fastapi_cache_hits_total Requests served from the cache",
+        "# TYPE fastapi_cache_hits_total counter",
+        'fastapi_cache_hits_total{backend="Redis",namespace="items"} 3',
+        "# HELP fastapi_cache_misses_total Requests not found in the cache",
+        "# TYPE fastapi_cache_misses_total counter",
+        'fastapi_cache_misses_total{backend="Redis",namespace="say \\"hi\\""} 1',
+        "# HELP latency_seconds latency_seconds",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{operation="get",le="0.1"} 1',
+        'latency_seconds_bucket{operation="get",le="1.0"} 1',
+        'latency_seconds_bucket{operation="get",le="+Inf"} 2',
+        'latency_seconds_sum{operation="get"} 5.05',
+        'latency_seconds_count{operation="get"} 2',
+    ]
+
+
+def test_decorator_metrics() -> None:
+    sink = PrometheusMetrics()
+    FastAPICache.init(InMemoryBackend(), metrics=sink)
+
+    @cache(namespace="metrics", expire=60)
+    async def square(x: int) -> int:
+        return x * x
+
+    async def main() -> None:
+        assert await square(2) == 4
+        assert await square(2) == 4
+        assert await square(3) == 9
+
+    asyncio.run(main())
+    labels = {"namespace": "metrics", "backend": "InMemoryBackend"}
+    assert sink.get(metrics.HITS, **labels) == 1
+    assert sink.get(metrics.MISSES, **labels) == 2
+    assert sink.get(metrics.BACKEND_DURATION, operation="get", **labels) == 3
+    assert sink.get(metrics.BACKEND_DURATION, operation="set", **labels) == 2
+    assert sink.get(metrics.CODER_DURATION, operation="encode", **labels) == 2
+    assert sink.get(metrics.CODER_DURATION, operation="decode", **labels) == 1
+    assert sink.get(metrics.PAYLOAD_BYTES, operation="get", **labels) == 1
+    assert sink.get(metrics.PAYLOAD_BYTES, operation="set", **labels) == 2
+
+    response = TestClient(sink).get("/")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'fastapi_cache_hits_total{backend="InMemoryBackend",namespace="metrics"} 1'
+        in response.text
+    )
+
+
+def test_decorator_error_metrics() -> None:
+    sink = PrometheusMetrics()
+    FastAPICache.init(FailingBackend(), metrics=sink)
+
+    @cache(namespace="metrics")
+    async def square(x: int) -> int:
+        return x * x
+
+    async def main() -> None:
+        assert await square(2) == 4
+
+    asyncio.run(main())
+    labels = {"namespace": "metrics", "backend": "FailingBackend"}
+    assert sink.get(metrics.ERRORS, operation="get", **labels) == 1
+    assert sink.get(metrics.MISSES, **labels) == 1
+
+
+def test_cache_many_metrics() -> None:
+    sink = PrometheusMetrics()
+    FastAPICache.init(InMemoryBackend(), metrics=sink)
+
+    @cache_many("ids", namespace="squares")
+    async def squares(ids: List[int]) -> Dict[int, int]:
+        return {i: i * i for i in ids}
+
+    async def main() -> None:
+        await squares([1, 2])
+        await squares([1, 2, 3])
+
+    asyncio.run(main())
+    labels = {"namespace": "squares", "backend": "InMemoryBackend"}
+    assert sink.get(metrics.HITS, **labels) == 2
+    assert sink.get(metrics.MISSES, **labels) == 3
+    assert sink.get(metrics.PAYLOAD_BYTES, operation="set", **labels) == 3
+
+
+def test_negative_metrics() -> None:
+    sink = PrometheusMetrics()
+    FastAPICache.init(InMemoryBackend(), metrics=sink)
+
+    @cache(namespace="lookup", negative_expire=5)
+    async def lookup(name: str) -> Optional[str]:
+        return name or None
+
+    async def main() -> None:
+        for name in ["", "", "a", "a"]:
+            await lookup(name)
+
+    asyncio.run(main())
+    labels = {"namespace": "lookup", "backend": "InMemoryBackend"}
+    assert sink.get(metrics.NEGATIVE_STORES, **labels) == 1
+    assert sink.get(metrics.NEGATIVE_HITS, **labels) == 1
+    assert sink.get(metrics.HITS, **labels) == 1
+    assert sink.get(metrics.MISSES, **labels) == 2
@@ -0,0 +1,115 @@
+from typing import Any, Generator, List
+
+import pytest
+from fastapi import FastAPI
+from starlette.responses import Response
+from starlette.testclient import TestClient
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.coder import JsonCoder, compressed
+from fastapi_cache.middleware import CacheMiddleware
+
+calls: List[str] = []
+app = FastAPI()
+app.add_middleware(
+    CacheMiddleware, expire=60, paths=["/public"], vary=["Accept-Language"]
+)
+
+
+@app.get("/public/items")
+async def items(q: str = "", page: int = 1) -> Any:
+    calls.append("items")
+    return {"q": q, "page": page, "calls": len(calls)}
+
+
+@app.get("/public/large")
+async def large() -> Response:
+    calls.append("large")
+    return Response(b"x" * 4096, media_type="text/plain")
+
+
+@app.get("/public/cookie")
+async def cookie(response: Response) -> int:
+    calls.append("cookie")
+    response.set_cookie("session", "secret")
+    return len(calls)
+
+
+@app.get("/public/gzip")
+async def gzip_varies(response: Response) -> int:
+    calls.append("gzip")
+    response.headers["Vary"] = "Accept-Encoding"
+    return len(calls)
+
+
+@app.get("/private")
+async def private() -> int:
+    calls.append("private")
+    return len(calls)
+
+
+@pytest.fixture(autouse=True)
+def _init_cache() -> Generator[Any, Any, None]:  # pyright: ignore[reportUnusedFunction]
+    FastAPICache.init(InMemoryBackend())
+    calls.clear()
+    yield
+    FastAPICache.reset()
+
+
+def test_caches_responses() -> None:
+    with TestClient(app) as client:
+        response = client.get("/public/items?q=a&page=2")
+        assert response.headers["X-FastAPI-Cache"] == "MISS"
+        assert response.json() == {"q": "a", "page": 2, "calls": 1}
+
+        # the query parameters are normalized
+        response = client.get("/public/items?page=2&q=a")
+        assert response.headers["X-FastAPI-Cache"] == "HIT"
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {"q": "a", "page": 2, "calls": 1}
+        assert calls == ["items"]
+
+        # the vary headers are part of the key
+        response = client.get("/public/items?q=a&page=2", headers={"Accept-Language": "nl"})
+        assert response.headers["X-FastAPI-Cache"] == "MISS"
+        assert len(calls) == 2
+
+
+def test_uncached_requests() -> None:
+    with TestClient(app) as client:
+        for _ in range(2):
+            client.get("/private")
+            client.get("/public/items", headers={"Cache-Control": "no-store"})
+            client.get("/public/items", headers={"Authorization": "Bearer token"})
+            assert client.post("/public/items").headers.get("X-FastAPI-Cache") is None
+            # responses that set cookies or vary on other headers aren't stored
+            client.get("/public/cookie")
+            client.get("/public/gzip")
+        assert sorted(set(calls)) == ["cookie", "gzip", "items", "private"]
+        assert len(calls) == 10
+
+
+def test_max_body_size() -> None:
+    small = FastAPI()
+    small.add_middleware(CacheMiddleware, max_body_size=1024)
+    small.get("/public/large")(large)
+    with TestClient(small) as client:
+        assert client.get("/public/large").text == "x" * 4096
+        assert client.get("/public/large").headers["X-FastAPI-Cache"] == "MISS"
+        assert calls == ["large", "large"]
+
+
+def test_compressed() -> None:
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), coder=compressed(JsonCoder, threshold=100))
+    with TestClient(app) as client:
+        client.get("/public/large")
+        response = client.get("/public/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["X-FastAPI-Cache"] == "HIT"
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.text == "x" * 4096
+        response = client.get("/public/large", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert response.text == "x" * 4096
+        assert calls == ["large"]